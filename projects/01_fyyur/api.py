@@ -0,0 +1,179 @@
+#----------------------------------------------------------------------------#
+# JSON API under /api/v1/.
+#
+# Serves the data of the venue, artist and show pages, built by the same
+# queries. Every response carries an ETag made of the versions of the tables
+# it reads (see TableVersions in cache.py): a request whose If-None-Match
+# still matches is answered 304 before any query runs. ?fields=id,name keeps
+# only the named fields of each item, ?genre=Jazz only the venues or artists
+# listing that genre. /venues/genres and /artists/genres count them by genre.
+#
+#   GET /api/v1/venues/<id>/free_slots?start=2030-05-01T18:00&end=2030-05-02T02:00&duration=90
+#
+# lists the gaps of at least duration minutes (default 120) between the
+# shows of a venue, see scheduling.py.
+#----------------------------------------------------------------------------#
+
+import time
+import hashlib
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import Blueprint, abort, current_app, jsonify, make_response, request
+from models import db, Venue, Artist
+from queries import venue_details, artist_details, venues_page, artists_page, shows_page, genre_facets
+from scheduling import free_slots
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+
+def conditional(*tables, time_dependent=False):
+  """Answers 304 when the tables a view reads are unchanged since the client's ETag.
+
+  Views splitting shows into past and upcoming change as time passes, for them
+  the ETag also changes every API_TIME_BUCKET seconds.
+  """
+  def decorator(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+      # read before the queries run, a write committed meanwhile changes the next ETag
+      versions = current_app.extensions['table_versions']
+      parts = [versions.version(table) for table in tables]
+      if time_dependent:
+        parts.append(str(int(time.time() // current_app.config['API_TIME_BUCKET'])))
+      etag = hashlib.sha1(' '.join(parts).encode()).hexdigest()[:20]
+
+      if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+      else:
+        response = make_response(view(*args, **kwargs))
+        if response.status_code != 200:
+          return response
+      response.set_etag(etag)
+      response.headers['Cache-Control'] = 'no-cache'
+      return response
+    return wrapper
+  return decorator
+
+
+def requested_fields():
+  """Field names of ?fields=, None when all fields are wanted"""
+  fields = request.args.get('fields')
+  if not fields:
+    return None
+  return {field.strip() for field in fields.split(',') if field.strip()}
+
+
+def select_fields(item, fields):
+  if fields is None:
+    return item
+  return {key: value for key, value in item.items() if key in fields}
+
+
+def page_response(items, next_after):
+  fields = requested_fields()
+  return jsonify({
+    'success': True,
+    'data': [select_fields(item, fields) for item in items],
+    'next_after': next_after
+  })
+
+
+def after_argument():
+  return request.args.get('after', type=int)
+
+
+def genre_argument():
+  return request.args.get('genre') or None
+
+
+def facets_response(model):
+  return jsonify({
+    'success': True,
+    'data': [{'genre': genre, 'count': count} for genre, count in genre_facets(model)]
+  })
+
+
+@api.route('/venues')
+@conditional('Venue', 'Show', time_dependent=True)
+def venues():
+  rows, next_after = venues_page(after_argument(), current_app.config['PAGE_SIZE'], genre_argument())
+  return page_response((row._asdict() for row in rows), next_after)
+
+
+@api.route('/venues/genres')
+@conditional('Venue')
+def venue_genres():
+  return facets_response(Venue)
+
+
+@api.route('/venues/<int:venue_id>')
+@conditional('Venue', 'Show', 'Artist', time_dependent=True)
+def venue(venue_id):
+  data = venue_details(venue_id, request.args.get('past_limit', current_app.config['PAST_SHOWS_LIMIT'], type=int))
+  return jsonify({'success': True, 'data': select_fields(data.as_dict(), requested_fields())})
+
+
+@api.route('/venues/<int:venue_id>/free_slots')
+@conditional('Venue', 'Show')
+def venue_free_slots(venue_id):
+  try:
+    start = datetime.fromisoformat(request.args['start'])
+    end = datetime.fromisoformat(request.args['end'])
+    duration = timedelta(minutes=int(request.args.get('duration', 120)))
+  except (KeyError, ValueError):
+    abort(400)
+  if end <= start or duration <= timedelta(0):
+    abort(400)
+  if db.session.query(Venue.id).filter(Venue.id == venue_id).first() is None:
+    abort(404)
+
+  slots = free_slots(db.session, venue_id, start, end, duration)
+  return jsonify({
+    'success': True,
+    'data': [{'start': slot_start.isoformat(), 'end': slot_end.isoformat()} for slot_start, slot_end in slots]
+  })
+
+
+@api.route('/artists')
+@conditional('Artist')
+def artists():
+  rows, next_after = artists_page(after_argument(), current_app.config['PAGE_SIZE'], genre_argument())
+  return page_response((row._asdict() for row in rows), next_after)
+
+
+@api.route('/artists/genres')
+@conditional('Artist')
+def artist_genres():
+  return facets_response(Artist)
+
+
+@api.route('/artists/<int:artist_id>')
+@conditional('Artist', 'Show', 'Venue', time_dependent=True)
+def artist(artist_id):
+  data = artist_details(artist_id, request.args.get('past_limit', current_app.config['PAST_SHOWS_LIMIT'], type=int))
+  return jsonify({'success': True, 'data': select_fields(data.as_dict(), requested_fields())})
+
+
+@api.route('/shows')
+@conditional('Show', 'Venue', 'Artist')
+def shows():
+  shows, next_after = shows_page(after_argument(), current_app.config['PAGE_SIZE'])
+  return page_response((show.as_dict() for show in shows), next_after)
+
+
+@api.errorhandler(400)
+def error_bad_request(error):
+  return jsonify({
+    "success": False,
+    "error": 400,
+    "message": "Bad Request"
+  }), 400
+
+
+@api.errorhandler(404)
+def error_not_found(error):
+  return jsonify({
+    "success": False,
+    "error": 404,
+    "message": "Resource Not Found"
+  }), 404
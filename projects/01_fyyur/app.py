@@ -5,7 +5,8 @@
 import json
 import dateutil.parser
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import babel.dates
+from flask import Flask, render_template, request, Response, flash, get_flashed_messages, redirect, url_for, stream_with_context, jsonify, abort
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
@@ -15,46 +16,144 @@ from flask_wtf import Form
 from forms import *
 from config import *
 from models import *
+from queries import venue_details, artist_details, venues_page, venue_areas, artists_page, shows_page, genre_facets, entity_view
+from viewmodels import VenueView, ArtistView
+from search import search as search_entities
+from cache import PageCache, TableVersions
+from api import api
+from instrumentation import QueryStats
+from concurrent_reads import ConcurrentReads
+from assets import Assets  # also registers flask build-assets
+import bulk  # registers the flask import and export commands
+from summary import ScheduledRefresh  # also registers flask refresh-venue-summary
+from scheduling import check_conflicts, is_conflict_error, ScheduleConflict
+from writequeue import WriteQueue  # also registers flask write-worker
+from sqlalchemy.exc import IntegrityError
 import datetime
+from functools import lru_cache
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+
+@lru_cache(maxsize=64)
+def datetime_pattern(format, locale):
+  """Babel pattern and locale, parsed once per (format, locale)"""
+  return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format)), babel.Locale.parse(locale)
+
+@lru_cache(maxsize=4096)
+def parse_datetime(value):
+  # the controllers format start times with strftime, dateutil is the fallback
+  try:
+    return datetime.datetime.strptime(value, "%m/%d/%Y, %H:%M:%S")
+  except ValueError:
+    return dateutil.parser.parse(value)
+
+@lru_cache(maxsize=4096)
+def format_datetime(value, format='medium', locale=babel.dates.LC_TIME):
+  date = value if isinstance(value, datetime.datetime) else parse_datetime(value)
+  if date.tzinfo is None:
+    # naive times are UTC, as babel.dates.format_datetime assumes
+    date = date.replace(tzinfo=datetime.timezone.utc)
+  if format in ('long', 'short'):
+    return babel.dates.format_datetime(date, format, locale=locale)
+  pattern, locale = datetime_pattern(format, locale)
+  return pattern.apply(date, locale)
 
 app.jinja_env.filters['datetime'] = format_datetime
 
+#----------------------------------------------------------------------------#
+# Helpers.
+#----------------------------------------------------------------------------#
+
+query_stats = QueryStats(app)
+concurrent_reads = ConcurrentReads(app)
+assets = Assets(app)
+page_cache = PageCache(app)
+ScheduledRefresh(app)
+table_versions = TableVersions(app, db)
+write_queue = WriteQueue(app)
+app.register_blueprint(api)
+
+def stream_template(template_name, **context):
+  """Renders a template as a streamed response, sent in chunks as it is generated"""
+  # the session cookie is sent before the body renders: pop the flashed
+  # messages now, get_flashed_messages() in the layout returns them again
+  get_flashed_messages()
+  app.update_template_context(context)
+  stream = app.jinja_env.get_template(template_name).stream(context)
+  stream.enable_buffering(5)
+  return Response(stream_with_context(stream))
+
+def past_shows_limit():
+  """How many past shows a detail page lists, from ?past_limit= or PAST_SHOWS_LIMIT"""
+  return request.args.get('past_limit', app.config['PAST_SHOWS_LIMIT'], type=int)
+
+def ids_argument():
+  """Ids of ?ids=1,2,3, aborts with 400 when missing or malformed"""
+  try:
+    ids = [int(id) for id in request.args.get('ids', '').split(',') if id.strip()]
+  except ValueError:
+    abort(400)
+  if not ids:
+    abort(400)
+  return ids
+
+def delete_entities(model, ids):
+  """Deletes the rows of model with the given ids in one statement and commits.
+  Their shows are deleted by the database, no row is loaded into the session."""
+  deleted = model.query.filter(model.id.in_(ids)).delete(synchronize_session=False)
+  db.session.commit()
+  return deleted
+
+def search_limit():
+  """How many search results to list, from the limit field or SEARCH_LIMIT"""
+  return request.values.get('limit', app.config['SEARCH_LIMIT'], type=int)
+
+def venue_fields(form):
+  return dict(name=form.name.data, city=form.city.data, state=form.state.data, address=form.address.data,
+              phone=form.phone.data, image_link=form.image_link.data, genres=form.genres.data,
+              facebook_link=form.facebook_link.data, seeking_description=form.seeking_description.data,
+              website=form.website.data, seeking_talent=form.seeking_talent.data)
+
+def artist_fields(form):
+  return dict(name=form.name.data, city=form.city.data, state=form.state.data,
+              phone=form.phone.data, genres=form.genres.data, facebook_link=form.facebook_link.data,
+              seeking_description=form.seeking_description.data, image_link=form.image_link.data,
+              seeking_venue=form.seeking_venue.data)
+
+def queue_submission(entity, fields, label):
+  """Queues a validated submission (WRITE_QUEUE) and redirects to its status page"""
+  token = write_queue.enqueue(entity, fields, label)
+  flash(f'{label} was received and will be listed shortly.')
+  return redirect(url_for('submission_status', token=token), code=303)
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
 @app.route('/')
+@page_cache.cached('index')
 def index():
   venues = []
   artists = []
 
   try:
-    recent_venues = Venue.query.order_by(Venue.id.desc()).limit(10).all()
-  
-    for venue in recent_venues:
-      venues.append({
+    # independent, run at once with READ_THREADS
+    venues, artists = concurrent_reads.gather(
+      lambda: page_cache.fragment('recent_venues', 'list', lambda: [{
         "id": venue.id,
         "name": venue.name
-      })
-    
-    recent_artists = Artist.query.order_by(Artist.id.desc()).limit(10).all()
-    for artist in recent_artists:
-      artists.append({
+      } for venue in db.session.query(Venue.id, Venue.name).order_by(Venue.id.desc()).limit(10)]),
+      lambda: page_cache.fragment('recent_artists', 'list', lambda: [{
         "id": artist.id,
         "name": artist.name
-      })
+      } for artist in db.session.query(Artist.id, Artist.name).order_by(Artist.id.desc()).limit(10)]))
   except:
     flash('An error occurred.')
   return render_template('pages/home.html', venues=venues, artists=artists)
@@ -64,32 +163,16 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@page_cache.cached('venues', args={'after': int, 'genre': str})
 def venues():
-  data = []
-  # get all venues
   try:
-    venues = Venue.query.all()
-
-    areas = Venue.query.distinct(Venue.city, Venue.state).all()
-
-    for location in areas:
-      venuesQuery = Venue.query.filter_by(city=location.city).filter_by(state=location.state)
-      #venuesQuery = Venue.query.all()
-
-      venues = []
-      for venue in venuesQuery:
-        venues.append({
-          "id": venue.id,
-          "name": venue.name
-        })
-
-      data.append({
-        "city": location.city,
-        "state": location.state,
-        "venues": venues
-      })
-
-    return render_template('pages/venues.html', areas=data);
+    # one page of venues ordered by area, grouped in a single pass
+    genre = request.args.get('genre') or None
+    rows, next_after = venues_page(request.args.get('after', type=int), app.config['PAGE_SIZE'], genre)
+    # grouped before streaming, errors past this point would cut the page short
+    data = list(venue_areas(rows))
+    return stream_template('pages/venues.html', areas=data, next_after=next_after,
+                           genre=genre, facets=genre_facets(Venue))
   except:
     flash('An error occurred. Cannot display venues')
     return redirect(url_for('index'))
@@ -102,7 +185,8 @@ def search_venues():
   try:
     search_term = request.form.get('search_term', '')
 
-    search = Venue.query.filter(Venue.name.ilike(f'%{search_term}%')).filter(Venue.city.ilike(f'%{city}%')).filter(Venue.state.ilike(f'%{state}%')).all()
+    # city and state narrow the search, they are part of the indexed text
+    search = search_entities(db, Venue, ' '.join((search_term, city, state)), limit=search_limit())
 
     for venue in search:
       data.append({
@@ -122,42 +206,7 @@ def search_venues():
 @app.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
-  venue = Venue.query.filter_by(id=venue_id).all()[0]
-
-  data={
-    "id": venue.id,
-    "name": venue.name,
-    "genres": venue.genres,
-    "address": venue.address,
-    "city": venue.city,
-    "state": venue.state,
-    "phone": venue.phone,
-    "website": venue.website,
-    "facebook_link": venue.facebook_link,
-    "seeking_talent": venue.seeking_talent,
-    "seeking_description": venue.seeking_description,
-    "image_link": venue.image_link,
-    "past_shows": [],
-    "upcoming_shows": []
-  }
-
-  shows = db.session.query(Show, Artist).filter_by(venue_id=venue_id).join(Artist).all()
-
-  for (show, artist) in shows:
-    if(show.start_time<datetime.datetime.now()):
-      add_to="past_shows"
-    else:
-      add_to="upcoming_shows"
-    data[add_to].append({
-      "artist_id": artist.id,
-      "artist_name": artist.name,
-      "artist_image_link": artist.image_link,
-      "start_time": show.start_time.strftime("%m/%d/%Y, %H:%M:%S")
-    })
-
-  data["past_shows_count"]=len(data["past_shows"])
-  data["upcoming_shows_count"]=len(data["upcoming_shows"])
-
+  data = venue_details(venue_id, past_limit=past_shows_limit())
   return render_template('pages/show_venue.html', venue=data)
 
 #  Create Venue
@@ -174,14 +223,14 @@ def create_venue_submission():
     # get form data and create 
     form = VenueForm()
     if request.method == 'POST' and form.validate():
-      venue = Venue(name=form.name.data, city=form.city.data, state=form.state.data, address=form.address.data,
-                    phone=form.phone.data, image_link=form.image_link.data,genres=form.genres.data, 
-                    facebook_link=form.facebook_link.data, seeking_description=form.seeking_description.data,
-                    website=form.website.data, seeking_talent=form.seeking_talent.data)
+      if write_queue.enabled:
+        return queue_submission('venues', venue_fields(form), 'Venue ' + request.form['name'])
+      venue = Venue(**venue_fields(form))
     
       # commit session to database
       db.session.add(venue)
       db.session.commit()
+      page_cache.invalidate('index', 'recent_venues', 'venues', 'venue_choices')
 
       # flash success
       flash('Venue ' + request.form['name'] + ' was successfully listed!')
@@ -201,9 +250,9 @@ def create_venue_submission():
 @app.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
   try:
-    Show.query.filter_by(venue_id=venue_id).delete()
-    Venue.query.filter_by(id=venue_id).delete()
-    db.session.commit()
+    # the database deletes the shows of the venue (ON DELETE CASCADE)
+    delete_entities(Venue, [venue_id])
+    page_cache.invalidate('index', 'recent_venues', 'venues', 'venue_choices', 'shows')
     flash('Successfully deleted the venue')
   except:
     flash('An error occurred when trying to delete the venue')
@@ -213,18 +262,31 @@ def delete_venue(venue_id):
 
   return redirect(url_for('index'))
 
+@app.route('/venues', methods=['DELETE'])
+def delete_venues():
+  # deletes every venue of ?ids=1,2,3 in one statement
+  ids = ids_argument()
+  try:
+    deleted = delete_entities(Venue, ids)
+    page_cache.invalidate('index', 'recent_venues', 'venues', 'venue_choices', 'shows')
+  except:
+    db.session.rollback()
+    abort(422)
+  finally:
+    db.session.close()
+
+  return jsonify({'success': True, 'deleted': deleted})
+
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@page_cache.cached('artists', args={'after': int, 'genre': str})
 def artists():
-  data=[]
-  artists = Artist.query.order_by(Artist.name.asc()).all()
-  for artist in artists:
-    data.append({
-      "id": artist.id,
-      "name": artist.name
-    })
-  return render_template('pages/artists.html', artists=data)
+  genre = request.args.get('genre') or None
+  rows, next_after = artists_page(request.args.get('after', type=int), app.config['PAGE_SIZE'], genre)
+  data = ({"id": artist.id, "name": artist.name} for artist in rows)
+  return stream_template('pages/artists.html', artists=data, next_after=next_after,
+                         genre=genre, facets=genre_facets(Artist))
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
@@ -232,7 +294,7 @@ def search_artists():
   try:
     search_term = request.form.get('search_term', '')
 
-    search = Artist.query.filter(Artist.name.ilike(f'%{search_term}%')).all()
+    search = search_entities(db, Artist, search_term, limit=search_limit())
 
     for artist in search:
       data.append({
@@ -252,48 +314,15 @@ def search_artists():
 
 @app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
-  artist = Artist.query.filter_by(id=artist_id).all()[0]
-  data={
-    "id": artist.id,
-    "name": artist.name,
-    "genres": artist.genres,
-    "city": artist.city,
-    "state": artist.state,
-    "phone": artist.phone,
-    "website": artist.website,
-    "facebook_link": artist.facebook_link,
-    "seeking_venue": artist.seeking_venue,
-    "seeking_description": artist.seeking_description,
-    "image_link": artist.image_link,
-    "past_shows": [],
-    "upcoming_shows": []
-  }
-
-  shows = db.session.query(Show, Venue).filter_by(artist_id=artist_id).join(Venue).all()
-
-  for (show, venue) in shows:
-    if(show.start_time<datetime.datetime.now()):
-      add_to="past_shows"
-    else:
-      add_to="upcoming_shows"
-    data[add_to].append({
-      "venue_id": venue.id,
-      "venue_name": venue.name,
-      "venue_image_link": venue.image_link,
-      "start_time": show.start_time.strftime("%m/%d/%Y, %H:%M:%S")
-    })
-
-  data["past_shows_count"]=len(data["past_shows"])
-  data["upcoming_shows_count"]=len(data["upcoming_shows"])
-
+  data = artist_details(artist_id, past_limit=past_shows_limit())
   return render_template('pages/show_artist.html', artist=data)
 
 @app.route('/artists/<artist_id>', methods=['DELETE'])
 def delete_artist(artist_id):
   try:
-    Show.query.filter_by(artist_id=artist_id).delete()
-    Artist.query.filter_by(id=artist_id).delete()
-    db.session.commit()
+    # the database deletes the shows of the artist (ON DELETE CASCADE)
+    delete_entities(Artist, [artist_id])
+    page_cache.invalidate('index', 'recent_artists', 'artists', 'artist_choices', 'shows', 'venues')
     flash('Successfully deleted the artist')
   except:
     flash('An error occurred when trying to delete the artist')
@@ -303,30 +332,33 @@ def delete_artist(artist_id):
 
   return redirect(url_for('index'))
 
+@app.route('/artists', methods=['DELETE'])
+def delete_artists():
+  # deletes every artist of ?ids=1,2,3 in one statement
+  ids = ids_argument()
+  try:
+    deleted = delete_entities(Artist, ids)
+    page_cache.invalidate('index', 'recent_artists', 'artists', 'artist_choices', 'shows', 'venues')
+  except:
+    db.session.rollback()
+    abort(422)
+  finally:
+    db.session.close()
+
+  return jsonify({'success': True, 'deleted': deleted})
+
 #  Update
 #  ----------------------------------------------------------------
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
   form = ArtistForm()
-  artist = Artist.query.filter_by(id=artist_id).all()[0]
-  data={
-    "id": artist.id,
-    "name": artist.name,
-    "genres": artist.genres,
-    "city": artist.city,
-    "state": artist.state,
-    "phone": artist.phone,
-    "website": artist.website,
-    "facebook_link": artist.facebook_link,
-    "seeking_venue": artist.seeking_venue,
-    "seeking_description": artist.seeking_description,
-    "image_link": artist.image_link,}
+  artist = entity_view(ArtistView, Artist, artist_id)
   # populate form with fields from artist with ID <artist_id>
-  form.state.default=data["state"]
-  form.genres.default=data["genres"]
-  form.seeking_venue.default=data["seeking_venue"]
+  form.state.default=artist.state
+  form.genres.default=artist.genres
+  form.seeking_venue.default=artist.seeking_venue
   form.process()
-  return render_template('forms/edit_artist.html', form=form, artist=data)
+  return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 @app.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
@@ -348,6 +380,7 @@ def edit_artist_submission(artist_id):
       # commit session to database
       db.session.add(artist)
       db.session.commit()
+      page_cache.invalidate('index', 'recent_artists', 'artists', 'artist_choices', 'shows')
 
       # on successful db insert, flash success
       flash('Artist ' + request.form['name'] + ' was successfully updated!')
@@ -370,26 +403,12 @@ def edit_artist_submission(artist_id):
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
   form = VenueForm()
-  venue = Venue.query.filter_by(id=venue_id).all()[0]
-  data={
-    "id": venue.id,
-    "name": venue.name,
-    "genres": venue.genres,
-    "address": venue.address,
-    "city": venue.city,
-    "state": venue.state,
-    "phone": venue.phone,
-    "website": venue.website,
-    "facebook_link": venue.facebook_link,
-    "seeking_talent": venue.seeking_talent,
-    "seeking_description": venue.seeking_description,
-    "image_link": venue.image_link
-  }
-  form.state.default=data["state"]
-  form.genres.default=data["genres"]
-  form.seeking_talent.default=data["seeking_talent"]
+  venue = entity_view(VenueView, Venue, venue_id)
+  form.state.default=venue.state
+  form.genres.default=venue.genres
+  form.seeking_talent.default=venue.seeking_talent
   form.process()
-  return render_template('forms/edit_venue.html', form=form, venue=data)
+  return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 @app.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
@@ -413,6 +432,7 @@ def edit_venue_submission(venue_id):
       # commit session to database
       db.session.add(venue)
       db.session.commit()
+      page_cache.invalidate('index', 'recent_venues', 'venues', 'venue_choices', 'shows')
       # called upon submitting the new venue listing form
 
       # on successful db insert, flash success
@@ -444,14 +464,15 @@ def create_artist_submission():
   try:
     form = ArtistForm()
     if request.method == 'POST' and form.validate():
+      if write_queue.enabled:
+        return queue_submission('artists', artist_fields(form), 'Artist ' + request.form['name'])
 
-      artist = Artist(name=form.name.data, city=form.city.data, state=form.state.data,
-      phone=form.phone.data, genres=form.genres.data, facebook_link=form.facebook_link.data,
-      seeking_description=form.seeking_description.data, image_link=form.image_link.data, seeking_venue=form.seeking_venue.data)
+      artist = Artist(**artist_fields(form))
       
       # commit session to database
       db.session.add(artist)
       db.session.commit()
+      page_cache.invalidate('index', 'recent_artists', 'artists', 'artist_choices')
       # called upon submitting the new artist listing form
 
       # on successful db insert, flash success
@@ -473,67 +494,113 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@page_cache.cached('shows', args={'after': int})
 def shows():
-  # displays list of shows at /shows
-  data=[]
-
-  shows = db.session.query(Show, Venue, Artist).join(Venue).join(Artist).all()
-
-  for (show, venue, artist) in shows:
-    data.append({
-      "venue_id": venue.id,
-      "venue_name": venue.name,
-      "artist_id": artist.id,
-      "artist_name": artist.name,
-      "artist_image_link": artist.image_link,
-      "start_time": show.start_time.strftime("%m/%d/%Y, %H:%M:%S")
-    })
-  return render_template('pages/shows.html', shows=data)
+  # displays list of shows at /shows, one page at a time in start time order
+  data, next_after = shows_page(request.args.get('after', type=int), app.config['PAGE_SIZE'])
+  return stream_template('pages/shows.html', shows=data, next_after=next_after)
+
+def choice_list(namespace, key, query):
+  """(id, name) choices of query, cached until the next write to namespace.
+  Returns None when there are more than SHOW_FORM_MAX_CHOICES, the form then uses the typeahead."""
+  limit = app.config['SHOW_FORM_MAX_CHOICES']
+  choices = page_cache.fragment(namespace, key, lambda: [(row.id, row.name) for row in query.limit(limit + 1)])
+  return choices if len(choices) <= limit else None
+
+def venue_choices():
+  return choice_list('venue_choices', 'seeking',
+    db.session.query(Venue.id, Venue.name).filter_by(seeking_talent=True).order_by(Venue.name))
+
+def artist_choices(seeking=True):
+  query = db.session.query(Artist.id, Artist.name).order_by(Artist.name)
+  if seeking:
+    query = query.filter_by(seeking_venue=True)
+  return choice_list('artist_choices', 'seeking' if seeking else 'all', query)
+
+def render_show_form(form, venues, artists):
+  typeahead = {}
+  for field, choices in ((form.venue_id, venues), (form.artist_id, artists)):
+    if choices is None:
+      typeahead[field.name] = True
+    else:
+      field.choices.extend(choices)
+  return render_template('forms/new_show.html', form=form, typeahead=typeahead)
 
 @app.route('/shows/create')
 def create_shows():
   # Renders form
   form = ShowForm()
-  venues = Venue.query.filter_by(seeking_talent=True).all()
-  for venue in venues: form.venue_id.choices.append((venue.id, venue.name))
-  artists = Artist.query.filter_by(seeking_venue=True).all()
-  for artist in artists: form.artist_id.choices.append((artist.id, artist.name))
-  return render_template('forms/new_show.html', form=form)
+  return render_show_form(form, venue_choices(), artist_choices())
 
 @app.route('/shows/create/at_venue/<int:venue_id>')
 def create_shows_at_venue(venue_id):
   # Renders form
   form = ShowForm()
-  venue = Venue.query.filter_by(id=venue_id).all()[0]
-  form.venue_id.choices.append((venue.id, venue.name))
-  artists = Artist.query.all()
-  for artist in artists: form.artist_id.choices.append((artist.id, artist.name))
-  return render_template('forms/new_show.html', form=form)
+  venue = db.session.query(Venue.id, Venue.name).filter_by(id=venue_id).first_or_404()
+  return render_show_form(form, [(venue.id, venue.name)], artist_choices(seeking=False))
 
 @app.route('/shows/create/with_artist/<int:artist_id>')
 def create_shows_with_artist(artist_id):
   # Renders form
   form = ShowForm()
-  artist = Artist.query.filter_by(id=artist_id).all()[0]
-  form.artist_id.choices.append((artist.id, artist.name))
-  venues = Venue.query.filter_by(seeking_talent=True).all()
-  for venue in venues: form.venue_id.choices.append((venue.id, venue.name))
-  return render_template('forms/new_show.html', form=form)
+  artist = db.session.query(Artist.id, Artist.name).filter_by(id=artist_id).first_or_404()
+  return render_show_form(form, venue_choices(), [(artist.id, artist.name)])
+
+def typeahead(model, seeking_column):
+  """JSON list of the (id, name) of model whose name contains ?q=, for the show form"""
+  term = request.args.get('q', '').strip()
+  if not term:
+    return jsonify({'success': True, 'data': []})
+  term = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+  query = db.session.query(model.id, model.name).filter(model.name.ilike(f'%{term}%', escape='\\'))
+  if request.args.get('seeking', type=int):
+    query = query.filter(seeking_column == True)
+  rows = query.order_by(model.name, model.id).limit(app.config['TYPEAHEAD_LIMIT'])
+  return jsonify({'success': True, 'data': [{'id': row.id, 'name': row.name} for row in rows]})
+
+@app.route('/venues/typeahead')
+def typeahead_venues():
+  return typeahead(Venue, Venue.seeking_talent)
+
+@app.route('/artists/typeahead')
+def typeahead_artists():
+  return typeahead(Artist, Artist.seeking_venue)
 
 @app.route('/shows/create', methods=['POST'])
 def create_show_submission():
   try:
     form = ShowForm()
-
-    show = Show(artist_id=form.artist_id.data, venue_id=form.venue_id.data, start_time=form.start_time.data)
+    if not form.end_time.validate(form, [ShowForm.validate_end_time]):
+      flash(f'Show could not be listed. {form.end_time.errors[0]}')
+      return render_template('pages/home.html')
+
+    venue_id = int(form.venue_id.data)
+    artist_id = int(form.artist_id.data)
+    if write_queue.enabled:
+      # the worker checks the bookings as it applies the show
+      return queue_submission('shows', dict(artist_id=artist_id, venue_id=venue_id, start_time=form.start_time.data,
+                                            end_time=form.end_time.data), 'Show')
+    # the exclusion constraints of Show reject a booking racing this check
+    check_conflicts(db.session, venue_id, artist_id, form.start_time.data, form.end_time.data)
+    show = Show(artist_id=artist_id, venue_id=venue_id, start_time=form.start_time.data, end_time=form.end_time.data)
     
     # commit session to database
     db.session.add(show)
     db.session.commit()
+    page_cache.invalidate('shows', 'venues')
 
     # on successful db insert, flash success
     flash('Show was successfully listed!')
 
+  except ScheduleConflict as conflict:
+    db.session.rollback()
+    flash(f'Show could not be listed, {conflict}.')
+  except IntegrityError as error:
+    db.session.rollback()
+    if is_conflict_error(error):
+      flash('Show could not be listed, the venue or the artist is already booked at that time.')
+    else:
+      flash('An error occurred. Show could not be listed.')
   except:
     # catches errors
     db.session.rollback()
@@ -543,6 +610,23 @@ def create_show_submission():
     db.session.close()
   return render_template('pages/home.html')
 
+#  Queued submissions
+#  ----------------------------------------------------------------
+
+@app.route('/submissions/<token>')
+def submission_status(token):
+  submission = write_queue.status(token)
+  if submission is None:
+    abort(404)
+  link = None
+  if submission.status == 'applied' and submission.entity == 'venues':
+    link = url_for('show_venue', venue_id=submission.record_id)
+  elif submission.status == 'applied' and submission.entity == 'artists':
+    link = url_for('show_artist', artist_id=submission.record_id)
+  elif submission.status == 'applied':
+    link = url_for('shows')
+  return render_template('pages/submission.html', submission=submission, link=link)
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
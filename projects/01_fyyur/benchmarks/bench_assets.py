@@ -0,0 +1,84 @@
+"""Requests and bytes of the static assets per page load.
+
+Renders the pages and requests the stylesheets, scripts and images they
+load (leaving out IE-only conditional comments and the jQuery fallback),
+first serving the sources, then the bundles of `flask build-assets` (see
+assets.py). For both it reports the requests per page load, the bytes sent
+to a browser accepting br and gzip, and how many of the responses are
+cacheable for good (immutable). The sources are served uncompressed by
+Flask; the gzip column shows what a proxy compressing them on the fly
+would send.
+
+  python benchmarks/bench_assets.py
+"""
+
+import re
+import gzip
+from common import argument_parser, setup_app
+
+PAGES = ['/', '/venues', '/artists']
+COMMENT = re.compile(r'<!--.*?-->', re.S)
+INLINE_SCRIPT = re.compile(r'<script>.*?</script>', re.S)
+ASSET = re.compile(r'<(?:link[^>]*rel="stylesheet"[^>]*href|script[^>]*src|img[^>]*src)="(/static/[^"]+)"')
+
+
+def page_assets(client, path):
+  html = client.get(path).get_data(as_text=True)
+  html = INLINE_SCRIPT.sub('', COMMENT.sub('', html))
+  return ASSET.findall(html)
+
+
+def measure(client, path):
+  """(requests, bytes sent, bytes if gzipped on the fly, immutable responses) of the assets of path"""
+  requests = sent = gzipped = immutable = 0
+  for url in page_assets(client, path):
+    response = client.get(url, headers={'Accept-Encoding': 'br, gzip'})
+    assert response.status_code == 200, (url, response.status_code)
+    body = response.get_data()
+    requests += 1
+    sent += len(body)
+    if response.headers.get('Content-Encoding') or not url.endswith(('.css', '.js')):
+      gzipped += len(body)
+    else:
+      gzipped += len(gzip.compress(body))
+    immutable += response.cache_control.immutable
+  return requests, sent, gzipped, immutable
+
+
+def main():
+  parser = argument_parser(__doc__)
+  args = parser.parse_args()
+
+  app, db = setup_app(args.database)
+  from assets import build
+  assets = app.extensions['assets']
+  page_cache = app.extensions['page_cache']
+  client = app.test_client()
+  try:
+    results = {}
+    app.config['ASSETS_ENABLED'] = False
+    assets.load()
+    for path in PAGES:
+      results['sources', path] = measure(client, path)
+
+    build(app.static_folder)
+    app.config['ASSETS_ENABLED'] = True
+    assets.load()
+    # the pages cached above link the sources
+    page_cache.invalidate(*page_cache.namespaces)
+    for path in PAGES:
+      results['bundles', path] = measure(client, path)
+  finally:
+    db.session.remove()
+    if not args.keep:
+      db.drop_all()
+
+  print(f'{"page":<10} {"assets":>8} {"requests":>9} {"KiB sent":>9} {"KiB gzip":>9} {"immutable":>10}')
+  for path in PAGES:
+    for mode in ('sources', 'bundles'):
+      requests, sent, gzipped, immutable = results[mode, path]
+      print(f'{path:<10} {mode:>8} {requests:>9} {sent / 1024:>9.1f} {gzipped / 1024:>9.1f} {immutable:>10}')
+
+
+if __name__ == '__main__':
+  main()
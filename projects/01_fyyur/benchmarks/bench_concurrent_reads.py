@@ -0,0 +1,81 @@
+"""Throughput of the pages with and without concurrent reads.
+
+Seeds the benchmark database, then serves the app with gunicorn twice: once
+running the independent queries of a page one after the other
+(READ_THREADS=0), once running them at once (READ_THREADS=--read-threads,
+see concurrent_reads.py). Both servers are driven with 1, 2, 4 ... up to
+--max-concurrency clients requesting the home page and venue and artist
+pages, reporting requests/s and p50/p95 latency side by side.
+
+  pip install gunicorn
+  python benchmarks/bench_concurrent_reads.py --workers 2 --threads 16 --pool-size 10 --max-overflow 10
+
+Concurrent reads cut the latency of pages waiting on several queries while
+connections are free; once the clients outnumber the connections every
+request competes for more of them and the gain turns into queueing.
+"""
+
+from common import argument_parser, setup_app, seed_venues, seed_artists, seed_shows
+from load_test import percentile, start_server, run_clients
+
+
+def main():
+  parser = argument_parser(__doc__)
+  parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+  parser.add_argument('--threads', type=int, default=16, help='threads per worker')
+  parser.add_argument('--read-threads', type=int, default=8, help='READ_THREADS of the concurrent server')
+  parser.add_argument('--pool-size', type=int, default=10, help='DB_POOL_SIZE of every worker')
+  parser.add_argument('--max-overflow', type=int, default=10, help='DB_MAX_OVERFLOW of every worker')
+  parser.add_argument('--pool-timeout', type=int, default=10, help='DB_POOL_TIMEOUT in seconds')
+  parser.add_argument('--max-concurrency', type=int, default=128, help='most concurrent clients')
+  parser.add_argument('--duration', type=float, default=5, help='seconds per concurrency level')
+  parser.add_argument('--port', type=int, default=8765)
+  parser.add_argument('--venues', type=int, default=2000)
+  parser.add_argument('--artists', type=int, default=2000)
+  parser.add_argument('--shows', type=int, default=20000)
+  args = parser.parse_args()
+
+  app, db = setup_app(args.database)
+  from models import Venue, Artist, Show
+  seed_venues(db, Venue, args.venues, max(1, args.venues // 10))
+  seed_artists(db, Artist, args.artists)
+  venue_ids = [id for (id,) in db.session.query(Venue.id)]
+  artist_ids = [id for (id,) in db.session.query(Artist.id)]
+  seed_shows(db, Show, args.shows, artist_ids, venue_ids)
+  db.session.remove()
+  paths = ['/'] + [f'/venues/{id}' for id in venue_ids[:10]] + [f'/artists/{id}' for id in artist_ids[:10]]
+
+  results = {}
+  try:
+    for mode, read_threads in (('sync', 0), ('concurrent', args.read_threads)):
+      server = start_server(args, READ_THREADS=str(read_threads))
+      try:
+        concurrency = 1
+        while concurrency <= args.max_concurrency:
+          results[mode, concurrency] = run_clients(f'http://127.0.0.1:{args.port}', concurrency,
+                                                   args.duration, paths)
+          concurrency *= 2
+      finally:
+        server.terminate()
+        server.wait()
+  finally:
+    db.session.remove()
+    if not args.keep:
+      db.drop_all()
+
+  print(f'{args.workers} workers x {args.threads} threads, concurrent server with {args.read_threads} read threads')
+  print(f'{"clients":>8} {"mode":>11} {"req/s":>9} {"p50 ms":>9} {"p95 ms":>9} {"errors":>7}')
+  concurrency = 1
+  while concurrency <= args.max_concurrency:
+    for mode in ('sync', 'concurrent'):
+      timings, errors = results[mode, concurrency]
+      if timings:
+        print(f'{concurrency:>8} {mode:>11} {len(timings) / args.duration:>9.1f} '
+              f'{percentile(timings, 50) * 1000:>9.1f} {percentile(timings, 95) * 1000:>9.1f} {len(errors):>7}')
+      else:
+        print(f'{concurrency:>8} {mode:>11} {"-":>9} {"-":>9} {"-":>9} {len(errors):>7}')
+    concurrency *= 2
+
+
+if __name__ == '__main__':
+  main()
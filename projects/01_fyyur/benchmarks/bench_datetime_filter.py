@@ -0,0 +1,56 @@
+"""Micro-benchmark for the datetime Jinja filter.
+
+Times the filter as it was (dateutil parse and babel format_datetime on
+every call) against format_datetime in app.py, on the strftime strings the
+controllers produce and on datetime objects, with all values distinct
+(cold LRU) and with the repetition of a listing page (warm LRU).
+"""
+
+import argparse
+import timeit
+import datetime
+import dateutil.parser
+import babel.dates
+
+import common  # noqa: F401, puts the project folder on sys.path
+from app import format_datetime, parse_datetime
+
+
+def format_datetime_uncached(value, format='medium'):
+  date = dateutil.parser.parse(value)
+  if format == 'full':
+    format = "EEEE MMMM, d, y 'at' h:mma"
+  elif format == 'medium':
+    format = "EE MM, dd, y h:mma"
+  return babel.dates.format_datetime(date, format)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--values', type=int, default=10000, help='distinct start times')
+  args = parser.parse_args()
+
+  start = datetime.datetime(2020, 1, 1, 20, 0)
+  times = [start + datetime.timedelta(hours=i) for i in range(args.values)]
+  strings = [time.strftime("%m/%d/%Y, %H:%M:%S") for time in times]
+  page = strings[:50]
+
+  cases = [
+    ('uncached, strings', lambda: [format_datetime_uncached(value, 'full') for value in strings]),
+    ('cold cache, strings', lambda: [format_datetime(value, 'full') for value in strings]),
+    ('cold cache, datetimes', lambda: [format_datetime(value, 'full') for value in times]),
+    ('uncached, 50 row page', lambda: [format_datetime_uncached(value, 'full') for value in page]),
+    ('warm cache, 50 row page', lambda: [format_datetime(value, 'full') for value in page]),
+  ]
+  for label, run in cases:
+    format_datetime.cache_clear()
+    parse_datetime.cache_clear()
+    if label.startswith('warm'):
+      run()
+    seconds = timeit.timeit(run, number=1)
+    values = len(page) if 'page' in label else args.values
+    print(f'{label:<26} {seconds / values * 1e6:>8.2f} us/value')
+
+
+if __name__ == '__main__':
+  main()
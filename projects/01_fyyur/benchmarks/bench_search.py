@@ -0,0 +1,75 @@
+"""Benchmark for the venue and artist search.
+
+Seeds --rows venues and artists with names, cities and genres drawn from
+small vocabularies and reports p50/p95 latency of /venues/search and
+/artists/search over random one and two word queries.
+"""
+
+import random
+from common import argument_parser, setup_app, timer
+
+WORDS = ['blue', 'note', 'hall', 'house', 'club', 'lounge', 'park', 'musical', 'hop', 'garden',
+         'jazz', 'rock', 'soul', 'room', 'stage', 'bar', 'cellar', 'theatre', 'arena', 'corner']
+CITIES = [('San Francisco', 'CA'), ('New York', 'NY'), ('Austin', 'TX'), ('Seattle', 'WA'),
+          ('Chicago', 'IL'), ('Nashville', 'TN'), ('Portland', 'OR'), ('Denver', 'CO')]
+GENRES = ['Jazz', 'Blues', 'Rock n Roll', 'Folk', 'Hip-Hop', 'Soul', 'Classical', 'Pop']
+
+
+def entity_rows(rng, n, **extra):
+  for i in range(n):
+    city, state = rng.choice(CITIES)
+    row = {
+      'name': ' '.join(rng.sample(WORDS, 3)).title() + f' {i}',
+      'city': city,
+      'state': state,
+      'genres': rng.sample(GENRES, 2),
+      'phone': '123-123-1234',
+    }
+    row.update(extra)
+    yield row
+
+
+def seed(db, model, rows, chunk=5000):
+  rows = list(rows)
+  for start in range(0, len(rows), chunk):
+    db.session.bulk_insert_mappings(model, rows[start:start + chunk])
+    db.session.commit()
+
+
+def percentile(timings, p):
+  timings = sorted(timings)
+  return timings[min(len(timings) - 1, int(len(timings) * p / 100))]
+
+
+def main():
+  parser = argument_parser(__doc__)
+  parser.add_argument('--rows', type=int, default=100000, help='venues and artists to seed')
+  parser.add_argument('--queries', type=int, default=200, help='searches to time per page')
+  args = parser.parse_args()
+
+  app, db = setup_app(args.database)
+  from models import Venue, Artist
+  rng = random.Random(0)
+  try:
+    seed(db, Venue, entity_rows(rng, args.rows, address='1 Main Street'))
+    seed(db, Artist, entity_rows(rng, args.rows))
+    client = app.test_client()
+
+    for path in ('/venues/search', '/artists/search'):
+      client.post(path, data={'search_term': 'warm up'})
+      timings = {}
+      for _ in range(args.queries):
+        term = ' '.join(rng.sample(WORDS + [city.lower() for city, state in CITIES], rng.randint(1, 2)))
+        with timer(timings, path):
+          response = client.post(path, data={'search_term': term[:rng.randint(3, len(term))]})
+        assert response.status_code == 200, response.status_code
+      print(f'{path:<20} rows: {args.rows:>8}   p50: {percentile(timings[path], 50) * 1000:>8.2f} ms   '
+            f'p95: {percentile(timings[path], 95) * 1000:>8.2f} ms   ({db.engine.dialect.name})')
+  finally:
+    db.session.remove()
+    if not args.keep:
+      db.drop_all()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,29 @@
+"""Benchmark for the /venues page.
+
+Seeds N venues across M cities and reports how many queries the page runs
+and how long it takes to render.
+"""
+
+from common import argument_parser, setup_app, seed_venues, time_page, report
+
+
+def main():
+  parser = argument_parser(__doc__)
+  parser.add_argument('--venues', type=int, default=5000, help='number of venues (N)')
+  parser.add_argument('--cities', type=int, default=1000, help='number of cities (M)')
+  args = parser.parse_args()
+
+  app, db = setup_app(args.database)
+  from models import Venue
+  try:
+    seed_venues(db, Venue, args.venues, args.cities)
+    queries, timings = time_page(app, db, '/venues', args.repeat)
+    report(f'/venues N={args.venues} M={args.cities}', queries, timings)
+  finally:
+    db.session.remove()
+    if not args.keep:
+      db.drop_all()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,132 @@
+"""Memory and time per row of the /shows listing.
+
+Seeds --shows shows, then builds the rows of one --rows long page of the
+listing three ways:
+
+  orm + dict   Show objects with their venue and artist joined eagerly into
+               the identity map, copied into a dict each (how the listing
+               was first written)
+  rows + dict  column-only rows copied into a dict each
+  rows + view  column-only rows built into ShowView objects (viewmodels.py),
+               what shows_page() returns
+
+and reports, per row, the peak bytes allocated while building the page
+(result rows and ORM objects included), the bytes kept alive for the
+template to render, both measured with tracemalloc, and the time to build a
+row, the best of --repeat runs. Finally it times the whole /shows page with
+--rows shows per page.
+
+  python benchmarks/bench_view_models.py --shows 20000 --rows 5000
+"""
+
+import time
+import tracemalloc
+from sqlalchemy.orm import joinedload
+from common import argument_parser, setup_app, seed_venues, seed_artists, seed_shows, time_page, report
+
+FORMAT = "%m/%d/%Y, %H:%M:%S"
+
+
+def orm_dicts(db, Show, Venue, Artist, rows):
+  shows = db.session.query(Show).options(joinedload(Show.venue), joinedload(Show.artist)) \
+    .order_by(Show.start_time, Show.id).limit(rows).all()
+  return [{
+    "venue_id": show.venue.id,
+    "venue_name": show.venue.name,
+    "artist_id": show.artist.id,
+    "artist_name": show.artist.name,
+    "artist_image_link": show.artist.image_link,
+    "start_time": show.start_time.strftime(FORMAT)
+  } for show in shows]
+
+
+def column_rows(db, Show, Venue, Artist, rows):
+  return db.session.query(Venue.id.label('venue_id'), Venue.name.label('venue_name'),
+                          Artist.id.label('artist_id'), Artist.name.label('artist_name'),
+                          Artist.image_link.label('artist_image_link'), Show.start_time) \
+    .select_from(Show).join(Venue).join(Artist).order_by(Show.start_time, Show.id).limit(rows)
+
+
+def row_dicts(db, Show, Venue, Artist, rows):
+  return [{
+    "venue_id": row.venue_id,
+    "venue_name": row.venue_name,
+    "artist_id": row.artist_id,
+    "artist_name": row.artist_name,
+    "artist_image_link": row.artist_image_link,
+    "start_time": row.start_time.strftime(FORMAT)
+  } for row in column_rows(db, Show, Venue, Artist, rows)]
+
+
+def row_views(db, Show, Venue, Artist, rows):
+  from viewmodels import ShowView
+  return [ShowView(row.venue_id, row.venue_name, row.artist_id, row.artist_name, row.artist_image_link,
+                   row.start_time.strftime(FORMAT))
+          for row in column_rows(db, Show, Venue, Artist, rows)]
+
+
+VARIANTS = [('orm + dict', orm_dicts), ('rows + dict', row_dicts), ('rows + view', row_views)]
+
+
+def bytes_per_row(db, build, models, rows):
+  """(peak, kept) bytes per row, allocated while building the page rows and still alive after"""
+  db.session.remove()
+  tracemalloc.start()
+  before = tracemalloc.get_traced_memory()[0]
+  page = build(db, *models, rows)
+  current, peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  count = len(page)
+  del page
+  db.session.remove()
+  return (peak - before) / count, (current - before) / count
+
+
+def seconds_per_row(db, build, models, rows, repeat):
+  best = float('inf')
+  for _ in range(repeat):
+    db.session.remove()
+    start = time.perf_counter()
+    page = build(db, *models, rows)
+    best = min(best, (time.perf_counter() - start) / len(page))
+  db.session.remove()
+  return best
+
+
+def main():
+  parser = argument_parser(__doc__)
+  parser.add_argument('--shows', type=int, default=20000)
+  parser.add_argument('--rows', type=int, default=5000, help='shows per page')
+  args = parser.parse_args()
+
+  app, db = setup_app(args.database)
+  from models import Venue, Artist, Show
+  seed_venues(db, Venue, 500, 50)
+  seed_artists(db, Artist, 500)
+  seed_shows(db, Show, args.shows, [id for (id,) in db.session.query(Artist.id)],
+             [id for (id,) in db.session.query(Venue.id)])
+  models = (Show, Venue, Artist)
+
+  try:
+    with app.app_context():
+      print(f'{"rows of":<12} {"peak B/row":>11} {"kept B/row":>11} {"us/row":>8}')
+      for name, build in VARIANTS:
+        build(db, *models, args.rows)  # warm up
+        peak, kept = bytes_per_row(db, build, models, args.rows)
+        seconds = seconds_per_row(db, build, models, args.rows, args.repeat)
+        print(f'{name:<12} {peak:>11.0f} {kept:>11.0f} {seconds * 1e6:>8.1f}')
+
+    # render every request
+    from cache import NullBackend
+    app.extensions['page_cache'].backend = NullBackend()
+    app.config['PAGE_SIZE'] = args.rows
+    queries, timings = time_page(app, db, '/shows', args.repeat)
+    report(f'/shows with {args.rows} rows per page', queries, timings)
+  finally:
+    db.session.remove()
+    if not args.keep:
+      db.drop_all()
+
+
+if __name__ == '__main__':
+  main()
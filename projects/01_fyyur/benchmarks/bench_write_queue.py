@@ -0,0 +1,81 @@
+"""Latency of a burst of create form submissions, with and without the write queue.
+
+Posts --submissions venue forms from --clients threads at once, first
+committing every venue inside its request, then with WRITE_QUEUE on (see
+writequeue.py), and reports the p50/p95/max latency of the requests and
+the submissions per second of the burst. The queued burst is then applied
+by the worker in batches of 1 and of --batch-size, reporting the
+submissions each applies per second.
+
+  python benchmarks/bench_write_queue.py --submissions 2000 --clients 8
+"""
+
+import os
+import time
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from common import argument_parser, setup_app
+from load_test import percentile
+
+
+def post_venues(app, count, clients, offset):
+  """Posts count venue forms from clients threads, returns (request timings, seconds)"""
+  def post(i):
+    data = {'name': f'Venue {offset + i}', 'city': 'Austin', 'state': 'TX', 'address': f'{i} Main Street',
+            'phone': '512-123-1234', 'genres': ['Jazz']}
+    start = time.perf_counter()
+    response = app.test_client().post('/venues/create', data=data)
+    assert response.status_code in (200, 303), response.status_code
+    return time.perf_counter() - start
+
+  start = time.perf_counter()
+  with ThreadPoolExecutor(clients) as executor:
+    timings = list(executor.map(post, range(count)))
+  return timings, time.perf_counter() - start
+
+
+def main():
+  parser = argument_parser(__doc__)
+  parser.add_argument('--submissions', type=int, default=2000, help='venue forms per burst')
+  parser.add_argument('--clients', type=int, default=8, help='threads posting at once')
+  parser.add_argument('--batch-size', type=int, default=100, help='submissions per worker transaction')
+  args = parser.parse_args()
+
+  app, db = setup_app(args.database)
+  app.config['WTF_CSRF_ENABLED'] = False
+  from models import Venue
+  queue = app.extensions['write_queue']
+  folder = tempfile.mkdtemp()
+  app.config['WRITE_QUEUE_PATH'] = os.path.join(folder, 'queue.sqlite3')
+  try:
+    print(f'{"burst":<22} {"p50 ms":>9} {"p95 ms":>9} {"max ms":>9} {"per s":>9}')
+    for mode, enabled in (('commit in request', False), ('queued', True)):
+      app.config['WRITE_QUEUE'] = enabled
+      timings, seconds = post_venues(app, args.submissions, args.clients, enabled * args.submissions)
+      print(f'{mode:<22} {percentile(timings, 50) * 1000:>9.2f} {percentile(timings, 95) * 1000:>9.2f} '
+            f'{max(timings) * 1000:>9.2f} {args.submissions / seconds:>9.0f}')
+
+    # half of the queued burst for each batch size
+    half = args.submissions // 2
+    with app.app_context():
+      print(f'{"worker":<22} {"applied":>9} {"per s":>9}')
+      for batch_size in (1, args.batch_size):
+        start = time.perf_counter()
+        applied = 0
+        while applied < half:
+          applied += queue.work(min(batch_size, half - applied))
+        seconds = time.perf_counter() - start
+        print(f'{"batches of " + str(batch_size):<22} {applied:>9} {applied / seconds:>9.0f}')
+      db.session.remove()
+      assert db.session.query(Venue).count() == args.submissions + 2 * half
+  finally:
+    app.config['WRITE_QUEUE'] = False
+    shutil.rmtree(folder)
+    db.session.remove()
+    if not args.keep:
+      db.drop_all()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,144 @@
+#----------------------------------------------------------------------------#
+# Shared helpers for the Fyyur benchmarks.
+#
+# Run the benchmarks from the project folder, e.g.
+#   python benchmarks/bench_venues.py --venues 10000 --cities 2000
+# The database given by --database (or BENCH_DATABASE_URL) is created and
+# dropped by the benchmark, so never point it at a database you care about.
+#----------------------------------------------------------------------------#
+
+import os
+import sys
+import time
+import random
+import argparse
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import event
+
+DEFAULT_DATABASE_URL = os.environ.get('BENCH_DATABASE_URL', 'postgres://localhost:5432/fyyur_bench')
+
+
+def argument_parser(description):
+  """Argument parser with the options shared by every benchmark"""
+  parser = argparse.ArgumentParser(description=description)
+  parser.add_argument('--database', default=DEFAULT_DATABASE_URL,
+                      help='database url to seed (it is dropped afterwards)')
+  parser.add_argument('--repeat', type=int, default=5, help='requests to time per page')
+  parser.add_argument('--keep', action='store_true', help='do not drop the tables when done')
+  return parser
+
+
+def setup_app(database_url):
+  """Imports the Fyyur app bound to the benchmark database and creates the tables"""
+  from app import app, db
+  app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+  app.config['TESTING'] = True
+  db.drop_all()
+  db.create_all()
+  return app, db
+
+
+class QueryCounter(object):
+  """Counts the statements sent to the database while it is active"""
+
+  def __init__(self, engine):
+    self.engine = engine
+    self.count = 0
+
+  def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+    self.count += 1
+
+  def __enter__(self):
+    self.count = 0
+    event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+    return self
+
+  def __exit__(self, *exc):
+    event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+
+
+@contextmanager
+def timer(results, name):
+  start = time.perf_counter()
+  yield
+  results.setdefault(name, []).append(time.perf_counter() - start)
+
+
+def time_page(app, db, path, repeat):
+  """Requests path repeat times and returns (queries per request, timings)"""
+  client = app.test_client()
+  timings = {}
+  client.get(path)  # warm up template and connection caches
+  with QueryCounter(db.engine) as counter:
+    for _ in range(repeat):
+      with timer(timings, path):
+        response = client.get(path)
+      assert response.status_code == 200, response.status_code
+  return counter.count / repeat, timings[path]
+
+
+def report(label, queries, timings):
+  timings = sorted(timings)
+  print(f'{label:<40} queries/request: {queries:>8.1f}   '
+        f'median: {timings[len(timings) // 2] * 1000:>9.2f} ms   '
+        f'max: {timings[-1] * 1000:>9.2f} ms')
+
+
+def rebuild_summary(db):
+  """Bulk inserts skip the session events keeping the venue listing up to date"""
+  from summary import rebuild_venue_summary
+  rebuild_venue_summary(db.session)
+
+
+def seed_venues(db, Venue, n_venues, n_cities, seed=0):
+  """Inserts n_venues venues spread evenly over n_cities (city, state) pairs"""
+  rng = random.Random(seed)
+  rows = []
+  for i in range(n_venues):
+    city = i % n_cities
+    rows.append({
+      'name': f'Venue {i}',
+      'genres': ['Jazz'],
+      'city': f'City {city}',
+      'state': f'S{city % 50}',
+      'address': f'{rng.randint(1, 9999)} Main Street',
+      'phone': '123-123-1234',
+      'seeking_talent': bool(i % 2),
+    })
+  db.session.bulk_insert_mappings(Venue, rows)
+  rebuild_summary(db)
+  db.session.commit()
+
+
+def seed_artists(db, Artist, n_artists, seed=0):
+  rows = [{
+    'name': f'Artist {i}',
+    'genres': ['Rock n Roll'],
+    'city': f'City {i % 100}',
+    'state': 'CA',
+    'phone': '123-123-1234',
+    'seeking_venue': bool(i % 2),
+  } for i in range(n_artists)]
+  db.session.bulk_insert_mappings(Artist, rows)
+  db.session.commit()
+
+
+def seed_shows(db, Show, n_shows, artist_ids, venue_ids, seed=0):
+  """Inserts n_shows shows spread one year into the past and one into the future.
+  Every show has its own half hour, so no venue or artist is booked twice at once."""
+  rng = random.Random(seed)
+  now = datetime.now()
+  slots = rng.sample(range(-2 * 24 * 365, 2 * 24 * 365), n_shows)
+  rows = [{
+    'artist_id': rng.choice(artist_ids),
+    'venue_id': rng.choice(venue_ids),
+    'start_time': now + timedelta(minutes=30 * slot),
+    'end_time': now + timedelta(minutes=30 * slot + 30),
+  } for slot in slots]
+  db.session.bulk_insert_mappings(Show, rows)
+  rebuild_summary(db)
+  db.session.commit()
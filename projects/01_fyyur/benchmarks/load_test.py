@@ -0,0 +1,190 @@
+"""Load test of the app served by gunicorn.
+
+Seeds the benchmark database, starts gunicorn with --workers processes of
+--threads threads each and drives the pages with 1, 2, 4 ... up to
+--max-concurrency concurrent clients for --duration seconds per level.
+Every level reports requests/s, p50/p95 latency, errors and, on Postgres,
+the most connections the app held open. The app can hold at most
+workers x (pool size + max overflow) connections: once the clients outnumber
+them, throughput stops growing and latency climbs as requests queue for a
+connection, and errors appear once they wait longer than --pool-timeout.
+
+  pip install gunicorn
+  python benchmarks/load_test.py --workers 4 --threads 8 --pool-size 2 --max-overflow 0
+
+The page cache is disabled so every request reaches the database. The
+server runs in a scratch folder where its error.log and output are kept.
+"""
+
+import os
+import sys
+import time
+import socket
+import tempfile
+import threading
+import subprocess
+import urllib.request
+from urllib.error import HTTPError
+from common import argument_parser, setup_app, seed_venues, seed_artists, seed_shows
+
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+PATHS = ['/venues', '/artists', '/shows', '/api/v1/shows']
+
+
+def percentile(timings, p):
+  timings = sorted(timings)
+  return timings[min(len(timings) - 1, int(len(timings) * p / 100))]
+
+
+def start_server(args, **settings):
+  """Starts gunicorn serving the app with the environment settings on top of the load test ones"""
+  with socket.socket() as sock:
+    if sock.connect_ex(('127.0.0.1', args.port)) == 0:
+      sys.exit(f'Port {args.port} is in use, pick another with --port')
+  env = dict(os.environ,
+             DATABASE_URL=args.database,
+             FYYUR_PROFILE='production',
+             SECRET_KEY='load-test',
+             CACHE_BACKEND='null',
+             DB_POOL_SIZE=str(args.pool_size),
+             DB_MAX_OVERFLOW=str(args.max_overflow),
+             DB_POOL_TIMEOUT=str(args.pool_timeout),
+             **settings)
+  scratch = tempfile.mkdtemp(prefix='fyyur-load-test-')
+  print(f'server logs in {scratch}')
+  output = open(os.path.join(scratch, 'gunicorn.log'), 'w')
+  server = subprocess.Popen(
+    ['gunicorn', '--workers', str(args.workers), '--threads', str(args.threads),
+     '--bind', f'127.0.0.1:{args.port}', '--pythonpath', PROJECT_DIR, 'app:app'],
+    cwd=scratch, env=env, stdout=output, stderr=subprocess.STDOUT)
+
+  deadline = time.time() + 30
+  try:
+    while time.time() < deadline:
+      if server.poll() is not None:
+        sys.exit(f'gunicorn exited, see {output.name}')
+      try:
+        urllib.request.urlopen(f'http://127.0.0.1:{args.port}/', timeout=5).read()
+        return server
+      except OSError:
+        # refused until a worker listens
+        time.sleep(0.2)
+    sys.exit('gunicorn did not start within 30s')
+  except BaseException:
+    server.terminate()
+    raise
+
+
+def run_clients(base_url, concurrency, duration, paths=PATHS):
+  """Requests paths from concurrency threads for duration seconds, returns (timings, errors)"""
+  timings = []
+  errors = []
+  lock = threading.Lock()
+  deadline = time.time() + duration
+
+  def client(offset):
+    i = offset
+    while time.time() < deadline:
+      path = paths[i % len(paths)]
+      i += 1
+      start = time.perf_counter()
+      try:
+        urllib.request.urlopen(base_url + path, timeout=60).read()
+        error = None
+      except HTTPError as e:
+        error = e.code
+      except OSError as e:
+        error = type(e).__name__
+      elapsed = time.perf_counter() - start
+      with lock:
+        if error is None:
+          timings.append(elapsed)
+        else:
+          errors.append(error)
+
+  threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  return timings, errors
+
+
+class ConnectionSampler(threading.Thread):
+  """Tracks the most connections open to the database, Postgres only"""
+
+  def __init__(self, db):
+    super().__init__(daemon=True)
+    self.db = db
+    self.peak = 0
+    self.running = True
+
+  def run(self):
+    with self.db.engine.connect() as connection:
+      while self.running:
+        count = connection.execute(
+          'SELECT count(*) FROM pg_stat_activity '
+          'WHERE datname = current_database() AND pid <> pg_backend_pid()').scalar()
+        self.peak = max(self.peak, count)
+        time.sleep(0.1)
+
+  def stop(self):
+    self.running = False
+    self.join()
+    return self.peak
+
+
+def main():
+  parser = argument_parser(__doc__)
+  parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes')
+  parser.add_argument('--threads', type=int, default=8, help='threads per worker')
+  parser.add_argument('--pool-size', type=int, default=2, help='DB_POOL_SIZE of every worker')
+  parser.add_argument('--max-overflow', type=int, default=0, help='DB_MAX_OVERFLOW of every worker')
+  parser.add_argument('--pool-timeout', type=int, default=10, help='DB_POOL_TIMEOUT in seconds')
+  parser.add_argument('--max-concurrency', type=int, default=64, help='most concurrent clients')
+  parser.add_argument('--duration', type=float, default=5, help='seconds per concurrency level')
+  parser.add_argument('--port', type=int, default=8765)
+  parser.add_argument('--venues', type=int, default=2000)
+  parser.add_argument('--artists', type=int, default=2000)
+  parser.add_argument('--shows', type=int, default=20000)
+  args = parser.parse_args()
+
+  app, db = setup_app(args.database)
+  from models import Venue, Artist, Show
+  seed_venues(db, Venue, args.venues, max(1, args.venues // 10))
+  seed_artists(db, Artist, args.artists)
+  seed_shows(db, Show, args.shows, [id for (id,) in db.session.query(Artist.id)],
+             [id for (id,) in db.session.query(Venue.id)])
+  db.session.remove()
+
+  postgres = db.engine.dialect.name == 'postgresql'
+  server = start_server(args)
+  try:
+    capacity = args.workers * (args.pool_size + args.max_overflow)
+    print(f'{args.workers} workers x {args.threads} threads, at most {capacity} connections '
+          f'({args.pool_size} pooled + {args.max_overflow} overflow per worker)')
+    print(f'{"clients":>8} {"req/s":>9} {"p50 ms":>9} {"p95 ms":>9} {"errors":>7} {"conns":>6}')
+    concurrency = 1
+    while concurrency <= args.max_concurrency:
+      sampler = ConnectionSampler(db) if postgres else None
+      if sampler:
+        sampler.start()
+      timings, errors = run_clients(f'http://127.0.0.1:{args.port}', concurrency, args.duration)
+      peak = sampler.stop() if sampler else '-'
+      if timings:
+        print(f'{concurrency:>8} {len(timings) / args.duration:>9.1f} '
+              f'{percentile(timings, 50) * 1000:>9.1f} {percentile(timings, 95) * 1000:>9.1f} '
+              f'{len(errors):>7} {peak:>6}')
+      else:
+        print(f'{concurrency:>8} {"-":>9} {"-":>9} {"-":>9} {len(errors):>7} {peak:>6}')
+      concurrency *= 2
+  finally:
+    server.terminate()
+    server.wait()
+    db.session.remove()
+    if not args.keep:
+      db.drop_all()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,260 @@
+#----------------------------------------------------------------------------#
+# Bulk import and export of venues, artists and shows.
+#
+#   flask import venues partners.csv --rejects rejected.ndjson
+#   flask export artists artists.ndjson
+#
+# Files are CSV or NDJSON, picked by extension or --format. Imported rows go
+# through the same validation as the create forms and are inserted with one
+# executemany per chunk. Rejected rows are reported with their line number
+# and errors. Genres are a JSON list in NDJSON and comma separated in CSV.
+# Shows booking a venue or an artist already booked at that time, in the
+# database or earlier in the file, are rejected.
+#
+# Every chunk commits on its own. Once at least one has, the venue summary,
+# the page cache and the API table versions are brought up to date, even
+# when a later chunk fails. The command runs in its own process, so use the
+# 'filesystem' CACHE_BACKEND for running servers to see the invalidation;
+# with 'lru' they keep serving their cached pages and ETags.
+#----------------------------------------------------------------------------#
+
+import csv
+import sys
+import json
+import time
+import click
+from werkzeug.datastructures import MultiDict
+from models import app, db, Venue, Artist, Show
+from forms import VenueForm, ArtistForm, ShowForm
+import scheduling
+from summary import rebuild_venue_summary
+
+FALSE_VALUES = ('', '0', 'false', 'no', 'off')
+
+ENTITIES = {
+  'venues': (Venue, VenueForm),
+  'artists': (Artist, ArtistForm),
+  'shows': (Show, ShowForm),
+}
+
+# namespaces of the page cache a bulk write changes, see app.py
+INVALIDATES = {
+  'venues': ('index', 'recent_venues', 'venues', 'venue_choices'),
+  'artists': ('index', 'recent_artists', 'artists', 'artist_choices'),
+  'shows': ('shows', 'venues'),
+}
+
+
+def file_format(path, format):
+  if format:
+    return format
+  return 'csv' if path.lower().endswith('.csv') else 'ndjson'
+
+
+def read_records(f, format):
+  """(line number, dict, None) of every record of a CSV or NDJSON file,
+  (line number, line, errors) of the NDJSON lines that are no JSON object"""
+  if format == 'csv':
+    reader = csv.DictReader(f)
+    for record in reader:
+      genres = record.get('genres')
+      if genres is not None:
+        record['genres'] = [genre.strip() for genre in genres.split(',') if genre.strip()]
+      yield reader.line_num, record, None
+  else:
+    for line_num, line in enumerate(f, 1):
+      if not line.strip():
+        continue
+      try:
+        record = json.loads(line)
+      except ValueError as error:
+        yield line_num, line.rstrip('\n'), {'record': [f'Not valid JSON: {error}']}
+        continue
+      if isinstance(record, dict):
+        yield line_num, record, None
+      else:
+        yield line_num, record, {'record': ['Not a JSON object.']}
+
+
+def form_data(record):
+  """MultiDict the forms validate, as a browser would post the record"""
+  data = MultiDict()
+  for key, value in record.items():
+    if isinstance(value, list):
+      for item in value:
+        data.add(key, item)
+    elif isinstance(value, bool):
+      # an unchecked checkbox is not posted at all
+      if value:
+        data.add(key, 'y')
+    elif value is not None:
+      if key.startswith('seeking_') and str(value).strip().lower() in FALSE_VALUES:
+        continue
+      data.add(key, str(value))
+  return data
+
+
+def validate(entity, form_class, record, ids, line_num=None):
+  """(row, None) for a valid record, (None, errors) otherwise"""
+  form = form_class(formdata=form_data(record), meta={'csrf': False})
+  if entity != 'shows':
+    if not form.validate():
+      return None, form.errors
+    return {name: value for name, value in form.data.items() if name != 'csrf_token'}, None
+
+  # shows reference existing rows instead of a fixed list of choices
+  errors = {}
+  row = {}
+  for field, known in (('artist_id', ids['artists']), ('venue_id', ids['venues'])):
+    try:
+      row[field] = int(record.get(field))
+    except (TypeError, ValueError):
+      errors[field] = ['Not a valid id.']
+      continue
+    if row[field] not in known:
+      errors[field] = ['Does not exist.']
+  if not record.get('start_time'):
+    # the form would fall back to its default of today
+    errors['start_time'] = ['This field is required.']
+  elif not form.start_time.validate(form):
+    errors['start_time'] = form.start_time.errors
+  row['start_time'] = form.start_time.data
+  if record.get('end_time') and not form.end_time.validate(form, [ShowForm.validate_end_time]):
+    errors['end_time'] = form.end_time.errors
+  row['end_time'] = form.end_time.data if record.get('end_time') else None
+  if errors:
+    return None, errors
+
+  # against the shows in the database and those accepted so far
+  schedule = ids['schedule']
+  end = scheduling.show_end(row['start_time'], row['end_time'])
+  for kind in ('venue', 'artist'):
+    if schedule.overlapping(kind, row[kind + '_id'], row['start_time'], end):
+      errors[kind + '_id'] = [f'The {kind} is already booked at that time.']
+  if errors:
+    return None, errors
+  # accepted rows have no id yet, their negative line number stands in
+  schedule.add(-line_num, row['venue_id'], row['artist_id'], row['start_time'], row['end_time'])
+  return row, None
+
+
+def flush(model, rows):
+  """Inserts and commits rows, returns how many"""
+  count = len(rows)
+  if rows:
+    db.session.execute(model.__table__.insert(), rows)
+    db.session.commit()
+    rows.clear()
+  return count
+
+
+def publish_import(entity, model):
+  """Brings what the inserts bypassed up to date with the committed rows"""
+  if entity != 'artists':
+    # the session events keeping the venue listing up to date
+    rebuild_venue_summary(db.session)
+    db.session.commit()
+  app.extensions['page_cache'].invalidate(*INVALIDATES[entity])
+  # the API ETags
+  app.extensions['table_versions'].bump(model.__tablename__)
+
+
+@app.cli.command('import')
+@click.argument('entity', type=click.Choice(ENTITIES))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', type=click.Choice(['csv', 'ndjson']), help='defaults to the file extension')
+@click.option('--chunk-size', default=1000, show_default=True, help='rows per insert')
+@click.option('--rejects', type=click.Path(dir_okay=False), help='write rejected rows as NDJSON')
+def import_command(entity, path, format, chunk_size, rejects):
+  """Validates and bulk inserts the venues, artists or shows of PATH."""
+  model, form_class = ENTITIES[entity]
+  ids = {}
+  if entity == 'shows':
+    ids['artists'] = {id for (id,) in db.session.query(Artist.id)}
+    ids['venues'] = {id for (id,) in db.session.query(Venue.id)}
+    ids['schedule'] = scheduling.ScheduleIndex()
+    ids['schedule'].build(db.session.query(Show.id, Show.venue_id, Show.artist_id, Show.start_time, Show.end_time))
+
+  if app.config.get('CACHE_BACKEND', 'lru') != 'filesystem':
+    click.echo('The page cache and API ETags of running servers are not invalidated, '
+               "use the 'filesystem' CACHE_BACKEND to share them", err=True)
+
+  accepted = rejected = committed = 0
+  rows = []
+  start = time.perf_counter()
+  rejects_file = open(rejects, 'w') if rejects else None
+  try:
+    # the forms need a request context, one serves the whole file
+    with open(path, newline='') as f, app.test_request_context():
+      for line_num, record, errors in read_records(f, file_format(path, format)):
+        if not errors:
+          row, errors = validate(entity, form_class, record, ids, line_num)
+        if errors:
+          rejected += 1
+          if rejects_file:
+            rejects_file.write(json.dumps({'line': line_num, 'errors': errors, 'record': record}) + '\n')
+          else:
+            click.echo(f'line {line_num}: {errors}', err=True)
+          continue
+        rows.append(row)
+        accepted += 1
+        if len(rows) >= chunk_size:
+          committed += flush(model, rows)
+      committed += flush(model, rows)
+  except:
+    db.session.rollback()
+    click.echo(f'{entity}: {committed} imported before the error', err=True)
+    raise
+  finally:
+    if rejects_file:
+      rejects_file.close()
+    db.session.close()
+    # also when a later chunk failed, its earlier chunks are in the database
+    if committed:
+      publish_import(entity, model)
+
+  seconds = time.perf_counter() - start
+  click.echo(f'{entity}: {accepted} imported, {rejected} rejected in {seconds:.2f}s '
+             f'({(accepted + rejected) / seconds if seconds else 0:.0f} rows/s)')
+
+
+@app.cli.command('export')
+@click.argument('entity', type=click.Choice(ENTITIES))
+@click.argument('path', type=click.Path(dir_okay=False, allow_dash=True))
+@click.option('--format', type=click.Choice(['csv', 'ndjson']), help='defaults to the file extension')
+@click.option('--chunk-size', default=1000, show_default=True, help='rows fetched per round trip')
+def export_command(entity, path, format, chunk_size):
+  """Streams every venue, artist or show to PATH ('-' for stdout)."""
+  model, _ = ENTITIES[entity]
+  columns = [column for column in model.__table__.columns if column.name != 'search_vector']
+  names = [column.name for column in columns]
+  format = file_format(path, format)
+
+  start = time.perf_counter()
+  count = 0
+  f = sys.stdout if path == '-' else open(path, 'w', newline='')
+  try:
+    writer = csv.writer(f) if format == 'csv' else None
+    if writer:
+      writer.writerow(names)
+    # yield_per streams the rows through a server side cursor on Postgres
+    for row in db.session.query(*columns).order_by(model.id).yield_per(chunk_size):
+      record = dict(zip(names, row))
+      for name in ('start_time', 'end_time'):
+        if record.get(name) is not None:
+          record[name] = record[name].strftime('%Y-%m-%d %H:%M:%S')
+      if writer:
+        if 'genres' in record:
+          record['genres'] = ','.join(record['genres'] or [])
+        writer.writerow([record[name] for name in names])
+      else:
+        f.write(json.dumps(record) + '\n')
+      count += 1
+  finally:
+    if f is not sys.stdout:
+      f.close()
+    db.session.close()
+
+  seconds = time.perf_counter() - start
+  click.echo(f'{entity}: {count} exported in {seconds:.2f}s '
+             f'({count / seconds if seconds else 0:.0f} rows/s)', err=True)
@@ -0,0 +1,377 @@
+#----------------------------------------------------------------------------#
+# Page and fragment cache for the read routes.
+#
+# Entries live in namespaces ('venues', 'recent_artists', ...). The write
+# handlers invalidate the namespaces they change and nothing else. Pages are
+# keyed by their path and the query arguments their view reads, so other
+# arguments don't add entries. Backends, both keeping at most CACHE_MAXSIZE
+# entries (the filesystem one per namespace):
+#   'lru'         in-process LRU, one copy per worker
+#   'filesystem'  pickles under CACHE_DIR, shared by the workers of a host
+#   'null'        caches nothing
+#
+# Every namespace has a generation, moved on by each invalidation. A page is
+# only stored while the generation it was rendered under is current, so a
+# page rendered before a write never outlives its invalidation. The backend
+# keeps the generations next to the entries: the 'filesystem' one as counter
+# files under CACHE_DIR/generations, so an invalidation by one worker also
+# stops the pages the other workers are rendering.
+#
+# TableVersions counts the committed writes to every table, the API builds
+# its ETags from them (see api.py).
+#----------------------------------------------------------------------------#
+
+import os
+import fcntl
+import pickle
+import shutil
+import hashlib
+import tempfile
+import threading
+from uuid import uuid4
+from functools import wraps
+from urllib.parse import urlencode
+from collections import OrderedDict, defaultdict
+from sqlalchemy import event
+from flask import g, request, session, make_response, message_flashed
+
+
+def read_counter(path):
+  """'inode.count' of the counter file at path, created at 0 when missing.
+  A recreated file gets a new inode, its values never repeat the old ones."""
+  fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+  try:
+    fcntl.flock(fd, fcntl.LOCK_SH)
+    return f'{os.fstat(fd).st_ino}.{_count(os.read(fd, 64))}'
+  finally:
+    # closing releases the lock
+    os.close(fd)
+
+
+def increment_counter(path):
+  """Adds one to the counter file at path, under a lock so no concurrent increment is lost"""
+  fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+  try:
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    count = str(_count(os.read(fd, 64)) + 1).encode()
+    os.lseek(fd, 0, os.SEEK_SET)
+    os.write(fd, count)
+    os.ftruncate(fd, len(count))
+  finally:
+    os.close(fd)
+
+
+def _count(data):
+  # files written before the counters were one byte per increment
+  return int(data) if data.isdigit() else len(data)
+
+
+class NullBackend(object):
+
+  def get(self, namespace, key):
+    return None
+
+  def set(self, namespace, key, value):
+    pass
+
+  def delete(self, namespace, key):
+    pass
+
+  def delete_namespace(self, namespace):
+    pass
+
+  def generation(self, namespace):
+    return 0
+
+  def bump(self, namespace):
+    pass
+
+
+class LRUBackend(object):
+  """Keeps the maxsize most recently used entries in memory"""
+
+  def __init__(self, maxsize=1024):
+    self.maxsize = maxsize
+    self.entries = OrderedDict()
+    self.namespaces = defaultdict(set)
+    self.generations = defaultdict(int)
+    self.lock = threading.Lock()
+
+  def get(self, namespace, key):
+    with self.lock:
+      value = self.entries.get((namespace, key))
+      if value is not None:
+        self.entries.move_to_end((namespace, key))
+      return value
+
+  def set(self, namespace, key, value):
+    with self.lock:
+      self.entries[(namespace, key)] = value
+      self.entries.move_to_end((namespace, key))
+      self.namespaces[namespace].add(key)
+      while len(self.entries) > self.maxsize:
+        (old_namespace, old_key), _ = self.entries.popitem(last=False)
+        self.namespaces[old_namespace].discard(old_key)
+
+  def delete(self, namespace, key):
+    with self.lock:
+      self.entries.pop((namespace, key), None)
+      self.namespaces[namespace].discard(key)
+
+  def delete_namespace(self, namespace):
+    with self.lock:
+      for key in self.namespaces.pop(namespace, ()):
+        self.entries.pop((namespace, key), None)
+
+  def generation(self, namespace):
+    return self.generations[namespace]
+
+  def bump(self, namespace):
+    with self.lock:
+      self.generations[namespace] += 1
+
+
+class FileSystemBackend(object):
+  """One pickle per entry under directory/namespace/, at most maxsize per
+  namespace (the oldest written go first). The generation of a namespace is
+  the counter file directory/generations/namespace."""
+
+  def __init__(self, directory, maxsize=1024):
+    self.directory = directory
+    self.maxsize = maxsize
+    self.generations = os.path.join(directory, 'generations')
+    os.makedirs(self.generations, exist_ok=True)
+
+  def _path(self, namespace, key):
+    return os.path.join(self.directory, namespace, hashlib.sha1(key.encode()).hexdigest())
+
+  def get(self, namespace, key):
+    try:
+      with open(self._path(namespace, key), 'rb') as f:
+        return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+      return None
+
+  def set(self, namespace, key, value):
+    path = self._path(namespace, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # write then rename, so readers never see a partial file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as f:
+      pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+    self._evict(os.path.dirname(path))
+
+  def _evict(self, folder):
+    with os.scandir(folder) as entries:
+      files = [entry for entry in entries if entry.is_file()]
+    if len(files) <= self.maxsize:
+      return
+    files.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in files[:len(files) - self.maxsize]:
+      try:
+        os.remove(entry.path)
+      except FileNotFoundError:
+        # evicted by another worker meanwhile
+        pass
+
+  def delete(self, namespace, key):
+    try:
+      os.remove(self._path(namespace, key))
+    except FileNotFoundError:
+      pass
+
+  def delete_namespace(self, namespace):
+    shutil.rmtree(os.path.join(self.directory, namespace), ignore_errors=True)
+
+  def generation(self, namespace):
+    return read_counter(os.path.join(self.generations, namespace))
+
+  def bump(self, namespace):
+    increment_counter(os.path.join(self.generations, namespace))
+
+
+class PageCache(object):
+  """Caches whole responses of read routes and fragments of the data they render"""
+
+  def __init__(self, app=None):
+    self.backend = NullBackend()
+    self.hits = defaultdict(int)
+    self.misses = defaultdict(int)
+    # namespaces used by this process
+    self.namespaces = set()
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.extensions['page_cache'] = self
+    backend = app.config.get('CACHE_BACKEND', 'lru')
+    if backend == 'lru':
+      self.backend = LRUBackend(app.config.get('CACHE_MAXSIZE', 1024))
+    elif backend == 'filesystem':
+      self.backend = FileSystemBackend(app.config['CACHE_DIR'], app.config.get('CACHE_MAXSIZE', 1024))
+    elif backend in (None, 'null'):
+      self.backend = NullBackend()
+    else:
+      raise ValueError(f'Unknown CACHE_BACKEND {backend!r}')
+    message_flashed.connect(self._note_flash, app)
+
+  def _note_flash(self, sender, message, category):
+    # rendering pops the flashed messages from the session, this flag outlives them
+    g.page_cache_flashed = True
+
+  def stats(self):
+    """Hit and miss counters per namespace"""
+    return {namespace: {'hits': self.hits[namespace], 'misses': self.misses[namespace]}
+            for namespace in set(self.hits) | set(self.misses)}
+
+  def fragment(self, namespace, key, build):
+    """Value of key in namespace, calling build() to fill it on a miss"""
+    value = self.backend.get(namespace, key)
+    if value is not None:
+      self.hits[namespace] += 1
+      return value
+    self.misses[namespace] += 1
+    generation = self._generation(namespace)
+    value = build()
+    self._store(namespace, key, value, generation)
+    return value
+
+  def invalidate(self, *namespaces):
+    for namespace in namespaces:
+      # bumped first, a page rendered meanwhile is not stored after the delete
+      self.backend.bump(namespace)
+      self.backend.delete_namespace(namespace)
+
+  def _generation(self, namespace):
+    self.namespaces.add(namespace)
+    return self.backend.generation(namespace)
+
+  def _store(self, namespace, key, value, generation):
+    """Stores value built under generation, unless namespace was invalidated since"""
+    if self.backend.generation(namespace) != generation:
+      return
+    self.backend.set(namespace, key, value)
+    # invalidated between the check and the write, by this worker or another
+    if self.backend.generation(namespace) != generation:
+      self.backend.delete(namespace, key)
+
+  def cached(self, namespace, args=None):
+    """Caches the body of a GET view under namespace, keyed by its path and
+    the query arguments of args ({name: type}) it reads, parsed as it does"""
+    args = args or {}
+
+    def decorator(view):
+      @wraps(view)
+      def wrapper(*view_args, **view_kwargs):
+        # pages rendering flashed messages are one-off, never serve or store them
+        if request.method != 'GET' or session.get('_flashes'):
+          return view(*view_args, **view_kwargs)
+
+        values = ((name, request.args.get(name, type=type)) for name, type in sorted(args.items()))
+        key = request.path + '?' + urlencode([(name, value) for name, value in values if value not in (None, '')])
+        body = self.backend.get(namespace, key)
+        if body is not None:
+          self.hits[namespace] += 1
+          response = make_response(body)
+          response.headers['X-Cache'] = 'HIT'
+          return response
+
+        self.misses[namespace] += 1
+        generation = self._generation(namespace)
+        g.page_cache_flashed = False
+        response = make_response(view(*view_args, **view_kwargs))
+        response.headers['X-Cache'] = 'MISS'
+        # a page that flashed a message (an error) is one-off too
+        if response.status_code == 200 and not g.get('page_cache_flashed'):
+          if response.is_streamed:
+            response.response = self._store_when_done(namespace, key, response.response, generation)
+          else:
+            self._store(namespace, key, response.get_data(), generation)
+        return response
+      return wrapper
+    return decorator
+
+  def _store_when_done(self, namespace, key, chunks, generation):
+    """Passes a streamed body through and stores it once it has been sent in full"""
+    body = []
+    for chunk in chunks:
+      body.append(chunk if isinstance(chunk, bytes) else chunk.encode('utf-8'))
+      yield chunk
+    self._store(namespace, key, b''.join(body), generation)
+
+
+class TableVersions(object):
+  """Version of every table, bumped each time a transaction writing to it commits.
+
+  Writes through the session are picked up from its flushes and bulk queries,
+  deletes also bump the tables whose rows the database deletes in cascade.
+  Writes that bypass the session must call bump() themselves. With the
+  'filesystem' backend a bump increments the counter file
+  CACHE_DIR/versions/<table> under a lock, so the workers of a host share
+  versions and never lose a concurrent bump; otherwise versions are counted
+  in memory, one set per worker.
+  """
+
+  def __init__(self, app=None, db=None):
+    self.directory = None
+    # versions of a new process never repeat those of a previous one
+    self.token = uuid4().hex[:8]
+    self.counts = defaultdict(int)
+    self.lock = threading.Lock()
+    self.cascades = {}
+    if app is not None:
+      self.init_app(app, db)
+
+  def init_app(self, app, db):
+    app.extensions['table_versions'] = self
+    if app.config.get('CACHE_BACKEND', 'lru') == 'filesystem':
+      self.directory = os.path.join(app.config['CACHE_DIR'], 'versions')
+      os.makedirs(self.directory, exist_ok=True)
+
+    for table in db.metadata.tables.values():
+      for fk in table.foreign_keys:
+        if (fk.ondelete or '').upper() == 'CASCADE':
+          self.cascades.setdefault(fk.column.table.name, set()).add(table.name)
+
+    event.listen(db.session, 'after_flush', self._after_flush)
+    event.listen(db.session, 'after_bulk_update', self._after_bulk_update)
+    event.listen(db.session, 'after_bulk_delete', self._after_bulk_delete)
+    event.listen(db.session, 'after_commit', self._after_commit)
+    event.listen(db.session, 'after_rollback', self._after_rollback)
+
+  def version(self, table):
+    if self.directory is None:
+      return f'{self.token}.{self.counts[table]}'
+    return read_counter(os.path.join(self.directory, table))
+
+  def bump(self, *tables):
+    for table in tables:
+      if self.directory is None:
+        with self.lock:
+          self.counts[table] += 1
+      else:
+        increment_counter(os.path.join(self.directory, table))
+
+  def _changed(self, session, table, deleted=False):
+    tables = session.info.setdefault('changed_tables', set())
+    tables.add(table)
+    if deleted:
+      tables.update(self.cascades.get(table, ()))
+
+  def _after_flush(self, session, flush_context):
+    for instances, deleted in ((session.new, False), (session.dirty, False), (session.deleted, True)):
+      for instance in instances:
+        self._changed(session, instance.__table__.name, deleted)
+
+  def _after_bulk_update(self, context):
+    self._changed(context.session, context.mapper.local_table.name)
+
+  def _after_bulk_delete(self, context):
+    self._changed(context.session, context.mapper.local_table.name, deleted=True)
+
+  def _after_commit(self, session):
+    self.bump(*session.info.pop('changed_tables', ()))
+
+  def _after_rollback(self, session):
+    session.info.pop('changed_tables', None)
@@ -0,0 +1,125 @@
+#----------------------------------------------------------------------------#
+# Checks that the read routes of app.py are served from indexes.
+#
+# Every route below is requested through the test client against the
+# configured Postgres database (or --database). The SELECT statements it
+# issues are captured and re-run under EXPLAIN with sequential scans
+# disabled, so any Seq Scan left in a plan is a query no index can serve.
+#
+#   python check_query_plans.py
+#
+# The database needs at least one venue and one artist.
+#----------------------------------------------------------------------------#
+
+import sys
+import json
+import argparse
+from sqlalchemy import event
+
+
+def routes(venue_id, artist_id):
+  """(method, path, form data) of every route that reads from the database"""
+  return [
+    ('GET', '/', None),
+    ('GET', '/venues', None),
+    ('GET', f'/venues?after={venue_id}', None),
+    ('GET', '/venues?genre=Jazz', None),
+    ('POST', '/venues/search', {'search_term': 'hop', 'city': 'san', 'state': ''}),
+    ('GET', f'/venues/{venue_id}', None),
+    ('GET', f'/venues/{venue_id}?past_limit=5', None),
+    ('GET', f'/venues/{venue_id}/edit', None),
+    ('GET', '/artists', None),
+    ('GET', f'/artists?after={artist_id}', None),
+    ('GET', '/artists?genre=Jazz', None),
+    ('POST', '/artists/search', {'search_term': 'band'}),
+    ('GET', f'/artists/{artist_id}', None),
+    ('GET', f'/artists/{artist_id}/edit', None),
+    ('GET', '/shows', None),
+    ('GET', '/shows/create', None),
+    ('GET', f'/shows/create/at_venue/{venue_id}', None),
+    ('GET', f'/shows/create/with_artist/{artist_id}', None),
+    ('GET', f'/api/v1/venues/{venue_id}/free_slots?start=2030-05-01T12:00&end=2030-05-02T00:00', None),
+  ]
+
+
+def capture_statements(app, db, method, path, data):
+  """Requests path and returns the SELECT statements it sent with their parameters"""
+  statements = []
+
+  def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+      statements.append((statement, parameters))
+
+  event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+  try:
+    response = app.test_client().open(path, method=method, data=data)
+  finally:
+    event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+  return response.status_code, statements
+
+
+def sequential_scans(plan):
+  """Relations read with a Seq Scan anywhere in an EXPLAIN (FORMAT JSON) plan"""
+  scans = []
+  if plan.get('Node Type') == 'Seq Scan':
+    scans.append(plan.get('Relation Name'))
+  for child in plan.get('Plans', []):
+    scans.extend(sequential_scans(child))
+  return scans
+
+
+def explain(connection, statement, parameters):
+  cursor = connection.cursor()
+  try:
+    cursor.execute('SET LOCAL enable_seqscan = off')
+    cursor.execute('EXPLAIN (FORMAT JSON) ' + statement, parameters)
+    plan = cursor.fetchone()[0]
+  finally:
+    cursor.close()
+    connection.rollback()
+  if isinstance(plan, str):
+    plan = json.loads(plan)
+  return plan[0]['Plan']
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--database', help='database url, defaults to SQLALCHEMY_DATABASE_URI')
+  args = parser.parse_args()
+
+  from app import app, db, Venue, Artist
+  if args.database:
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database
+  app.config['TESTING'] = True
+  if db.engine.dialect.name != 'postgresql':
+    sys.exit('Query plans can only be checked on Postgres')
+
+  with app.app_context():
+    venue_id = db.session.query(db.func.min(Venue.id)).scalar()
+    artist_id = db.session.query(db.func.min(Artist.id)).scalar()
+    db.session.remove()
+  if venue_id is None or artist_id is None:
+    sys.exit('The database needs at least one venue and one artist')
+
+  failures = 0
+  connection = db.engine.raw_connection()
+  try:
+    for method, path, data in routes(venue_id, artist_id):
+      status, statements = capture_statements(app, db, method, path, data)
+      scans = []
+      for statement, parameters in statements:
+        scans.extend(sequential_scans(explain(connection, statement, parameters)))
+      if status >= 400 or scans:
+        failures += 1
+        detail = f'status {status}' if status >= 400 else 'seq scan on ' + ', '.join(sorted(set(scans)))
+        print(f'FAIL {method:<4} {path:<40} {detail}')
+      else:
+        print(f'ok   {method:<4} {path:<40} {len(statements)} queries')
+  finally:
+    connection.close()
+
+  sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,50 @@
+#----------------------------------------------------------------------------#
+# Concurrent reads of independent queries.
+#
+# A page reading several unrelated things (the home page lists the recent
+# venues and the recent artists) waits for one query after the other. With
+# READ_THREADS > 0 they run at once on a thread pool shared by the requests
+# of a worker, each thread on its own session and connection, so the page
+# waits for the slowest query instead of their sum. Every such request holds
+# up to one connection per query: size DB_POOL_SIZE + DB_MAX_OVERFLOW for it.
+#
+# The functions run in a copy of the request context and their statements
+# count towards the request in the SQL instrumentation (instrumentation.py).
+#----------------------------------------------------------------------------#
+
+from concurrent.futures import ThreadPoolExecutor
+from flask import copy_current_request_context, has_request_context
+
+
+class ConcurrentReads(object):
+  """Runs independent read functions of a request concurrently, see the module comment"""
+
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.extensions['concurrent_reads'] = self
+    self.app = app
+    threads = app.config['READ_THREADS']
+    self.executor = ThreadPoolExecutor(threads, thread_name_prefix='fyyur-read') if threads else None
+
+  def gather(self, *functions):
+    """Results of calling every function, in order. Raises the first error a function raised."""
+    if self.executor is None or len(functions) < 2 or not has_request_context():
+      return [function() for function in functions]
+
+    query_stats = self.app.extensions.get('query_stats')
+    queries = query_stats.current() if query_stats else None
+
+    def in_worker(function):
+      @copy_current_request_context
+      def run():
+        # the copied context has its own g and, leaving it, removes the thread's session
+        if queries is not None:
+          query_stats.attach(queries)
+        return function()
+      return run
+
+    futures = [self.executor.submit(in_worker(function)) for function in functions]
+    return [future.result() for future in futures]
@@ -1,16 +1,107 @@
 import os
-SECRET_KEY = os.urandom(32)
+import tempfile
+
+
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def env_bool(name, default):
+    value = os.environ.get(name)
+    return default if value is None else value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+# 'development' or 'production', picks the defaults below. Every setting
+# read from the environment overrides its default in both profiles.
+PROFILE = os.environ.get('FYYUR_PROFILE', 'development')
+PRODUCTION = PROFILE == 'production'
+
+# Workers of a production server must share the key, or sessions and
+# flashed messages break between them
+SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
 # Enable debug mode.
-DEBUG = True
+DEBUG = env_bool('FYYUR_DEBUG', not PRODUCTION)
 
 # Connect to the database
 
 
 # DATABASE URL
-SQLALCHEMY_DATABASE_URI = 'postgres://lukas@localhost:5432/fyyur'
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgres://lukas@localhost:5432/fyyur')
+
+# Statement logging: 'true' (or '1', 'yes', 'on') for statements, 'debug' for
+# result rows too, anything else for none
+SQLALCHEMY_ECHO = 'debug' if os.environ.get('DB_ECHO', '').strip().lower() == 'debug' else env_bool('DB_ECHO', False)
+
+# Connection pool of every worker process, applied to Postgres engines (see
+# models.py). A worker holds at most DB_POOL_SIZE + DB_MAX_OVERFLOW
+# connections and a request waits DB_POOL_TIMEOUT seconds for one to free.
+DB_POOL_SIZE = env_int('DB_POOL_SIZE', 10 if PRODUCTION else 5)
+DB_MAX_OVERFLOW = env_int('DB_MAX_OVERFLOW', 5 if PRODUCTION else 10)
+DB_POOL_TIMEOUT = env_int('DB_POOL_TIMEOUT', 10 if PRODUCTION else 30)
+# Seconds before a connection is replaced, -1 keeps them forever
+DB_POOL_RECYCLE = env_int('DB_POOL_RECYCLE', 1800 if PRODUCTION else -1)
+# Checks connections before handing them out, surviving database restarts
+DB_POOL_PRE_PING = env_bool('DB_POOL_PRE_PING', PRODUCTION)
+# Milliseconds a statement may run before Postgres cancels it, 0 for no limit
+DB_STATEMENT_TIMEOUT = env_int('DB_STATEMENT_TIMEOUT', 5000 if PRODUCTION else 0)
+# How psycopg2 sends executemany() (bulk imports): 'values' folds the rows into
+# multi-row INSERTs of DB_EXECUTEMANY_PAGE_SIZE rows, 'batch' sends pages of
+# statements per round trip, 'default' one statement per row
+DB_EXECUTEMANY_MODE = os.environ.get('DB_EXECUTEMANY_MODE', 'values')
+DB_EXECUTEMANY_PAGE_SIZE = env_int('DB_EXECUTEMANY_PAGE_SIZE', 1000)
+
+# Threads of a worker running the independent queries of a page at once
+# (see concurrent_reads.py), 0 runs them one after the other
+READ_THREADS = env_int('READ_THREADS', 0)
+
+# Queue the venue, artist and show create forms in a local SQLite file and
+# answer with a status page at once; `flask write-worker` applies them in
+# transactions of WRITE_QUEUE_BATCH submissions (see writequeue.py)
+WRITE_QUEUE = env_bool('WRITE_QUEUE', False)
+WRITE_QUEUE_PATH = os.environ.get('WRITE_QUEUE_PATH', os.path.join(basedir, 'write_queue.sqlite3'))
+WRITE_QUEUE_BATCH = env_int('WRITE_QUEUE_BATCH', 100)
+# Seconds the status page of an applied or rejected submission is kept
+WRITE_QUEUE_KEEP = 7 * 24 * 60 * 60
+
+# Rows per page on the venue, artist and show listings
+PAGE_SIZE = 50
+
+# Most recent past shows listed on a venue or artist page, None lists them all
+PAST_SHOWS_LIMIT = None
+
+# Best ranked venue or artist search results listed
+SEARCH_LIMIT = 50
+
+# Longest venue or artist list offered as a <select> on the show form,
+# past it the form looks names up as they are typed
+SHOW_FORM_MAX_CHOICES = 500
+TYPEAHEAD_LIMIT = 10
+
+# Seconds between refreshes of the upcoming show counts of the venue
+# listing as shows start, 0 leaves them to `flask refresh-venue-summary`
+VENUE_SUMMARY_REFRESH = 300
+
+# Page cache of the home page and listings, 'lru', 'filesystem' or 'null'.
+# Use 'filesystem' with several workers, it also shares the API table versions
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'filesystem' if PRODUCTION else 'lru')
+# Entries kept, per namespace with 'filesystem'
+CACHE_MAXSIZE = 1024
+CACHE_DIR = os.path.join(tempfile.gettempdir(), 'fyyur-cache')
+
+# Serve the bundled, fingerprinted assets of `flask build-assets` (see
+# assets.py) with far-future cache headers, instead of the sources
+ASSETS_ENABLED = env_bool('ASSETS_ENABLED', PRODUCTION)
+
+# Seconds an API venue or artist ETag stays valid without a write, shows
+# that started meanwhile move from upcoming to past once it changes
+API_TIME_BUCKET = 60
+
+# Times a request may send the same statement (other parameters aside)
+# before it is logged as an N+1 query pattern, which fails the tests
+N_PLUS_ONE_THRESHOLD = 10
 
 #Remove annoying error message
 SQLALCHEMY_TRACK_MODIFICATIONS = False
@@ -2,7 +2,7 @@ from datetime import datetime
 from flask_wtf import Form
 from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
 
-from wtforms.validators import DataRequired, Optional, AnyOf, URL, Regexp
+from wtforms.validators import DataRequired, Optional, AnyOf, URL, Regexp, ValidationError
 
 genresList = [
             ('Alternative', 'Alternative'),
@@ -96,6 +96,14 @@ class ShowForm(Form):
         validators=[DataRequired()],
         default= datetime.today()
     )
+    end_time = DateTimeField(
+        'end_time',
+        validators=[Optional()]
+    )
+
+    def validate_end_time(self, field):
+        if field.data and self.start_time.data and field.data <= self.start_time.data:
+            raise ValidationError('The show must end after it starts.')
 
 class VenueForm(Form):
     csrf = False
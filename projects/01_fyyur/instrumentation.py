@@ -0,0 +1,131 @@
+#----------------------------------------------------------------------------#
+# Per-request SQL instrumentation.
+#
+# Counts the statements every request sends, the time spent in the database
+# and how often each statement fingerprint (the SQL with its literals and IN
+# lists collapsed) repeats. The totals are sent back as a Server-Timing
+# header and logged as one JSON line per request on the 'models.sql' logger
+# (the 'sql' child of app.logger, named after models.py creating the app).
+# A fingerprint repeated N_PLUS_ONE_THRESHOLD times or more is an N+1 query
+# pattern: it is logged as a warning, and raised as NPlusOneError when testing.
+#----------------------------------------------------------------------------#
+
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import Counter
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+NUMBER = re.compile(r'\b\d+(\.\d+)?\b')
+STRING = re.compile(r"'(?:[^']|'')*'")
+PLACEHOLDER_LIST = re.compile(r'\(\s*(\?|%\([^)]*\)s|%s)(\s*,\s*(\?|%\([^)]*\)s|%s))*\s*\)')
+NUMBERED_PARAMETER = re.compile(r'%\((\w+?)_\d+\)s')
+WHITESPACE = re.compile(r'\s+')
+
+
+class NPlusOneError(Exception):
+  pass
+
+
+def fingerprint(statement):
+  """Statement with literals, parameter names and IN lists normalized"""
+  statement = STRING.sub('?', statement)
+  statement = NUMBERED_PARAMETER.sub(r'%(\1)s', statement)
+  statement = PLACEHOLDER_LIST.sub('(?)', statement)
+  statement = NUMBER.sub('?', statement)
+  return WHITESPACE.sub(' ', statement).strip()
+
+
+class RequestQueries(object):
+  """Statements of one request"""
+
+  def __init__(self):
+    self.start = time.perf_counter()
+    self.count = 0
+    self.seconds = 0.0
+    self.fingerprints = Counter()
+    # concurrent reads (concurrent_reads.py) record from several threads
+    self.lock = threading.Lock()
+
+  def record(self, statement, seconds):
+    statement = fingerprint(statement)
+    with self.lock:
+      self.count += 1
+      self.seconds += seconds
+      self.fingerprints[statement] += 1
+
+  def repeated(self, threshold):
+    """(fingerprint, count) of the statements sent threshold times or more, most repeated first"""
+    return [(statement, count) for statement, count in self.fingerprints.most_common() if count >= threshold]
+
+
+class QueryStats(object):
+  """Instruments the requests of app, see the module comment"""
+
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.extensions['query_stats'] = self
+    self.app = app
+    self.logger = app.logger.getChild('sql')
+    # every engine, Flask-SQLAlchemy creates db.engine lazily and per database url
+    event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+    app.before_request(self._before_request)
+    app.after_request(self._after_request)
+
+  def current(self):
+    """RequestQueries of the current request, None outside of requests"""
+    return g.get('_request_queries') if has_request_context() else None
+
+  def attach(self, queries):
+    """Records the statements of the current context into queries, those of another thread's request"""
+    g._request_queries = queries
+
+  def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+  def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info['query_start_time'].pop()
+    queries = self.current()
+    if queries is not None:
+      queries.record(statement, seconds)
+
+  def _before_request(self):
+    g._request_queries = RequestQueries()
+
+  def _after_request(self, response):
+    queries = self.current()
+    if queries is None:
+      return response
+    threshold = self.app.config['N_PLUS_ONE_THRESHOLD']
+    repeated = queries.repeated(threshold)
+
+    response.headers.add('Server-Timing', f'db;dur={queries.seconds * 1000:.2f};desc="{queries.count} queries"')
+    response.headers.add('Server-Timing', f'app;dur={(time.perf_counter() - queries.start) * 1000:.2f}')
+    if repeated:
+      response.headers.add('Server-Timing', f'n-plus-one;desc="{repeated[0][1]} repeats"')
+
+    line = json.dumps({
+      'method': request.method,
+      'path': request.full_path.rstrip('?'),
+      'status': response.status_code,
+      'queries': queries.count,
+      'db_ms': round(queries.seconds * 1000, 2),
+      'repeated': [{'fingerprint': hashlib.sha1(statement.encode()).hexdigest()[:12],
+                    'count': count, 'statement': statement} for statement, count in repeated]
+    })
+    if repeated:
+      self.logger.warning(line)
+      if self.app.testing:
+        statement, count = repeated[0]
+        raise NPlusOneError(f'{request.method} {request.path} sent {count} times: {statement}')
+    else:
+      self.logger.info(line)
+    return response
@@ -0,0 +1,30 @@
+"""delete the shows of a venue or artist in the database (ON DELETE CASCADE)
+
+Revision ID: 5a9e7d31c0f4
+Revises: c4d2a6e1f9b3
+Create Date: 2026-10-18 12:40:55.127930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a9e7d31c0f4'
+down_revision = 'c4d2a6e1f9b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.drop_constraint('Show_artist_id_fkey', 'Show', type_='foreignkey')
+    op.drop_constraint('Show_venue_id_fkey', 'Show', type_='foreignkey')
+    op.create_foreign_key('Show_artist_id_fkey', 'Show', 'Artist', ['artist_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('Show_venue_id_fkey', 'Show', 'Venue', ['venue_id'], ['id'], ondelete='CASCADE')
+
+
+def downgrade():
+    op.drop_constraint('Show_venue_id_fkey', 'Show', type_='foreignkey')
+    op.drop_constraint('Show_artist_id_fkey', 'Show', type_='foreignkey')
+    op.create_foreign_key('Show_venue_id_fkey', 'Show', 'Venue', ['venue_id'], ['id'])
+    op.create_foreign_key('Show_artist_id_fkey', 'Show', 'Artist', ['artist_id'], ['id'])
@@ -0,0 +1,51 @@
+"""add indexes for the listing, detail, form and search queries
+
+Revision ID: 8b1f4c2d9a7e
+Revises: f1a3c5e7b9d2
+Create Date: 2026-10-18 10:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b1f4c2d9a7e'
+down_revision = 'f1a3c5e7b9d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    op.create_index('ix_venue_state_city_id', 'Venue', ['state', 'city', 'id'], unique=False)
+    op.create_index('ix_venue_seeking_talent', 'Venue', ['id', 'name'], unique=False,
+                    postgresql_where=sa.text('seeking_talent'))
+    op.create_index('ix_venue_name_trgm', 'Venue', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+    op.create_index('ix_artist_name_id', 'Artist', ['name', 'id'], unique=False)
+    op.create_index('ix_artist_seeking_venue', 'Artist', ['id', 'name'], unique=False,
+                    postgresql_where=sa.text('seeking_venue'))
+    op.create_index('ix_artist_name_trgm', 'Artist', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+    op.create_index('ix_show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], unique=False)
+    op.create_index('ix_show_start_time_id', 'Show', ['start_time', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_show_start_time_id', table_name='Show')
+    op.drop_index('ix_show_artist_id_start_time', table_name='Show')
+    op.drop_index('ix_show_venue_id_start_time', table_name='Show')
+
+    op.drop_index('ix_artist_name_trgm', table_name='Artist')
+    op.drop_index('ix_artist_seeking_venue', table_name='Artist')
+    op.drop_index('ix_artist_name_id', table_name='Artist')
+
+    op.drop_index('ix_venue_name_trgm', table_name='Venue')
+    op.drop_index('ix_venue_seeking_talent', table_name='Venue')
+    op.drop_index('ix_venue_state_city_id', table_name='Venue')
+    # pg_trgm is left installed, other database objects may depend on it
@@ -0,0 +1,34 @@
+"""optional show end time, a venue or an artist is booked once at a time
+
+Revision ID: a4f6c8e0b2d5
+Revises: e7c3b5a2d8f1
+Create Date: 2026-10-18 15:22:37.918402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4f6c8e0b2d5'
+down_revision = 'e7c3b5a2d8f1'
+branch_labels = None
+depends_on = None
+
+# shows without an end time last two hours, as in models.SHOW_RANGE
+SHOW_RANGE = "tsrange(start_time, coalesce(end_time, start_time + interval '2 hours'))"
+
+
+def upgrade():
+    op.add_column('Show', sa.Column('end_time', sa.DateTime(), nullable=True))
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    # fails while overlapping shows exist, they have to be moved or deleted first
+    for column in ('venue_id', 'artist_id'):
+        op.execute(f'ALTER TABLE "Show" ADD CONSTRAINT "Show_{column}_no_overlap" '
+                   f'EXCLUDE USING gist ({column} WITH =, {SHOW_RANGE} WITH &&)')
+
+
+def downgrade():
+    op.drop_constraint('Show_artist_id_no_overlap', 'Show')
+    op.drop_constraint('Show_venue_id_no_overlap', 'Show')
+    op.drop_column('Show', 'end_time')
@@ -0,0 +1,26 @@
+"""GIN indexes on the genres of venues and artists
+
+Revision ID: b9d3e5f7a1c2
+Revises: a4f6c8e0b2d5
+Create Date: 2026-10-18 16:41:09.274518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9d3e5f7a1c2'
+down_revision = 'a4f6c8e0b2d5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_venue_genres', 'Venue', ['genres'], unique=False, postgresql_using='gin')
+    op.create_index('ix_artist_genres', 'Artist', ['genres'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_artist_genres', table_name='Artist')
+    op.drop_index('ix_venue_genres', table_name='Venue')
@@ -0,0 +1,50 @@
+"""add full text search vectors to venues and artists
+
+Revision ID: c4d2a6e1f9b3
+Revises: 8b1f4c2d9a7e
+Create Date: 2026-10-18 11:02:17.804452
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d2a6e1f9b3'
+down_revision = '8b1f4c2d9a7e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+    CREATE OR REPLACE FUNCTION fyyur_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+      NEW.search_vector :=
+        setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(NEW.city, '') || ' ' || coalesce(NEW.state, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(array_to_string(NEW.genres, ' '), '')), 'C');
+      RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """)
+
+    for table in ('Venue', 'Artist'):
+        op.add_column(table, sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+        op.execute(f'''
+        CREATE TRIGGER "{table}_search_vector_update" BEFORE INSERT OR UPDATE
+        ON "{table}" FOR EACH ROW EXECUTE PROCEDURE fyyur_search_vector_update()
+        ''')
+        # fire the trigger once for the existing rows
+        op.execute(f'UPDATE "{table}" SET name = name')
+        op.create_index(f'ix_{table.lower()}_search_vector', table, ['search_vector'],
+                        unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        op.drop_index(f'ix_{table.lower()}_search_vector', table_name=table)
+        op.execute(f'DROP TRIGGER "{table}_search_vector_update" ON "{table}"')
+        op.drop_column(table, 'search_vector')
+    op.execute('DROP FUNCTION fyyur_search_vector_update()')
@@ -0,0 +1,29 @@
+"""Tokens of the applied queued submissions
+
+Revision ID: d2f4a6c8e0b1
+Revises: b9d3e5f7a1c2
+Create Date: 2026-10-18 18:02:37.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2f4a6c8e0b1'
+down_revision = 'b9d3e5f7a1c2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('AppliedWrite',
+    sa.Column('token', sa.String(length=32), nullable=False),
+    sa.Column('record_id', sa.Integer(), nullable=True),
+    sa.Column('applied_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('token')
+    )
+
+
+def downgrade():
+    op.drop_table('AppliedWrite')
@@ -0,0 +1,46 @@
+"""venue summary with upcoming show counts backing the venue listing
+
+Revision ID: e7c3b5a2d8f1
+Revises: 5a9e7d31c0f4
+Create Date: 2026-10-18 14:05:12.402611
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7c3b5a2d8f1'
+down_revision = '5a9e7d31c0f4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('VenueSummary',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=True),
+    sa.Column('city', sa.String(length=120), nullable=False),
+    sa.Column('state', sa.String(length=120), nullable=False),
+    sa.Column('num_upcoming_shows', sa.Integer(), nullable=False),
+    sa.Column('next_show_time', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['id'], ['Venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_venue_summary_state_city_id', 'VenueSummary', ['state', 'city', 'id'], unique=False)
+    op.create_index('ix_venue_summary_next_show_time', 'VenueSummary', ['next_show_time'], unique=False)
+
+    # start_time is a timestamp without time zone, compared to the local time like the app does
+    op.execute("""
+        INSERT INTO "VenueSummary" (id, name, city, state, num_upcoming_shows, next_show_time)
+        SELECT "Venue".id, "Venue".name, "Venue".city, "Venue".state, count("Show".id), min("Show".start_time)
+        FROM "Venue" LEFT OUTER JOIN "Show"
+          ON "Show".venue_id = "Venue".id AND "Show".start_time >= LOCALTIMESTAMP
+        GROUP BY "Venue".id
+    """)
+
+
+def downgrade():
+    op.drop_index('ix_venue_summary_next_show_time', table_name='VenueSummary')
+    op.drop_index('ix_venue_summary_state_city_id', table_name='VenueSummary')
+    op.drop_table('VenueSummary')
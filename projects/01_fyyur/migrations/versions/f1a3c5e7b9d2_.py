@@ -0,0 +1,32 @@
+"""Sort keys of the keyset paginated listings are NOT NULL
+
+Revision ID: f1a3c5e7b9d2
+Revises: 3e764566670a
+Create Date: 2026-10-18 09:58:13.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1a3c5e7b9d2'
+down_revision = '3e764566670a'
+branch_labels = None
+depends_on = None
+
+# a NULL sort key compares as unknown, keyset pages would skip its row
+SORT_KEYS = [('Venue', 'city'), ('Venue', 'state'), ('Artist', 'name')]
+
+
+def upgrade():
+    for table, column in SORT_KEYS:
+        op.execute(f'UPDATE "{table}" SET {column} = \'\' WHERE {column} IS NULL')
+        op.alter_column(table, column, existing_type=sa.String(length=None if column == 'name' else 120),
+                        nullable=False)
+
+
+def downgrade():
+    for table, column in reversed(SORT_KEYS):
+        op.alter_column(table, column, existing_type=sa.String(length=None if column == 'name' else 120),
+                        nullable=True)
@@ -6,30 +6,96 @@ from flask import Flask
 from flask_migrate import Migrate
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event
+from sqlalchemy.engine import Engine
+from sqlite3 import Connection as SQLite3Connection
 from datetime import datetime
+from search import TSVectorType, SEARCH_VECTOR_FUNCTION, search_vector_trigger
 
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
+class PooledSQLAlchemy(SQLAlchemy):
+    """Applies the DB_* pool and statement settings of config.py to Postgres engines.
+
+    Other databases keep the defaults of Flask-SQLAlchemy. Its 2.5 releases
+    unpack the (sa_url, options) apply_driver_hacks returns, 2.4 ignores it;
+    3.0 has no apply_driver_hacks, hence the pin in requirements.txt.
+    """
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        result = super().apply_driver_hacks(app, sa_url, options)
+        dialect = sa_url.get_dialect()
+        if dialect.name != 'postgresql':
+            return result
+        config = app.config
+        options.update(
+            pool_size=config['DB_POOL_SIZE'],
+            max_overflow=config['DB_MAX_OVERFLOW'],
+            pool_timeout=config['DB_POOL_TIMEOUT'],
+            pool_recycle=config['DB_POOL_RECYCLE'],
+            pool_pre_ping=config['DB_POOL_PRE_PING'],
+        )
+        if dialect.driver != 'psycopg2':
+            return result
+        mode = config['DB_EXECUTEMANY_MODE']
+        if mode in ('values', 'batch'):
+            options['executemany_mode'] = mode
+            options[f'executemany_{mode}_page_size'] = config['DB_EXECUTEMANY_PAGE_SIZE']
+        if config['DB_STATEMENT_TIMEOUT']:
+            connect_args = options.setdefault('connect_args', {})
+            connect_args['options'] = f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT']}"
+        return result
+
+
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
+db = PooledSQLAlchemy(app)
 migrate = Migrate(app,db)
 
+# The trigram indexes used by the typeahead ilike need the pg_trgm extension
+event.listen(db.metadata, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+event.listen(db.metadata, 'before_create', SEARCH_VECTOR_FUNCTION.execute_if(dialect='postgresql'))
+# The show overlap constraints compare venue and artist ids in GiST indexes
+event.listen(db.metadata, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS btree_gist').execute_if(dialect='postgresql'))
+
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite only enforces foreign keys, and so ON DELETE CASCADE, when asked to
+    if isinstance(dbapi_connection, SQLite3Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        # listing grouped by area
+        db.Index('ix_venue_state_city_id', 'state', 'city', 'id'),
+        # venues offered on the show forms
+        db.Index('ix_venue_seeking_talent', 'id', 'name', postgresql_where=db.text('seeking_talent')),
+        # ilike('%term%') of the show form typeahead
+        db.Index('ix_venue_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        # full text search, see search.py
+        db.Index('ix_venue_search_vector', 'search_vector', postgresql_using='gin'),
+        # genres @> ARRAY[...] filters and facet counts
+        db.Index('ix_venue_genres', 'genres', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     genres = db.Column("genres", db.ARRAY(db.String()), nullable=False)
-    city = db.Column(db.String(120))
-    state = db.Column(db.String(120))
+    # sort keys of the listing, see pagination.py
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.String(120), nullable=False)
     address = db.Column(db.String(120))
     phone = db.Column(db.String(120))
     website = db.Column(db.String(120))
@@ -37,16 +103,30 @@ class Venue(db.Model):
     facebook_link = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean())
     seeking_description = db.Column(db.String(500))
-    shows = db.relationship('Show', backref='venue', lazy=True, cascade="all, delete")
+    search_vector = db.deferred(db.Column(TSVectorType()))
+    shows = db.relationship('Show', backref='venue', lazy=True, cascade="all, delete", passive_deletes=True)
 
     def __repr__(self):
       return f'<Venue {self.id} name: {self.name}>'
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        # listing sorted by name
+        db.Index('ix_artist_name_id', 'name', 'id'),
+        # artists offered on the show forms
+        db.Index('ix_artist_seeking_venue', 'id', 'name', postgresql_where=db.text('seeking_venue')),
+        # ilike('%term%') of the show form typeahead
+        db.Index('ix_artist_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        # full text search, see search.py
+        db.Index('ix_artist_search_vector', 'search_vector', postgresql_using='gin'),
+        # genres @> ARRAY[...] filters and facet counts
+        db.Index('ix_artist_genres', 'genres', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
+    # sort key of the listing, see pagination.py
+    name = db.Column(db.String, nullable=False)
     genres = db.Column("genres", db.ARRAY(db.String()), nullable=False)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
@@ -56,18 +136,71 @@ class Artist(db.Model):
     facebook_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean())
     seeking_description = db.Column(db.String(500))
-    shows = db.relationship('Show', backref='artist', lazy=True, cascade="all, delete")
+    search_vector = db.deferred(db.Column(TSVectorType()))
+    shows = db.relationship('Show', backref='artist', lazy=True, cascade="all, delete", passive_deletes=True)
 
     def __repr__(self):
       return f'<Artist {self.id} name: {self.name}>'
 
+for model in (Venue, Artist):
+    event.listen(model.__table__, 'after_create',
+                 search_vector_trigger(model.__tablename__).execute_if(dialect='postgresql'))
+
 class Show(db.Model):
     __tablename__ = 'Show'
+    __table_args__ = (
+        # shows of a venue or an artist, split into past and upcoming
+        db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+        # listing in start time order
+        db.Index('ix_show_start_time_id', 'start_time', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
-    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), nullable=False)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), nullable=False)
     start_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # shows without an end time last scheduling.DEFAULT_DURATION
+    end_time = db.Column(db.DateTime)
+
+    def __repr__(self):
+      return f'<Show {self.id}, Artist {self.artist_id}, Venue {self.venue_id}>'
+
+# A venue or an artist is booked once at a time, see scheduling.py
+SHOW_RANGE = "tsrange(start_time, coalesce(end_time, start_time + interval '2 hours'))"
+for column in ('venue_id', 'artist_id'):
+    event.listen(Show.__table__, 'after_create', DDL(
+        f'ALTER TABLE "Show" ADD CONSTRAINT "Show_{column}_no_overlap" '
+        f'EXCLUDE USING gist ({column} WITH =, {SHOW_RANGE} WITH &&)'
+    ).execute_if(dialect='postgresql'))
+
+class VenueSummary(db.Model):
+    """Listing row of a venue and its upcoming show count, kept up to date by summary.py"""
+    __tablename__ = 'VenueSummary'
+    __table_args__ = (
+        # listing grouped by area
+        db.Index('ix_venue_summary_state_city_id', 'state', 'city', 'id'),
+        # venues whose next show has started
+        db.Index('ix_venue_summary_next_show_time', 'next_show_time'),
+    )
+
+    id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True)
+    name = db.Column(db.String)
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.String(120), nullable=False)
+    num_upcoming_shows = db.Column(db.Integer, nullable=False, default=0)
+    next_show_time = db.Column(db.DateTime)
+
+    def __repr__(self):
+      return f'<VenueSummary {self.id} upcoming shows: {self.num_upcoming_shows}>'
+
+class AppliedWrite(db.Model):
+    """Token of a queued submission, written in the transaction applying it (see writequeue.py)"""
+    __tablename__ = 'AppliedWrite'
+
+    token = db.Column(db.String(32), primary_key=True)
+    record_id = db.Column(db.Integer)
+    applied_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
     def __repr__(self):
-      return f'<Show {self.id}, Artist {self.artist_id}, Venue {self.venue_id}>'
\ No newline at end of file
+      return f'<AppliedWrite {self.token}, record {self.record_id}>'
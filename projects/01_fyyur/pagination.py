@@ -0,0 +1,34 @@
+#----------------------------------------------------------------------------#
+# Keyset pagination.
+#----------------------------------------------------------------------------#
+
+from flask import abort
+from sqlalchemy import select, tuple_
+
+
+def keyset_page(query, model, order_by, after=None, per_page=50):
+  """Returns one page of query ordered by order_by, starting after the row with id after.
+
+  order_by must end with model.id so the ordering is unique, and its columns
+  must be NOT NULL: a NULL sort key compares as unknown, its row would never
+  be reached. The cursor is the id of the last row of the previous page; the
+  sort key of that row is looked up in the same statement, so the database
+  seeks straight to the page through the index on order_by instead of
+  counting past OFFSET rows. Aborts with 404 when that row no longer exists.
+  Returns (rows, next_after) where next_after is None on the last page.
+  """
+  if after is not None:
+    anchor = select(list(order_by)).where(model.id == after).correlate(None).as_scalar()
+    query = query.filter(tuple_(*order_by) > anchor)
+
+  rows = query.order_by(*order_by).limit(per_page + 1).all()
+
+  # an empty page after a deleted row would read as the last page
+  if not rows and after is not None and not query.session.query(model.id).filter(model.id == after).count():
+    abort(404)
+
+  next_after = None
+  if len(rows) > per_page:
+    rows = rows[:per_page]
+    next_after = rows[-1].id
+  return rows, next_after
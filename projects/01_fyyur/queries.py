@@ -0,0 +1,164 @@
+#----------------------------------------------------------------------------#
+# Read queries shared by the controllers.
+#----------------------------------------------------------------------------#
+
+import datetime
+from itertools import groupby
+from flask import abort
+from sqlalchemy import String, and_, case, cast, func, literal_column, or_, select
+from sqlalchemy.dialects.postgresql import ARRAY, array
+from models import db, Venue, Artist, Show, VenueSummary
+from pagination import keyset_page
+from forms import genresList
+from viewmodels import (VenueView, ArtistView, VenueDetails, ArtistDetails,
+                        VenueShowView, ArtistShowView, ShowView)
+
+GENRES = [value for value, label in genresList]
+
+
+def genre_array(*genres):
+  # the genres columns are varchar[], a text[] literal would not match the @> operator
+  return cast(array(genres), ARRAY(String))
+
+
+def has_genre(model, genre):
+  """genres @> ARRAY[genre], served by the GIN index on the genres of model"""
+  return model.genres.op('@>')(genre_array(genre))
+
+
+def genre_facets(model):
+  """(genre, count) of the venues or artists listing every genre of the forms, in one
+  aggregate query probing the GIN index once per genre"""
+  genre = literal_column('genre', String)
+  count = func.count(model.id)
+  return db.session.query(genre, count) \
+    .select_from(func.unnest(genre_array(*GENRES)).alias('genre')) \
+    .outerjoin(model, has_genre(model, genre)) \
+    .group_by(genre).order_by(count.desc(), genre).all()
+
+
+def venues_page(after=None, per_page=50, genre=None):
+  """(rows, next_after) of one page of (id, name, city, state, num_upcoming_shows)
+  venues ordered by area, read from the venue summary (see summary.py), only
+  those listing genre when given"""
+  query = db.session.query(VenueSummary.id, VenueSummary.name, VenueSummary.city, VenueSummary.state,
+                           VenueSummary.num_upcoming_shows)
+  if genre is not None:
+    query = query.join(Venue, Venue.id == VenueSummary.id).filter(has_genre(Venue, genre))
+  return keyset_page(query, VenueSummary, (VenueSummary.state, VenueSummary.city, VenueSummary.id),
+                     after=after, per_page=per_page)
+
+
+def venue_areas(rows):
+  """Groups venue rows ordered by area into the areas the venues page lists"""
+  return ({
+    "city": city,
+    "state": state,
+    "venues": [{
+      "id": venue.id,
+      "name": venue.name,
+      "num_upcoming_shows": venue.num_upcoming_shows
+    } for venue in venues]
+  } for (city, state), venues in groupby(rows, key=lambda row: (row.city, row.state)))
+
+
+def artists_page(after=None, per_page=50, genre=None):
+  """(rows, next_after) of one page of (id, name) artists ordered by name,
+  only those listing genre when given"""
+  query = db.session.query(Artist.id, Artist.name)
+  if genre is not None:
+    query = query.filter(has_genre(Artist, genre))
+  return keyset_page(query, Artist, (Artist.name, Artist.id), after=after, per_page=per_page)
+
+
+def shows_page(after=None, per_page=50):
+  """(shows, next_after) of one page of shows in start time order, each show a ShowView"""
+  rows, next_after = keyset_page(
+    db.session.query(Show.id, Show.start_time, Venue.id.label('venue_id'), Venue.name.label('venue_name'),
+                     Artist.id.label('artist_id'), Artist.name.label('artist_name'),
+                     Artist.image_link.label('artist_image_link')).join(Venue).join(Artist),
+    Show, (Show.start_time, Show.id), after=after, per_page=per_page)
+
+  shows = (ShowView(show.venue_id, show.venue_name, show.artist_id, show.artist_name, show.artist_image_link,
+                    show.start_time.strftime("%m/%d/%Y, %H:%M:%S"))
+           for show in rows)
+  return shows, next_after
+
+
+def entity_view(view, model, entity_id):
+  """view of the venue or artist entity_id, read from its columns without loading the model"""
+  row = db.session.query(*view.columns(model)).filter(model.id == entity_id).first()
+  if row is None:
+    abort(404)
+  return view(*row)
+
+
+def entity_with_shows(view, model, entity_id, partner, past_limit=None):
+  """Reads the fields of view of an artist or venue, its shows and their partner
+  entity in a single query, selecting columns only.
+
+  Shows are split into past and upcoming by the database, which also counts
+  them, so the counts stay right when past_limit caps how many of the most
+  recent past shows are returned.
+  Returns (fields, past_shows, upcoming_shows, past_count, upcoming_count) where
+  fields are the values of view.fields and each show a VenueShowView or ArtistShowView.
+  """
+  now = datetime.datetime.now()
+  entity_fk = Show.venue_id if model is Venue else Show.artist_id
+  partner_fk = Show.artist_id if model is Venue else Show.venue_id
+  show_view = VenueShowView if model is Venue else ArtistShowView
+
+  is_past = case([(Show.start_time < now, True)], else_=False)
+  shows = db.session.query(
+      entity_fk.label('entity_id'),
+      Show.start_time.label('start_time'),
+      partner.id.label('partner_id'),
+      partner.name.label('partner_name'),
+      partner.image_link.label('partner_image_link'),
+      is_past.label('is_past'),
+      func.row_number().over(partition_by=is_past, order_by=Show.start_time.desc()).label('past_rank')
+    ).join(partner, partner.id == partner_fk).filter(entity_fk == entity_id).subquery()
+
+  join_on = shows.c.entity_id == model.id
+  if past_limit is not None:
+    join_on = and_(join_on, or_(shows.c.is_past == False, shows.c.past_rank <= past_limit))
+
+  def count_shows(condition):
+    return select([func.count(Show.id)]).where(and_(entity_fk == model.id, condition)).as_scalar()
+
+  rows = db.session.query(
+      *view.columns(model),
+      count_shows(Show.start_time < now).label('past_count'),
+      count_shows(Show.start_time >= now).label('upcoming_count'),
+      shows.c.start_time.label('show_start_time'), shows.c.partner_id, shows.c.partner_name,
+      shows.c.partner_image_link, shows.c.is_past
+    ).outerjoin(shows, join_on).filter(model.id == entity_id) \
+    .order_by(shows.c.start_time.desc()).all()
+
+  if not rows:
+    abort(404)
+
+  past_shows = []
+  upcoming_shows = []
+  for row in rows:
+    if row.show_start_time is None:
+      continue
+    (past_shows if row.is_past else upcoming_shows).append(show_view(
+      row.partner_id, row.partner_name, row.partner_image_link,
+      row.show_start_time.strftime("%m/%d/%Y, %H:%M:%S")))
+  # past shows are listed most recent first, upcoming shows soonest first
+  upcoming_shows.reverse()
+
+  return rows[0][:len(view.fields)], past_shows, upcoming_shows, rows[0].past_count, rows[0].upcoming_count
+
+
+def venue_details(venue_id, past_limit=None):
+  """VenueDetails of the venue detail page"""
+  fields, *shows = entity_with_shows(VenueView, Venue, venue_id, Artist, past_limit)
+  return VenueDetails(*fields, *shows)
+
+
+def artist_details(artist_id, past_limit=None):
+  """ArtistDetails of the artist detail page"""
+  fields, *shows = entity_with_shows(ArtistView, Artist, artist_id, Venue, past_limit)
+  return ArtistDetails(*fields, *shows)
@@ -0,0 +1,219 @@
+#----------------------------------------------------------------------------#
+# Show scheduling: booking conflicts and free slots.
+#
+# A show occupies [start_time, end_time), or DEFAULT_DURATION from its start
+# when it has no end time. A venue or an artist can only be booked once at a
+# time. Two exclusion constraints over a tsrange of the show enforce it
+# (see models.py), their GiST indexes also serve the conflict and free slot
+# queries. ScheduleIndex, interval trees per venue and per artist, checks
+# the shows of an import against each other before any is inserted (see
+# bulk.py).
+#----------------------------------------------------------------------------#
+
+import random
+from datetime import timedelta
+from collections import defaultdict
+from sqlalchemy import func, literal_column
+from models import Show, SHOW_RANGE
+
+# as in SHOW_RANGE
+DEFAULT_DURATION = timedelta(hours=2)
+
+
+def show_range():
+  """tsrange of a Show row, the very expression the exclusion constraints index"""
+  return literal_column(SHOW_RANGE)
+
+
+def show_end(start_time, end_time):
+  return end_time or start_time + DEFAULT_DURATION
+
+
+class ScheduleConflict(Exception):
+
+  def __init__(self, conflicts):
+    super().__init__(conflicts)
+    # (kind, show id, start, end) of the shows in the way, kind 'venue' or 'artist'
+    self.conflicts = conflicts
+
+  def __str__(self):
+    return '; '.join(f'the {kind} is booked from {start:%Y-%m-%d %H:%M} to {end:%Y-%m-%d %H:%M}'
+                     for kind, show_id, start, end in self.conflicts)
+
+
+class _Node(object):
+  __slots__ = ('key', 'end', 'priority', 'left', 'right', 'max_end')
+
+  def __init__(self, start, end, show_id):
+    self.key = (start, show_id)
+    self.end = end
+    self.priority = random.random()
+    self.left = self.right = None
+    self.max_end = end
+
+
+def _update(node):
+  node.max_end = node.end
+  for child in (node.left, node.right):
+    if child is not None and child.max_end > node.max_end:
+      node.max_end = child.max_end
+
+
+def _split(node, key):
+  """(nodes with keys < key, nodes with keys >= key)"""
+  if node is None:
+    return None, None
+  if node.key < key:
+    node.right, right = _split(node.right, key)
+    _update(node)
+    return node, right
+  left, node.left = _split(node.left, key)
+  _update(node)
+  return left, node
+
+
+def _merge(left, right):
+  if left is None:
+    return right
+  if right is None:
+    return left
+  if left.priority > right.priority:
+    left.right = _merge(left.right, right)
+    _update(left)
+    return left
+  right.left = _merge(left, right.left)
+  _update(right)
+  return right
+
+
+def _insert(node, new):
+  if node is None:
+    return new
+  if new.priority > node.priority:
+    new.left, new.right = _split(node, new.key)
+    _update(new)
+    return new
+  if new.key < node.key:
+    node.left = _insert(node.left, new)
+  else:
+    node.right = _insert(node.right, new)
+  _update(node)
+  return node
+
+
+def _delete(node, key):
+  if node is None:
+    return None
+  if key == node.key:
+    return _merge(node.left, node.right)
+  if key < node.key:
+    node.left = _delete(node.left, key)
+  else:
+    node.right = _delete(node.right, key)
+  _update(node)
+  return node
+
+
+class IntervalTree(object):
+  """[start, end) intervals of shows in a treap ordered by (start, show id),
+  every node knowing the latest end of its subtree, so an overlap query only
+  descends into subtrees that can hold an overlapping interval"""
+
+  def __init__(self):
+    self.root = None
+    self.size = 0
+
+  def add(self, start, end, show_id):
+    self.root = _insert(self.root, _Node(start, end, show_id))
+    self.size += 1
+
+  def remove(self, start, show_id):
+    self.root = _delete(self.root, (start, show_id))
+    self.size -= 1
+
+  def overlapping(self, start, end):
+    """(start, end, show id) of the intervals overlapping [start, end), in start order"""
+    found = []
+
+    def visit(node):
+      if node is None or node.max_end <= start:
+        return
+      visit(node.left)
+      if node.key[0] < end:
+        if node.end > start:
+          found.append((node.key[0], node.end, node.key[1]))
+        visit(node.right)
+
+    visit(self.root)
+    return found
+
+
+class ScheduleIndex(object):
+  """Interval trees of the shows of every venue and artist"""
+
+  def __init__(self):
+    self.trees = {'venue': defaultdict(IntervalTree), 'artist': defaultdict(IntervalTree)}
+    # show id -> (venue id, artist id, start, end)
+    self.shows = {}
+
+  def build(self, rows):
+    self.trees = {'venue': defaultdict(IntervalTree), 'artist': defaultdict(IntervalTree)}
+    self.shows = {}
+    for row in rows:
+      self.add(row.id, row.venue_id, row.artist_id, row.start_time, row.end_time)
+
+  def add(self, show_id, venue_id, artist_id, start_time, end_time):
+    self.remove(show_id)
+    end = show_end(start_time, end_time)
+    self.shows[show_id] = (venue_id, artist_id, start_time, end)
+    self.trees['venue'][venue_id].add(start_time, end, show_id)
+    self.trees['artist'][artist_id].add(start_time, end, show_id)
+
+  def remove(self, show_id):
+    show = self.shows.pop(show_id, None)
+    if show is not None:
+      venue_id, artist_id, start, end = show
+      self.trees['venue'][venue_id].remove(start, show_id)
+      self.trees['artist'][artist_id].remove(start, show_id)
+
+  def overlapping(self, kind, entity_id, start, end):
+    tree = self.trees[kind].get(entity_id)
+    return tree.overlapping(start, end) if tree is not None else []
+
+
+def booked(session, kind, entity_id, start, end, exclude_show_id=None):
+  """(start, end, show id) of the shows of a venue or artist overlapping [start, end), in start order"""
+  column = Show.venue_id if kind == 'venue' else Show.artist_id
+  query = session.query(Show.start_time, Show.end_time, Show.id) \
+    .filter(column == entity_id, show_range().op('&&')(func.tsrange(start, end))) \
+    .order_by(Show.start_time, Show.id)
+  return [(row.start_time, show_end(row.start_time, row.end_time), row.id)
+          for row in query if row.id != exclude_show_id]
+
+
+def check_conflicts(session, venue_id, artist_id, start_time, end_time=None, exclude_show_id=None):
+  """Raises ScheduleConflict when the venue or the artist is booked during the show"""
+  end = show_end(start_time, end_time)
+  conflicts = [(kind, show_id, booked_start, booked_end)
+               for kind, entity_id in (('venue', venue_id), ('artist', artist_id))
+               for booked_start, booked_end, show_id in booked(session, kind, entity_id, start_time, end, exclude_show_id)]
+  if conflicts:
+    raise ScheduleConflict(conflicts)
+
+
+def is_conflict_error(error):
+  """Whether an IntegrityError is an exclusion constraint rejecting an overlapping show"""
+  return getattr(error.orig, 'pgcode', None) == '23P01'
+
+
+def free_slots(session, venue_id, start, end, duration):
+  """[start, end) gaps of at least duration between the shows of a venue within [start, end)"""
+  slots = []
+  cursor = start
+  for show_start, show_end_time, show_id in booked(session, 'venue', venue_id, start, end):
+    if show_start - cursor >= duration:
+      slots.append((cursor, show_start))
+    cursor = max(cursor, show_end_time)
+  if end - cursor >= duration:
+    slots.append((cursor, end))
+  return slots
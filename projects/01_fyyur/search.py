@@ -0,0 +1,60 @@
+#----------------------------------------------------------------------------#
+# Ranked venue and artist search.
+#
+# On Postgres every Venue and Artist row carries a search_vector tsvector
+# kept up to date by a trigger (see migrations/versions/c4d2a6e1f9b3_.py)
+# and indexed with GIN, searched with to_tsquery and ranked with ts_rank_cd.
+# The name weighs A, the city and state B and the genres C.
+#----------------------------------------------------------------------------#
+
+import re
+from sqlalchemy import DDL, func
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.types import TypeDecorator, Text
+
+SEARCH_VECTOR_FUNCTION = DDL("""
+CREATE OR REPLACE FUNCTION fyyur_search_vector_update() RETURNS trigger AS $$
+BEGIN
+  NEW.search_vector :=
+    setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(NEW.city, '') || ' ' || coalesce(NEW.state, '')), 'B') ||
+    setweight(to_tsvector('simple', coalesce(array_to_string(NEW.genres, ' '), '')), 'C');
+  RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+""")
+
+
+def search_vector_trigger(table):
+  return DDL(f"""
+CREATE TRIGGER "{table}_search_vector_update" BEFORE INSERT OR UPDATE
+ON "{table}" FOR EACH ROW EXECUTE PROCEDURE fyyur_search_vector_update()
+""")
+
+
+class TSVectorType(TypeDecorator):
+  """tsvector on Postgres, plain text (never written) everywhere else"""
+  impl = Text
+
+  def load_dialect_impl(self, dialect):
+    if dialect.name == 'postgresql':
+      return dialect.type_descriptor(TSVECTOR())
+    return dialect.type_descriptor(Text())
+
+
+def tokenize(text):
+  return re.findall(r'\w+', text.lower()) if text else []
+
+
+def search(db, model, text, limit=None):
+  """(id, name) rows of model matching every word of text, best ranked first"""
+  terms = tokenize(text)
+  query = db.session.query(model.id, model.name)
+
+  if not terms:
+    return query.order_by(model.name, model.id).limit(limit).all()
+
+  tsquery = func.to_tsquery('simple', ' & '.join(term + ':*' for term in terms))
+  return query.filter(model.search_vector.op('@@')(tsquery)) \
+    .order_by(func.ts_rank_cd(model.search_vector, tsquery).desc(), model.id) \
+    .limit(limit).all()
@@ -2,3 +2,35 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// Show form typeahead: fills the datalist of an input.typeahead from its
+// data-source as the user types and copies the id of the picked name into
+// the hidden input named by data-target.
+document.addEventListener('DOMContentLoaded', function () {
+  document.querySelectorAll('input.typeahead').forEach(function (input) {
+    var options = document.getElementById(input.getAttribute('list'));
+    var target = document.getElementById(input.dataset.target);
+    var timer = null;
+
+    input.addEventListener('input', function () {
+      var option = Array.prototype.find.call(options.options, function (o) { return o.value === input.value; });
+      target.value = option ? option.dataset.id : '';
+      if (option) return;
+
+      clearTimeout(timer);
+      timer = setTimeout(function () {
+        fetch(input.dataset.source + '&q=' + encodeURIComponent(input.value))
+          .then(function (response) { return response.json(); })
+          .then(function (body) {
+            options.innerHTML = '';
+            body.data.forEach(function (entity) {
+              var o = document.createElement('option');
+              o.value = entity.name;
+              o.dataset.id = entity.id;
+              options.appendChild(o);
+            });
+          });
+      }, 200);
+    });
+  });
+});
@@ -0,0 +1,151 @@
+#----------------------------------------------------------------------------#
+# Venue summary backing the /venues listing.
+#
+# VenueSummary holds the name, city, state and upcoming show count of every
+# venue, so the listing is one read of ix_venue_summary_state_city_id however
+# many shows there are. A flush writing venues or shows rebuilds the rows of
+# the venues it touched in the same transaction. Deletes of artists (the
+# database deletes their shows in cascade) and Query.delete() of shows rebuild
+# the venues of the shows deleted, looked up before the delete. Query.update()
+# of venues or shows and bulk imports rebuild the whole summary.
+#
+# Rows are upserted, so transactions rebuilding the same venue at once don't
+# fail on the primary key: the last to commit wins, with the counts it saw.
+#
+# Counts also go stale as shows start. ScheduledRefresh rebuilds the venues
+# whose next show has started at most every VENUE_SUMMARY_REFRESH seconds,
+# `flask refresh-venue-summary` does the same from cron.
+#----------------------------------------------------------------------------#
+
+import time
+from datetime import datetime
+from itertools import chain
+import click
+from flask import request
+from sqlalchemy import and_, event, func, inspect, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Query, Session
+from models import app, db, Venue, Artist, Show, VenueSummary
+
+
+def rebuild_venue_summary(session, venue_ids=None):
+  """Rebuilds the summary rows of venue_ids, of every venue when None"""
+  if venue_ids is not None and not venue_ids:
+    return
+  summary = VenueSummary.__table__
+  upcoming = and_(Show.venue_id == Venue.id, Show.start_time >= datetime.now())
+  rows = select([Venue.id, Venue.name, Venue.city, Venue.state,
+                 func.count(Show.id), func.min(Show.start_time)]) \
+    .select_from(Venue.__table__.outerjoin(Show.__table__, upcoming)) \
+    .group_by(Venue.id, Venue.name, Venue.city, Venue.state)
+  if venue_ids is not None:
+    rows = rows.where(Venue.id.in_(venue_ids))
+
+  # rows of deleted venues go with them (ON DELETE CASCADE), the others are overwritten
+  upsert = insert(summary).from_select(
+    ['id', 'name', 'city', 'state', 'num_upcoming_shows', 'next_show_time'], rows)
+  session.execute(upsert.on_conflict_do_update(
+    index_elements=[summary.c.id],
+    set_={column: upsert.excluded[column]
+          for column in ('name', 'city', 'state', 'num_upcoming_shows', 'next_show_time')}))
+
+
+def refresh_started_shows(session):
+  """Rebuilds the rows of the venues whose next show has started, returns how many"""
+  venue_ids = [id for (id,) in session.query(VenueSummary.id)
+               .filter(VenueSummary.next_show_time < datetime.now())]
+  rebuild_venue_summary(session, venue_ids)
+  return len(venue_ids)
+
+
+def venues_of_shows(query):
+  """Ids of the venues of the shows of query"""
+  return {id for (id,) in query.with_entities(Show.venue_id).distinct()}
+
+
+@event.listens_for(Session, 'before_flush')
+def before_flush(session, flush_context, instances):
+  artist_ids = [instance.id for instance in session.deleted if isinstance(instance, Artist)]
+  if artist_ids:
+    # their shows are gone once the flush deleted them
+    session.info['deleted_show_venue_ids'] = venues_of_shows(
+      session.query(Show).filter(Show.artist_id.in_(artist_ids)))
+
+
+@event.listens_for(Session, 'after_flush')
+def after_flush(session, flush_context):
+  venue_ids = session.info.pop('deleted_show_venue_ids', set())
+  for instance in chain(session.new, session.dirty, session.deleted):
+    if isinstance(instance, Venue):
+      venue_ids.add(instance.id)
+    elif isinstance(instance, Show):
+      venue_ids.add(instance.venue_id)
+      # a show moved to another venue changes both
+      venue_ids.update(inspect(instance).attrs.venue_id.history.deleted)
+  rebuild_venue_summary(session, venue_ids)
+
+
+@event.listens_for(Query, 'before_compile_delete', retval=True)
+def before_compile_delete(query, delete_context):
+  # after_bulk_delete gets the same delete_context
+  entity = query.column_descriptions[0]['entity']
+  if entity is Artist:
+    delete_context.show_venue_ids = venues_of_shows(
+      query.session.query(Show).filter(Show.artist_id.in_(query.with_entities(Artist.id).subquery())))
+  elif entity is Show:
+    delete_context.show_venue_ids = venues_of_shows(query)
+  return query
+
+
+@event.listens_for(Session, 'after_bulk_update')
+def after_bulk_update(context):
+  if context.mapper.class_ in (Venue, Show):
+    rebuild_venue_summary(context.session)
+
+
+@event.listens_for(Session, 'after_bulk_delete')
+def after_bulk_delete(context):
+  # deleted venues take their summary rows along (ON DELETE CASCADE)
+  if context.mapper.class_ in (Artist, Show):
+    rebuild_venue_summary(context.session, context.show_venue_ids)
+
+
+class ScheduledRefresh(object):
+  """Refreshes the counts of started shows on the first GET every VENUE_SUMMARY_REFRESH seconds"""
+
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.extensions['venue_summary'] = self
+    self.app = app
+    self.last_refresh = time.monotonic()
+    app.before_request(self._before_request)
+
+  def _before_request(self):
+    interval = self.app.config['VENUE_SUMMARY_REFRESH']
+    if request.method != 'GET' or not interval or time.monotonic() - self.last_refresh < interval:
+      return
+    self.last_refresh = time.monotonic()
+    try:
+      if refresh_started_shows(db.session):
+        db.session.commit()
+        self.app.extensions['page_cache'].invalidate('venues')
+    except Exception:
+      db.session.rollback()
+      self.app.logger.exception('Refreshing the venue summary failed')
+
+
+@app.cli.command('refresh-venue-summary')
+@click.option('--all', 'rebuild_all', is_flag=True, help='rebuild every venue, not only those with started shows')
+def refresh_command(rebuild_all):
+  """Refreshes the upcoming show counts of the venue listing."""
+  if rebuild_all:
+    rebuild_venue_summary(db.session)
+    count = db.session.query(VenueSummary).count()
+  else:
+    count = refresh_started_shows(db.session)
+  db.session.commit()
+  app.extensions['page_cache'].invalidate('venues')
+  click.echo(f'{count} venues refreshed')
@@ -0,0 +1,961 @@
+import os
+import re
+import json
+import shutil
+import random
+import tempfile
+import unittest
+import babel.dates
+import dateutil.parser
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app, db, page_cache, concurrent_reads, assets, write_queue
+from app import DATETIME_FORMATS, format_datetime, parse_datetime
+from assets import build, minify_css
+from cache import PageCache, FileSystemBackend
+from instrumentation import NPlusOneError, fingerprint
+from models import Venue, Artist, Show, VenueSummary, AppliedWrite
+from summary import refresh_started_shows
+from scheduling import IntervalTree
+from viewmodels import VenueDetails
+
+
+class FyyurTestCase(unittest.TestCase):
+    """This class represents the fyyur test case"""
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        self.database_path = os.environ.get('TEST_DATABASE_URL', 'postgres://localhost:5432/fyyur_test')
+        app.config['SQLALCHEMY_DATABASE_URI'] = self.database_path
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.client = app.test_client
+        self.show_batches = 0
+
+        # binds the app to the current context
+        self.context = app.app_context()
+        self.context.push()
+        db.create_all()
+
+    def tearDown(self):
+        """Executed after reach test"""
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+        page_cache.invalidate(*page_cache.namespaces)
+
+    def add_venue(self, name='The Musical Hop', genres=('Jazz',), city='San Francisco', state='CA'):
+        venue = Venue(name=name, genres=list(genres), city=city, state=state,
+                      address='1015 Folsom Street', phone='123-123-1234', seeking_talent=True)
+        db.session.add(venue)
+        db.session.commit()
+        return venue.id
+
+    def add_artist(self, name='Guns N Petals', genres=('Rock n Roll',)):
+        artist = Artist(name=name, genres=list(genres), city='San Francisco', state='CA',
+                        phone='326-123-5000', seeking_venue=True)
+        db.session.add(artist)
+        db.session.commit()
+        return artist.id
+
+    def add_shows(self, artist_id, venue_id, count):
+        """Adds count daily one minute shows, later batches a few minutes later so no booking overlaps"""
+        start = datetime.now() - timedelta(days=count // 2) + timedelta(minutes=2 * self.show_batches)
+        self.show_batches += 1
+        db.session.add_all([Show(artist_id=artist_id, venue_id=venue_id, start_time=start + timedelta(days=i),
+                                 end_time=start + timedelta(days=i, minutes=1))
+                            for i in range(count)])
+        db.session.commit()
+
+    def measure(self, method, path, **kwargs):
+        """Requests path, returns (response, statements sent, Show rows loaded by the ORM)"""
+        counts = {'statements': 0, 'shows_loaded': 0}
+
+        def count_statement(*args):
+            counts['statements'] += 1
+
+        def count_show(*args):
+            counts['shows_loaded'] += 1
+
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+        event.listen(Show, 'load', count_show)
+        try:
+            res = self.client().open(path, method=method, **kwargs)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_statement)
+            event.remove(Show, 'load', count_show)
+        return res, counts['statements'], counts['shows_loaded']
+
+    """
+    Tests
+    """
+
+    def test_delete_venue_cost_does_not_grow_with_shows(self):
+        """Deleting a venue runs the same statements and loads no show, however many shows it has"""
+        artist_id = self.add_artist()
+        costs = []
+        for show_count in (0, 10, 100):
+            venue_id = self.add_venue()
+            self.add_shows(artist_id, venue_id, show_count)
+            db.session.remove()
+
+            res, statements, shows_loaded = self.measure('DELETE', f'/venues/{venue_id}')
+            self.assertEqual(res.status_code, 302)
+            costs.append((statements, shows_loaded))
+
+            # the shows are gone with the venue
+            self.assertEqual(Show.query.filter_by(venue_id=venue_id).count(), 0)
+            self.assertIsNone(Venue.query.get(venue_id))
+
+        self.assertEqual(len(set(costs)), 1)
+        self.assertEqual(costs[0][1], 0)
+
+    def test_delete_artist_cascades_to_shows(self):
+        """Deleting an artist deletes its shows in the database"""
+        artist_id = self.add_artist()
+        venue_id = self.add_venue()
+        self.add_shows(artist_id, venue_id, 5)
+        db.session.remove()
+
+        res, statements, shows_loaded = self.measure('DELETE', f'/artists/{artist_id}')
+
+        self.assertEqual(res.status_code, 302)
+        self.assertEqual(shows_loaded, 0)
+        self.assertEqual(Show.query.count(), 0)
+        self.assertIsNotNone(Venue.query.get(venue_id))
+
+    def test_batch_delete_venues_success(self):
+        """Deleting many venues costs one DELETE however many venues and shows there are"""
+        artist_id = self.add_artist()
+        costs = []
+        for venue_count in (1, 20):
+            venue_ids = [self.add_venue(f'Venue {i}') for i in range(venue_count)]
+            for venue_id in venue_ids:
+                self.add_shows(artist_id, venue_id, 5)
+            keep_id = self.add_venue('Keep')
+            db.session.remove()
+
+            ids = ','.join(str(venue_id) for venue_id in venue_ids)
+            res, statements, shows_loaded = self.measure('DELETE', f'/venues?ids={ids}')
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(data['success'], True)
+            self.assertEqual(data['deleted'], venue_count)
+            costs.append((statements, shows_loaded))
+
+            self.assertEqual(Venue.query.filter(Venue.id.in_(venue_ids)).count(), 0)
+            self.assertEqual(Show.query.filter(Show.venue_id.in_(venue_ids)).count(), 0)
+            self.assertIsNotNone(Venue.query.get(keep_id))
+
+        self.assertEqual(costs[0], costs[1])
+        self.assertEqual(costs[0][1], 0)
+
+    def test_batch_delete_artists_success(self):
+        artist_ids = [self.add_artist(f'Artist {i}') for i in range(3)]
+        venue_id = self.add_venue()
+        for artist_id in artist_ids:
+            self.add_shows(artist_id, venue_id, 2)
+        db.session.remove()
+
+        res = self.client().delete('/artists?ids=' + ','.join(str(artist_id) for artist_id in artist_ids[:2]))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['deleted'], 2)
+        self.assertEqual(Artist.query.count(), 1)
+        self.assertEqual(Show.query.count(), 2)
+
+    def test_batch_delete_bad_ids(self):
+        """Test what happens if the ids are missing or not numbers"""
+        self.assertEqual(self.client().delete('/venues').status_code, 400)
+        self.assertEqual(self.client().delete('/venues?ids=1,two').status_code, 400)
+        self.assertEqual(self.client().delete('/artists?ids=').status_code, 400)
+
+    def write_file(self, folder, name, lines):
+        path = os.path.join(folder, name)
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        return path
+
+    def test_import_rejects(self):
+        """Rows failing the form validation are reported with their line and errors, the others imported"""
+        folder = tempfile.mkdtemp()
+        try:
+            path = self.write_file(folder, 'venues.csv', [
+                'name,city,state,address,phone,genres,seeking_talent',
+                'Good Hall,Austin,TX,1 Main Street,512-123-1234,"Jazz,Blues",yes',
+                'No Phone,Austin,TX,2 Main Street,,Jazz,no',
+                'Bad Genre,Austin,TX,3 Main Street,512-123-1234,Polka,no',
+            ])
+            rejects = os.path.join(folder, 'rejects.ndjson')
+            result = app.test_cli_runner().invoke(args=['import', 'venues', path, '--rejects', rejects])
+            self.assertEqual(result.exit_code, 0, result.output)
+            self.assertIn('venues: 1 imported, 2 rejected', result.output)
+
+            with open(rejects) as f:
+                rejected = [json.loads(line) for line in f]
+            self.assertEqual([(row['line'], set(row['errors'])) for row in rejected], [(3, {'phone'}), (4, {'genres'})])
+            self.assertEqual(rejected[0]['record']['name'], 'No Phone')
+
+            venue = Venue.query.one()
+            self.assertEqual((venue.name, venue.genres, venue.seeking_talent), ('Good Hall', ['Jazz', 'Blues'], True))
+        finally:
+            shutil.rmtree(folder)
+
+    def test_import_rejects_ndjson_lines_that_are_no_object(self):
+        """Malformed NDJSON lines and values other than objects are rejected, not fatal"""
+        folder = tempfile.mkdtemp()
+        try:
+            path = self.write_file(folder, 'artists.ndjson', [
+                json.dumps({'name': 'Guns N Petals', 'city': 'San Francisco', 'state': 'CA', 'genres': ['Jazz']}),
+                '{"name": "Matt Quevedo",',
+                '["Matt Quevedo"]',
+                '42',
+            ])
+            rejects = os.path.join(folder, 'rejects.ndjson')
+            result = app.test_cli_runner().invoke(args=['import', 'artists', path, '--rejects', rejects])
+            self.assertEqual(result.exit_code, 0, result.output)
+            self.assertIn('artists: 1 imported, 3 rejected', result.output)
+
+            with open(rejects) as f:
+                rejected = [json.loads(line) for line in f]
+            self.assertEqual([(row['line'], list(row['errors'])) for row in rejected],
+                             [(2, ['record']), (3, ['record']), (4, ['record'])])
+            self.assertEqual([row['record'] for row in rejected], ['{"name": "Matt Quevedo",', ['Matt Quevedo'], 42])
+        finally:
+            shutil.rmtree(folder)
+        self.assertEqual([artist.name for artist in Artist.query], ['Guns N Petals'])
+
+    def test_export_import_round_trip(self):
+        """Exported venues, artists and shows import back as they were, in CSV and NDJSON"""
+        venue_id = self.add_venue(genres=('Jazz', 'Reggae'))
+        artist_id = self.add_artist()
+        self.add_shows(artist_id, venue_id, 3)
+        # the files hold whole seconds
+        for show in Show.query:
+            show.start_time, show.end_time = (time.replace(microsecond=0) for time in (show.start_time, show.end_time))
+        self.add_artist('Matt Quevedo', genres=('Jazz', 'Folk'))
+
+        def rows(model):
+            columns = [column for column in model.__table__.columns if column.name not in ('id', 'search_vector')]
+            # unset fields import as '', as the create forms store them
+            return sorted(tuple('' if value is None else value for value in row)
+                          for row in db.session.query(*columns))
+
+        def run(*args):
+            result = app.test_cli_runner().invoke(args=args)
+            self.assertEqual(result.exit_code, 0, result.output)
+            return result.output
+
+        folder = tempfile.mkdtemp()
+        try:
+            files = {'venues': 'venues.csv', 'artists': 'artists.ndjson', 'shows': 'shows.csv'}
+            for entity, name in files.items():
+                self.assertIn(f'{entity}: ', run('export', entity, os.path.join(folder, name)))
+            exported = {model: rows(model) for model in (Venue, Artist, Show)}
+
+            Show.query.delete()
+            db.session.commit()
+            self.assertIn('shows: 3 imported', run('import', 'shows', os.path.join(folder, files['shows'])))
+            self.assertEqual(rows(Show), exported[Show])
+
+            Venue.query.delete()
+            Artist.query.delete()
+            db.session.commit()
+            self.assertIn('venues: 1 imported', run('import', 'venues', os.path.join(folder, files['venues'])))
+            self.assertIn('artists: 2 imported', run('import', 'artists', os.path.join(folder, files['artists'])))
+        finally:
+            shutil.rmtree(folder)
+        self.assertEqual(rows(Venue), exported[Venue])
+        self.assertEqual(rows(Artist), exported[Artist])
+
+    def test_import_partial_failure_is_published(self):
+        """Chunks committed before a failing one are listed, their cached pages and ETags renewed"""
+        self.assertNotIn(b'First Hall', self.client().get('/venues').data)
+        etag = self.client().get('/api/v1/venues').headers['ETag']
+        folder = tempfile.mkdtemp()
+        try:
+            path = self.write_file(folder, 'venues.csv', [
+                'name,city,state,address,phone,genres',
+                'First Hall,Austin,TX,1 Main Street,512-123-1234,Jazz',
+                # passes the form, too long for the city column
+                'Second Hall,' + 'A' * 200 + ',TX,2 Main Street,512-123-1234,Jazz',
+            ])
+            result = app.test_cli_runner().invoke(args=['import', 'venues', path, '--chunk-size', '1'])
+            self.assertNotEqual(result.exit_code, 0)
+            self.assertIn('venues: 1 imported before the error', result.output)
+        finally:
+            shutil.rmtree(folder)
+
+        self.assertEqual([venue.name for venue in Venue.query], ['First Hall'])
+        res = self.client().get('/venues')
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        self.assertIn(b'First Hall', res.data)
+        res = self.client().get('/api/v1/venues', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+
+    def test_api_venue_not_modified_without_queries(self):
+        """A matching If-None-Match is answered 304 before any query, until a write changes the tables"""
+        venue_id = self.add_venue()
+        self.add_shows(self.add_artist(), venue_id, 4)
+
+        res, statements, _ = self.measure('GET', f'/api/v1/venues/{venue_id}')
+        data = json.loads(res.data)
+        etag = res.headers['ETag']
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['data']['name'], 'The Musical Hop')
+        self.assertEqual(data['data']['past_shows_count'] + data['data']['upcoming_shows_count'], 4)
+
+        res, statements, _ = self.measure('GET', f'/api/v1/venues/{venue_id}', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(statements, 0)
+
+        self.add_shows(self.add_artist('Other'), venue_id, 1)
+        res = self.client().get(f'/api/v1/venues/{venue_id}', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    def test_api_delete_changes_cascaded_tables(self):
+        """Deleting a venue changes the ETag of the shows its deletion cascades to"""
+        venue_id = self.add_venue()
+        self.add_shows(self.add_artist(), venue_id, 2)
+        etag = self.client().get('/api/v1/shows').headers['ETag']
+        self.client().delete(f'/venues?ids={venue_id}')
+
+        res = self.client().get('/api/v1/shows', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data)['data'], [])
+
+    def test_api_fields(self):
+        self.add_venue()
+        res = self.client().get('/api/v1/venues?fields=id,name')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(set(data['data'][0]), {'id', 'name'})
+        self.assertIsNone(data['next_after'])
+
+    def test_api_404_venue_not_found(self):
+        res = self.client().get('/api/v1/venues/1000')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+
+    def test_server_timing_counts_queries(self):
+        self.add_venue()
+        with self.assertLogs('models.sql', 'INFO') as logs:
+            res, statements, _ = self.measure('GET', '/api/v1/venues')
+        timings = res.headers.getlist('Server-Timing')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(f'desc="{statements} queries"', timings[0])
+        self.assertTrue(timings[0].startswith('db;dur='))
+        line = json.loads(logs.records[-1].getMessage())
+        self.assertEqual((line['path'], line['queries']), ('/api/v1/venues', statements))
+
+    def test_n_plus_one_raises_when_testing(self):
+        """Loading shows one by one inside a request fails past N_PLUS_ONE_THRESHOLD"""
+        venue_id = self.add_venue()
+        self.add_shows(self.add_artist(), venue_id, app.config['N_PLUS_ONE_THRESHOLD'])
+        ids = [show.id for show in Show.query.all()]
+        db.session.remove()
+
+        with app.test_request_context('/shows'):
+            app.preprocess_request()
+            for show_id in ids:
+                Show.query.get(show_id)
+            with self.assertRaises(NPlusOneError):
+                app.process_response(app.response_class())
+
+    def test_fingerprint_collapses_literals_and_in_lists(self):
+        self.assertEqual(fingerprint('SELECT * FROM "Show" WHERE id IN (?, ?, ?) AND x = 3'),
+                         fingerprint('SELECT * FROM "Show"\n WHERE id IN (?) AND x = 42'))
+        self.assertEqual(fingerprint('SELECT %(id_1)s, %(id_2)s'), fingerprint('SELECT %(id_1)s, %(id_1)s'))
+
+    def api_pages(self, path):
+        """Items of every page of an API listing, following next_after"""
+        items, after = [], None
+        while True:
+            data = json.loads(self.client().get(path + (f'?after={after}' if after else '')).data)
+            items.extend(data['data'])
+            after = data['next_after']
+            if after is None:
+                return items
+
+    def test_keyset_pages_reach_every_row(self):
+        """Pages of artists sharing or lacking a name, followed by their cursor, list every artist once"""
+        ids = [self.add_artist(name) for name in ('B', '', 'A', 'B', '', 'C', 'A')]
+        app.config['PAGE_SIZE'] = 2
+        try:
+            artists = self.api_pages('/api/v1/artists')
+        finally:
+            app.config['PAGE_SIZE'] = 50
+        self.assertEqual([artist['id'] for artist in artists],
+                         [id for name, id in sorted(zip(('B', '', 'A', 'B', '', 'C', 'A'), ids))])
+
+        # a NULL name would never be reached by the row comparison of the cursor
+        db.session.add(Artist(name=None, genres=['Jazz']))
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+
+    def test_listing_pages_stream_and_link_the_next(self):
+        """/artists pages are streamed, each linking the next until every artist is listed"""
+        names = ['Guns N Petals', 'Matt Quevedo', 'The Wild Sax Band', 'Alpha', 'Zed']
+        for name in names:
+            self.add_artist(name)
+        app.config['PAGE_SIZE'] = 2
+        try:
+            listed, path, pages = [], '/artists', []
+            while path:
+                res = self.client().get(path)
+                self.assertTrue(res.is_streamed)
+                page = res.get_data(as_text=True)
+                pages.append(page)
+                listed.extend(name for name in re.findall(r'<h5>(.*?)</h5>', page)
+                              if name not in ('Next page', 'List a new artist'))
+                links = re.findall(r'href="(/artists\?after=\d+)"', page)
+                path = links[0] if links else None
+        finally:
+            app.config['PAGE_SIZE'] = 50
+        self.assertEqual(listed, sorted(names))
+        self.assertEqual(len(pages), 3)
+
+        # the streamed page was stored once sent
+        res = self.client().get('/artists')
+        self.assertEqual(res.headers['X-Cache'], 'HIT')
+        self.assertEqual(res.get_data(as_text=True), pages[0])
+
+    def test_flash_shows_once_on_streamed_pages(self):
+        """A message flashed before a streamed page is shown on it, then cleared"""
+        artist_id = self.add_artist()
+        client = self.client()
+        client.post(f'/artists/{artist_id}/edit', data={'city': 'San Francisco', 'state': 'CA', 'genres': ['Jazz']})
+        message = b'An error occurred. Errors in the following fields: name'
+
+        for path in ('/venues', '/artists', '/shows', '/'):
+            self.assertEqual(client.get(path).data.count(message), 1 if path == '/venues' else 0, path)
+
+    def test_keyset_page_after_deleted_row(self):
+        """A cursor pointing at a deleted row is a 404, not an empty last page"""
+        artist_ids = [self.add_artist(f'Artist {i}') for i in range(3)]
+        Artist.query.filter_by(id=artist_ids[0]).delete()
+        db.session.commit()
+
+        res = self.client().get(f'/api/v1/artists?after={artist_ids[0]}')
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(self.client().get(f'/artists?after={artist_ids[0]}').status_code, 404)
+        # past the last row of a page is still an empty page
+        res = self.client().get(f'/api/v1/artists?after={artist_ids[-1]}')
+        self.assertEqual(json.loads(res.data)['data'], [])
+
+    def upcoming_shows_listed(self, venue_id):
+        data = json.loads(self.client().get('/api/v1/venues').data)['data']
+        return {venue['id']: venue['num_upcoming_shows'] for venue in data}.get(venue_id)
+
+    def test_venue_summary_follows_show_writes(self):
+        """The listing counts upcoming shows as shows are created and their artists deleted"""
+        venue_id = self.add_venue()
+        artist_id = self.add_artist()
+        self.assertEqual(self.upcoming_shows_listed(venue_id), 0)
+
+        # two of the five shows are upcoming
+        self.add_shows(artist_id, venue_id, 5)
+        self.assertEqual(self.upcoming_shows_listed(venue_id), 2)
+
+        res = self.client().post('/shows/create', data={
+            'artist_id': artist_id, 'venue_id': venue_id,
+            'start_time': (datetime.now() + timedelta(days=30)).strftime('%Y-%m-%d %H:%M:%S')})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.upcoming_shows_listed(venue_id), 3)
+        self.assertIn(b'3 upcoming shows', self.client().get('/venues').data)
+
+        self.client().delete(f'/artists/{artist_id}')
+        self.assertEqual(self.upcoming_shows_listed(venue_id), 0)
+
+    def test_artist_deletes_rebuild_the_venues_of_their_shows(self):
+        """Deleting artists rebuilds the summary rows of their venues only"""
+        venue_ids = [self.add_venue(), self.add_venue('Park Square Live Music & Coffee')]
+        artist_ids = [self.add_artist(), self.add_artist('Matt Quevedo')]
+        for artist_id, venue_id in zip(artist_ids, venue_ids):
+            self.add_shows(artist_id, venue_id, 5)
+        summary = VenueSummary.__table__
+
+        def tamper(venue_id):
+            db.session.execute(summary.update().where(summary.c.id == venue_id).values(num_upcoming_shows=99))
+            db.session.commit()
+
+        # one statement deleting the artist
+        tamper(venue_ids[1])
+        self.client().delete(f'/artists/{artist_ids[0]}')
+        self.assertEqual([self.upcoming_shows_listed(id) for id in venue_ids], [0, 99])
+
+        # a flush deleting the artist
+        tamper(venue_ids[0])
+        db.session.delete(Artist.query.get(artist_ids[1]))
+        db.session.commit()
+        self.assertEqual([self.upcoming_shows_listed(id) for id in venue_ids], [99, 0])
+
+    def test_venue_summary_refresh_started_shows(self):
+        """Shows that have started since the last write leave the upcoming count on refresh"""
+        venue_id = self.add_venue()
+        db.session.add(Show(artist_id=self.add_artist(), venue_id=venue_id,
+                            start_time=datetime.now() + timedelta(hours=1)))
+        db.session.commit()
+        self.assertEqual(VenueSummary.query.get(venue_id).num_upcoming_shows, 1)
+
+        # an hour later
+        started = datetime.now() - timedelta(minutes=1)
+        db.session.execute(Show.__table__.update().values(start_time=started))
+        db.session.execute(VenueSummary.__table__.update().values(next_show_time=started))
+        self.assertEqual(refresh_started_shows(db.session), 1)
+        db.session.commit()
+        self.assertEqual(VenueSummary.query.get(venue_id).num_upcoming_shows, 0)
+        self.assertEqual(refresh_started_shows(db.session), 0)
+
+    def test_venues_listing_groups_areas(self):
+        """/venues lists every (city, state) once, ordered by state then city, with its venues"""
+        self.add_venue('Park Square Live Music & Coffee')
+        self.add_venue('The Dueling Pianos Bar', city='New York', state='NY')
+        self.add_venue('The Musical Hop')
+        self.add_venue('Brooklyn Bowl', city='Brooklyn', state='NY')
+
+        page = self.client().get('/venues').get_data(as_text=True)
+        headings = re.findall(r'<h3>(.*?)</h3>', page)
+        self.assertEqual(headings, ['San Francisco, CA', 'Brooklyn, NY', 'New York, NY'])
+        areas = dict(zip(headings, re.split(r'<h3>.*?</h3>', page)[1:]))
+        self.assertEqual(re.findall(r'<h5>(.*?)</h5>', areas['San Francisco, CA']),
+                         ['Park Square Live Music &amp; Coffee', 'The Musical Hop'])
+        self.assertEqual(re.findall(r'<h5>(.*?)</h5>', areas['Brooklyn, NY']), ['Brooklyn Bowl'])
+        self.assertIn('The Dueling Pianos Bar', areas['New York, NY'])
+
+    def test_venues_listing_cost_does_not_grow_with_shows(self):
+        venue_id = self.add_venue()
+        artist_id = self.add_artist()
+        statements = []
+        for show_count in (0, 50):
+            self.add_shows(artist_id, venue_id, show_count)
+            page_cache.invalidate('venues')
+            res, count, shows_loaded = self.measure('GET', '/venues')
+            self.assertEqual(res.status_code, 200)
+            statements.append(count)
+        # the page and the genre facets
+        self.assertEqual(statements, [2, 2])
+
+    def test_detail_pages_are_one_query(self):
+        """Venue and artist pages load the entity, its shows and their counts in one statement"""
+        venue_id = self.add_venue()
+        artist_id = self.add_artist()
+        # two of the five shows are upcoming
+        self.add_shows(artist_id, venue_id, 5)
+
+        for path in (f'/venues/{venue_id}', f'/artists/{artist_id}'):
+            res, statements, shows_loaded = self.measure('GET', path)
+            page = res.get_data(as_text=True)
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual((statements, shows_loaded), (1, 0))
+            self.assertIn('2 Upcoming Shows', page)
+            self.assertIn('3 Past Shows', page)
+
+            # the most recent past show only, counted in full
+            page = self.client().get(path + '?past_limit=1').get_data(as_text=True)
+            self.assertIn('3 Past Shows', page)
+            self.assertEqual(page.count('tile-show'), 3)
+
+        self.assertEqual(self.client().get('/venues/0').status_code, 404)
+        self.assertEqual(self.client().get('/artists/0').status_code, 404)
+
+    def post_show(self, artist_id, venue_id, start_time, end_time=None):
+        data = {'artist_id': artist_id, 'venue_id': venue_id, 'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S')}
+        if end_time:
+            data['end_time'] = end_time.strftime('%Y-%m-%d %H:%M:%S')
+        return self.client().post('/shows/create', data=data)
+
+    def test_show_form_choices_and_typeahead(self):
+        """Past SHOW_FORM_MAX_CHOICES the show form asks for a name, the typeahead lists matches by name"""
+        venue_ids = [self.add_venue(name) for name in ('The Musical Hop', 'Park Square Live Music & Coffee')]
+        for name in ('Guns N Petals', 'Matt Quevedo', 'The Wild Sax Band', '100% Sax'):
+            self.add_artist(name)
+        Artist.query.filter_by(name='Matt Quevedo').update({'seeking_venue': False})
+        db.session.commit()
+        # the form templates render its csrf_token
+        app.config.update(SHOW_FORM_MAX_CHOICES=2, TYPEAHEAD_LIMIT=2, WTF_CSRF_ENABLED=True)
+        try:
+            page = self.client().get('/shows/create').get_data(as_text=True)
+            self.assertEqual(sorted(int(id) for id in re.findall(r'<option value="(\d+)"', page)), venue_ids)
+            self.assertIn('<datalist id="artist_id_options">', page)
+            self.assertNotIn('<datalist id="venue_id_options">', page)
+
+            def names(path):
+                return [row['name'] for row in json.loads(self.client().get(path).data)['data']]
+
+            self.assertEqual(names('/artists/typeahead?q=A'), ['100% Sax', 'Guns N Petals'])
+            self.assertEqual(names('/artists/typeahead?q=sax'), ['100% Sax', 'The Wild Sax Band'])
+            self.assertEqual(names('/artists/typeahead?q=%25'), ['100% Sax'])
+            self.assertEqual(names('/artists/typeahead?q=quev&seeking=1'), [])
+            self.assertEqual(names('/artists/typeahead?q=quev'), ['Matt Quevedo'])
+            self.assertEqual(names('/venues/typeahead?q=&seeking=1'), [])
+        finally:
+            app.config.update(SHOW_FORM_MAX_CHOICES=500, TYPEAHEAD_LIMIT=10, WTF_CSRF_ENABLED=False)
+
+        self.assertEqual(self.client().get('/shows/create/at_venue/0').status_code, 404)
+
+    def test_create_show_conflicts(self):
+        """A venue or an artist already booked at that time cannot be booked again"""
+        venue_id = self.add_venue()
+        other_venue_id = self.add_venue('Other')
+        artist_id = self.add_artist()
+        other_artist_id = self.add_artist('Other')
+        start = datetime(2030, 5, 1, 20)
+
+        self.post_show(artist_id, venue_id, start, start + timedelta(hours=3))
+        self.assertEqual(Show.query.count(), 1)
+
+        # the venue, then the artist, is busy until 23:00
+        res = self.post_show(other_artist_id, venue_id, start + timedelta(hours=2))
+        self.assertIn(b'the venue is booked from 2030-05-01 20:00 to 2030-05-01 23:00', res.data)
+        res = self.post_show(artist_id, other_venue_id, start - timedelta(hours=1))
+        self.assertIn(b'the artist is booked', res.data)
+        self.assertEqual(Show.query.count(), 1)
+
+        # shows without an end time last two hours, ending as the next one starts is fine
+        self.post_show(other_artist_id, venue_id, start + timedelta(hours=3))
+        self.post_show(other_artist_id, other_venue_id, start + timedelta(hours=5), start + timedelta(hours=6))
+        self.assertEqual(Show.query.count(), 3)
+
+        res = self.post_show(artist_id, other_venue_id, start + timedelta(hours=4), start + timedelta(hours=3))
+        self.assertIn(b'The show must end after it starts.', res.data)
+
+    def test_venue_free_slots(self):
+        venue_id = self.add_venue()
+        artist_id = self.add_artist()
+        day = datetime(2030, 5, 1)
+        db.session.add_all([
+            Show(artist_id=artist_id, venue_id=venue_id, start_time=day + timedelta(hours=18)),
+            Show(artist_id=artist_id, venue_id=venue_id, start_time=day + timedelta(hours=21),
+                 end_time=day + timedelta(hours=23)),
+        ])
+        db.session.commit()
+
+        res = self.client().get(f'/api/v1/venues/{venue_id}/free_slots'
+                                f'?start=2030-05-01T12:00&end=2030-05-02T00:00&duration=60')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['data'], [
+            {'start': '2030-05-01T12:00:00', 'end': '2030-05-01T18:00:00'},
+            {'start': '2030-05-01T20:00:00', 'end': '2030-05-01T21:00:00'},
+            {'start': '2030-05-01T23:00:00', 'end': '2030-05-02T00:00:00'},
+        ])
+
+        res = self.client().get(f'/api/v1/venues/{venue_id}/free_slots'
+                                f'?start=2030-05-01T12:00&end=2030-05-02T00:00&duration=90')
+        self.assertEqual(len(json.loads(res.data)['data']), 1)
+
+    def test_venue_free_slots_bad_range(self):
+        venue_id = self.add_venue()
+        self.assertEqual(self.client().get(f'/api/v1/venues/{venue_id}/free_slots?start=2030-05-01').status_code, 400)
+        self.assertEqual(self.client().get(f'/api/v1/venues/{venue_id}/free_slots'
+                                           f'?start=2030-05-02&end=2030-05-01').status_code, 400)
+        self.assertEqual(self.client().get('/api/v1/venues/1000/free_slots'
+                                           '?start=2030-05-01&end=2030-05-02').status_code, 404)
+
+    def test_interval_tree_matches_brute_force(self):
+        rng = random.Random(0)
+        tree = IntervalTree()
+        intervals = {}
+        for show_id in range(500):
+            start = rng.randint(0, 10000)
+            intervals[show_id] = (start, start + rng.randint(1, 300))
+            tree.add(intervals[show_id][0], intervals[show_id][1], show_id)
+        for show_id in rng.sample(range(500), 200):
+            tree.remove(intervals.pop(show_id)[0], show_id)
+
+        for _ in range(200):
+            start = rng.randint(0, 10000)
+            end = start + rng.randint(1, 500)
+            expected = sorted(((s, e, show_id) for show_id, (s, e) in intervals.items() if s < end and e > start),
+                              key=lambda interval: (interval[0], interval[2]))
+            self.assertEqual(tree.overlapping(start, end), expected)
+
+    def cache_states(self, *paths):
+        """X-Cache of each path, read in full so streamed pages get stored"""
+        states = []
+        for path in paths:
+            res = self.client().get(path)
+            res.get_data()
+            states.append(res.headers['X-Cache'])
+        return states
+
+    def test_writes_invalidate_the_pages_they_change(self):
+        """Cached pages are served until a write changing them, pages it doesn't change stay cached"""
+        artist_id = self.add_artist()
+        paths = ('/', '/venues', '/artists', '/shows')
+        self.assertEqual(self.cache_states(*paths), ['MISS'] * 4)
+        self.assertEqual(self.cache_states(*paths), ['HIT'] * 4)
+
+        res = self.client().post('/venues/create', data={
+            'name': 'The Dueling Pianos Bar', 'city': 'New York', 'state': 'NY', 'address': '335 Delancey Street',
+            'phone': '914-003-1132', 'genres': ['Classical', 'R&B']})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.cache_states(*paths), ['MISS', 'MISS', 'HIT', 'HIT'])
+        self.assertIn(b'The Dueling Pianos Bar', self.client().get('/venues').data)
+
+        res = self.client().post(f'/artists/{artist_id}/edit', data={
+            'name': 'The Wild Sax Band', 'city': 'San Francisco', 'state': 'CA', 'genres': ['Jazz']})
+        self.assertEqual(res.status_code, 302)
+        self.assertEqual(self.cache_states(*paths), ['MISS', 'HIT', 'MISS', 'MISS'])
+        self.assertIn(b'The Wild Sax Band', self.client().get('/artists').data)
+
+    def test_error_page_is_not_cached(self):
+        """A view that failed and flashed its error is not served to the next visitor"""
+        self.add_venue('Recent Venue')
+        gather = concurrent_reads.gather
+
+        def fail(*reads):
+            raise RuntimeError('database unavailable')
+
+        concurrent_reads.gather = fail
+        try:
+            res = self.client().get('/')
+        finally:
+            concurrent_reads.gather = gather
+        self.assertIn(b'An error occurred.', res.data)
+
+        res = self.client().get('/')
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        self.assertNotIn(b'An error occurred.', res.data)
+        self.assertIn(b'Recent Venue', res.data)
+        self.assertEqual(self.client().get('/').headers['X-Cache'], 'HIT')
+
+    def test_filesystem_cache_generations_are_shared(self):
+        """A page a worker rendered before another worker invalidated it is not stored"""
+        folder = tempfile.mkdtemp()
+        try:
+            workers = [PageCache(), PageCache()]
+            for worker in workers:
+                worker.backend = FileSystemBackend(folder)
+
+            def render_during_write():
+                workers[1].invalidate('venues')
+                return ['rendered before the write']
+
+            self.assertEqual(workers[0].fragment('venues', 'list', render_during_write), ['rendered before the write'])
+            self.assertIsNone(workers[1].backend.get('venues', 'list'))
+
+            workers[0].fragment('venues', 'list', lambda: ['rendered after the write'])
+            self.assertEqual(workers[1].fragment('venues', 'list', lambda: ['unused']), ['rendered after the write'])
+        finally:
+            shutil.rmtree(folder)
+
+    def test_page_cache_keys_on_the_arguments_read(self):
+        """Query arguments a view doesn't read, or can't parse, share its cache entry"""
+        self.add_venue()
+        self.assertEqual(self.cache_states('/venues?x=1', '/venues?x=2', '/venues?after=abc&genre=',
+                                           '/venues?genre=Jazz', '/venues?genre=Jazz&x=1'),
+                         ['MISS', 'HIT', 'HIT', 'MISS', 'HIT'])
+
+    def test_filesystem_cache_is_bounded(self):
+        """Entries past maxsize are evicted, oldest first, generations are counters"""
+        folder = tempfile.mkdtemp()
+        try:
+            backend = FileSystemBackend(folder, maxsize=2)
+            for i in range(3):
+                backend.set('venues', f'/venues?after={i}', [i])
+                os.utime(backend._path('venues', f'/venues?after={i}'), (i, i))
+            backend.set('venues', '/venues?after=3', [3])
+            self.assertEqual([backend.get('venues', f'/venues?after={i}') for i in range(4)], [None, None, [2], [3]])
+
+            generation = backend.generation('venues')
+            for _ in range(1000):
+                backend.bump('venues')
+            self.assertNotEqual(backend.generation('venues'), generation)
+            self.assertEqual(backend.generation('venues').split('.')[1], '1000')
+            self.assertEqual(os.path.getsize(os.path.join(folder, 'generations', 'venues')), 4)
+
+            # a file of the former format, one byte per bump
+            with open(os.path.join(folder, 'generations', 'artists'), 'w') as f:
+                f.write('...')
+            backend.bump('artists')
+            self.assertEqual(backend.generation('artists').split('.')[1], '4')
+        finally:
+            shutil.rmtree(folder)
+
+    def test_home_page_concurrent_reads(self):
+        """With READ_THREADS the recent venues and artists are read at once, counted in Server-Timing"""
+        self.add_venue('Recent Venue')
+        self.add_artist('Recent Artist')
+        concurrent_reads.executor = ThreadPoolExecutor(2)
+        try:
+            res = self.client().get('/')
+        finally:
+            concurrent_reads.executor.shutdown()
+            concurrent_reads.executor = None
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'Recent Venue', res.data)
+        self.assertIn(b'Recent Artist', res.data)
+        self.assertIn('desc="2 queries"', res.headers['Server-Timing'])
+
+    def search_results(self, path, **form):
+        page = self.client().post(path, data=form).get_data(as_text=True)
+        return re.findall(r'<h5>(.*?)</h5>', page)
+
+    def test_search_ranks_name_before_city_and_genre(self):
+        """Words match the start of indexed words, names ranking above cities and cities above genres"""
+        self.add_venue('Blue Room', genres=('Rock n Roll',), city='Jazzton', state='NY')
+        self.add_venue('The Hall', genres=('Jazz',))
+        self.add_venue('The Jazz Cellar', genres=('Rock n Roll',))
+        self.add_venue('The Bowl', genres=('Rock n Roll',))
+
+        self.assertEqual(self.search_results('/venues/search', search_term='jaz'),
+                         ['The Jazz Cellar', 'Blue Room', 'The Hall'])
+        # every word must match
+        self.assertEqual(self.search_results('/venues/search', search_term='the jazz'), ['The Jazz Cellar', 'The Hall'])
+        self.assertEqual(self.search_results('/venues/search', search_term='jazz', state='NY'), ['Blue Room'])
+        self.assertEqual(self.search_results('/venues/search', search_term='jazz', limit=1), ['The Jazz Cellar'])
+        self.assertEqual(self.search_results('/venues/search', search_term='polka'), [])
+
+        self.add_artist('Jazz Hands', genres=('Blues',))
+        self.add_artist('Guns N Petals', genres=('Jazz',))
+        self.assertEqual(self.search_results('/artists/search', search_term='JAZZ'), ['Jazz Hands', 'Guns N Petals'])
+
+    def test_filter_by_genre(self):
+        self.add_venue('Jazz Club')
+        self.add_venue('Folk Barn', genres=['Folk', 'Blues'])
+        self.add_venue('Blues Bar', genres=['Blues', 'Jazz'])
+        self.add_artist('Jazz Trio', genres=['Jazz'])
+        self.add_artist('Folk Duo', genres=['Folk'])
+
+        res = self.client().get('/venues?genre=Jazz')
+        self.assertIn(b'Jazz Club', res.data)
+        self.assertIn(b'Blues Bar', res.data)
+        self.assertNotIn(b'Folk Barn', res.data)
+        # the facets count every venue whatever the filter
+        self.assertIn(b'Blues (2)', res.data)
+
+        res = self.client().get('/api/v1/artists?genre=Folk')
+        self.assertEqual([artist['name'] for artist in json.loads(res.data)['data']], ['Folk Duo'])
+        res = self.client().get('/api/v1/venues?genre=Pop')
+        self.assertEqual(json.loads(res.data)['data'], [])
+
+    def test_genre_facets(self):
+        self.add_venue('Jazz Club')
+        self.add_venue('Folk Barn', genres=['Folk', 'Blues'])
+        self.add_venue('Blues Bar', genres=['Blues', 'Jazz'])
+
+        res, statements, _ = self.measure('GET', '/api/v1/venues/genres')
+        data = json.loads(res.data)['data']
+        self.assertEqual(statements, 1)
+        self.assertEqual(data[:3], [{'genre': 'Blues', 'count': 2}, {'genre': 'Jazz', 'count': 2},
+                                    {'genre': 'Folk', 'count': 1}])
+        # every genre of the forms is counted
+        self.assertEqual(data[3], {'genre': 'Alternative', 'count': 0})
+
+    def test_built_assets(self):
+        """Built bundles replace their sources and are served precompressed for good"""
+        build(app.static_folder)
+        app.config['ASSETS_ENABLED'] = True
+        assets.load()
+        try:
+            html = self.client().get('/artists').get_data(as_text=True)
+            self.assertNotIn('/static/css/main.css', html)
+            bundle = assets.manifest['site.css']
+            self.assertRegex(bundle, r'^dist/site\.[0-9a-f]{12}\.css$')
+            self.assertIn(f'/static/{bundle}', html)
+
+            res = self.client().get(f'/static/{bundle}', headers={'Accept-Encoding': 'gzip'})
+            self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+            self.assertEqual(res.mimetype, 'text/css')
+            self.assertTrue(res.cache_control.immutable)
+            self.assertEqual(res.cache_control.max_age, 365 * 24 * 60 * 60)
+
+            # sources keep the default headers
+            res = self.client().get('/static/css/main.css')
+            self.assertFalse(res.cache_control.immutable)
+        finally:
+            app.config['ASSETS_ENABLED'] = False
+            assets.load()
+            shutil.rmtree(os.path.join(app.static_folder, 'dist'))
+
+    def test_datetime_filter_matches_babel_and_caches(self):
+        """The filter formats as babel.dates.format_datetime of the parsed value, parsing each value once"""
+        format_datetime.cache_clear()
+        parse_datetime.cache_clear()
+        values = ['05/21/2035, 21:30:00', '2019-06-15T23:00:00.000Z', datetime(2035, 4, 1, 20, 0)]
+        for value in values:
+            date = value if isinstance(value, datetime) else dateutil.parser.parse(value)
+            for format in ('full', 'medium', 'short', 'yyyy-MM-dd'):
+                expected = babel.dates.format_datetime(date, DATETIME_FORMATS.get(format, format))
+                self.assertEqual(format_datetime(value, format), expected)
+                self.assertEqual(format_datetime(value, format), expected)
+        self.assertEqual(format_datetime.cache_info().hits, 12)
+        # datetimes are not parsed, strings once whatever the format
+        self.assertEqual(parse_datetime.cache_info().misses, 2)
+
+    def test_minify_css_keeps_strings(self):
+        self.assertEqual(minify_css('/* nav */\na > b ,\ni :hover {\n  content: "a , b";\n  color: red;\n}\n'),
+                         'a>b,i :hover{content:"a , b";color:red}')
+
+    def test_view_models_have_no_instance_dict(self):
+        venue_id = self.add_venue()
+        self.add_shows(self.add_artist(), venue_id, 2)
+        res = self.client().get(f'/api/v1/venues/{venue_id}')
+        details = VenueDetails(*range(len(VenueDetails.fields)))
+
+        self.assertFalse(hasattr(details, '__dict__'))
+        self.assertEqual(set(details.as_dict()), set(json.loads(res.data)['data']))
+        self.assertEqual(self.client().get('/venues/1000/edit').status_code, 404)
+
+    def test_write_queue(self):
+        """Queued submissions redirect to a status page and are applied in one batch by the worker"""
+        venue_id = self.add_venue()
+        artist_id = self.add_artist()
+        start = datetime(2030, 5, 1, 20)
+        folder = tempfile.mkdtemp()
+        app.config.update(WRITE_QUEUE=True, WRITE_QUEUE_PATH=os.path.join(folder, 'queue.sqlite3'))
+        try:
+            res = self.client().post('/venues/create', data={
+                'name': 'Queued Hall', 'city': 'Austin', 'state': 'TX', 'address': '1 Main Street',
+                'phone': '512-123-1234', 'genres': ['Jazz']})
+            self.assertEqual(res.status_code, 303)
+            venue_status = res.headers['Location']
+            show_status = self.post_show(artist_id, venue_id, start).headers['Location']
+
+            self.assertIn(b'Waiting to be listed', self.client().get(venue_status).data)
+            self.assertEqual(Venue.query.filter_by(name='Queued Hall').count(), 0)
+
+            self.assertEqual(write_queue.drain(), 2)
+            venue = Venue.query.filter_by(name='Queued Hall').one()
+            self.assertIn(f'/venues/{venue.id}'.encode(), self.client().get(venue_status).data)
+            self.assertIn(b'Listed.', self.client().get(show_status).data)
+
+            # a booking conflict or a missing venue rejects its submission, not the rest of the batch
+            conflict_status = self.post_show(artist_id, venue_id, start + timedelta(hours=1)).headers['Location']
+            missing_status = self.post_show(artist_id, 1000, start + timedelta(days=1)).headers['Location']
+            later_status = self.post_show(artist_id, venue.id, start + timedelta(days=2)).headers['Location']
+            self.assertEqual(write_queue.drain(), 3)
+            self.assertIn(b'the venue is booked from 2030-05-01 20:00', self.client().get(conflict_status).data)
+            self.assertIn(b'does not exist', self.client().get(missing_status).data)
+            self.assertIn(b'Listed.', self.client().get(later_status).data)
+            self.assertEqual(Show.query.count(), 2)
+            self.assertEqual(AppliedWrite.query.count(), 3)
+
+            # a worker stopped after committing a batch leaves it applying, it is not applied twice
+            token = write_queue.status(venue_status.rsplit('/', 1)[1]).token
+            write_queue.connection().execute("UPDATE submission SET status = 'applying' WHERE token = ?", (token,))
+            write_queue.requeue()
+            self.assertEqual(write_queue.drain(), 1)
+            self.assertEqual(Venue.query.filter_by(name='Queued Hall').count(), 1)
+            self.assertEqual(self.client().get('/submissions/unknown').status_code, 404)
+        finally:
+            app.config['WRITE_QUEUE'] = False
+            shutil.rmtree(folder)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
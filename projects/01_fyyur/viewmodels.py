@@ -0,0 +1,79 @@
+#----------------------------------------------------------------------------#
+# View models of the read-only pages.
+#
+# A page row used to be an ORM object loaded into the identity map and then
+# copied field by field into a dict. A view model is built straight from
+# the columns of a query row instead: a plain object with __slots__, no
+# instance dict and no ORM state, that templates read like the dicts
+# (venue.name) and the API turns into JSON with as_dict().
+#----------------------------------------------------------------------------#
+
+
+class ViewModel(object):
+  """Named fields, in the order of the query columns building them"""
+  __slots__ = ()
+  fields = ()
+
+  def __init__(self, *values):
+    for name, value in zip(self.fields, values):
+      setattr(self, name, value)
+
+  @classmethod
+  def columns(cls, model):
+    """Columns of model selecting the fields, for views mirroring a model"""
+    return [getattr(model, name) for name in cls.fields]
+
+  def as_dict(self):
+    return {name: _plain(getattr(self, name)) for name in self.fields}
+
+  def __repr__(self):
+    return f'<{type(self).__name__} {self.as_dict()}>'
+
+
+def _plain(value):
+  if isinstance(value, ViewModel):
+    return value.as_dict()
+  if isinstance(value, list):
+    return [_plain(item) for item in value]
+  return value
+
+
+class VenueView(ViewModel):
+  fields = __slots__ = ('id', 'name', 'genres', 'address', 'city', 'state', 'phone', 'website',
+                        'facebook_link', 'seeking_talent', 'seeking_description', 'image_link')
+
+
+class ArtistView(ViewModel):
+  fields = __slots__ = ('id', 'name', 'genres', 'city', 'state', 'phone', 'website',
+                        'facebook_link', 'seeking_venue', 'seeking_description', 'image_link')
+
+
+# shows of a detail page, after the fields of the venue or artist
+SHOWS_FIELDS = ('past_shows', 'upcoming_shows', 'past_shows_count', 'upcoming_shows_count')
+
+
+class VenueDetails(VenueView):
+  """A venue with its shows, for the venue page"""
+  __slots__ = SHOWS_FIELDS
+  fields = VenueView.fields + SHOWS_FIELDS
+
+
+class ArtistDetails(ArtistView):
+  """An artist with its shows, for the artist page"""
+  __slots__ = SHOWS_FIELDS
+  fields = ArtistView.fields + SHOWS_FIELDS
+
+
+class VenueShowView(ViewModel):
+  """A show on a venue page, with the artist playing it"""
+  fields = __slots__ = ('artist_id', 'artist_name', 'artist_image_link', 'start_time')
+
+
+class ArtistShowView(ViewModel):
+  """A show on an artist page, with the venue hosting it"""
+  fields = __slots__ = ('venue_id', 'venue_name', 'venue_image_link', 'start_time')
+
+
+class ShowView(ViewModel):
+  """A show of the show listing"""
+  fields = __slots__ = ('venue_id', 'venue_name', 'artist_id', 'artist_name', 'artist_image_link', 'start_time')
@@ -0,0 +1,273 @@
+#----------------------------------------------------------------------------#
+# Background write queue of the create forms.
+#
+# With WRITE_QUEUE on, a validated venue, artist or show submission is not
+# committed inside the request: it is appended to a local SQLite file
+# (WRITE_QUEUE_PATH) and the browser is redirected at once to a status page,
+# /submissions/<token>. The request costs one local append however busy the
+# database is.
+#
+#   flask write-worker
+#
+# applies the queued submissions in batches of WRITE_QUEUE_BATCH, one
+# Postgres transaction each, in the order they were received. Every
+# submission runs in a savepoint, so a show rejected for a booking conflict
+# leaves the rest of its batch alone. The token of every applied submission
+# is written to AppliedWrite in the same transaction: a worker restarted
+# after committing a batch but before recording it in the queue finds the
+# tokens and does not apply them twice. Run one worker per queue file.
+#
+# The worker invalidates the page cache once per batch; it runs in its own
+# process, so use the 'filesystem' CACHE_BACKEND for the web workers to see
+# it. The tests apply the queue in process with WriteQueue.drain().
+#----------------------------------------------------------------------------#
+
+import json
+import time
+import sqlite3
+import threading
+from uuid import uuid4
+from datetime import datetime
+import click
+from sqlalchemy.exc import IntegrityError
+from models import app, db, Venue, Artist, Show, AppliedWrite
+from scheduling import check_conflicts, is_conflict_error, ScheduleConflict
+from viewmodels import ViewModel
+from bulk import INVALIDATES
+
+MODELS = {'venues': Venue, 'artists': Artist, 'shows': Show}
+DATETIME_FIELDS = ('start_time', 'end_time')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS submission (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  token TEXT NOT NULL UNIQUE,
+  entity TEXT NOT NULL,
+  label TEXT NOT NULL,
+  data TEXT NOT NULL,
+  status TEXT NOT NULL DEFAULT 'queued',
+  message TEXT,
+  record_id INTEGER,
+  queued_at REAL NOT NULL,
+  applied_at REAL
+);
+CREATE INDEX IF NOT EXISTS ix_submission_status_id ON submission (status, id);
+'''
+
+
+class Submission(ViewModel):
+  """A queued submission; status is 'queued', 'applying', 'applied', 'rejected' or 'failed'"""
+  fields = __slots__ = ('id', 'token', 'entity', 'label', 'data', 'status', 'message', 'record_id',
+                        'queued_at', 'applied_at')
+
+
+def encode(fields):
+  return json.dumps({name: value.isoformat() if isinstance(value, datetime) else value
+                     for name, value in fields.items()})
+
+
+def decode(data):
+  fields = json.loads(data)
+  for name in DATETIME_FIELDS:
+    if fields.get(name):
+      fields[name] = datetime.fromisoformat(fields[name])
+  return fields
+
+
+def build_record(session, submission):
+  """Adds the record of a submission to the session, returns it"""
+  fields = decode(submission.data)
+  if submission.entity == 'shows':
+    # the exclusion constraints of Show reject a booking racing this check
+    check_conflicts(session, fields['venue_id'], fields['artist_id'], fields['start_time'], fields.get('end_time'))
+  record = MODELS[submission.entity](**fields)
+  session.add(record)
+  return record
+
+
+def apply_together(session, submissions):
+  """Applies submissions in one savepoint and flush, raising when any fails"""
+  with session.begin_nested():
+    records = [build_record(session, submission) for submission in submissions]
+    session.flush()
+    session.add_all([AppliedWrite(token=submission.token, record_id=record.id)
+                     for submission, record in zip(submissions, records)])
+  return {submission.id: ('applied', None, record.id) for submission, record in zip(submissions, records)}
+
+
+def apply_one(session, submission):
+  """Applies a submission in its own savepoint, returns its (status, message, record id)"""
+  try:
+    with session.begin_nested():
+      record = build_record(session, submission)
+      session.flush()
+      session.add(AppliedWrite(token=submission.token, record_id=record.id))
+    return ('applied', None, record.id)
+  except ScheduleConflict as conflict:
+    return ('rejected', str(conflict), None)
+  except IntegrityError as error:
+    if is_conflict_error(error):
+      return ('rejected', 'the venue or the artist is already booked at that time', None)
+    return ('rejected', 'it refers to a venue or an artist that does not exist', None)
+  except Exception:
+    app.logger.exception('Applying queued submission %s failed', submission.token)
+    return ('failed', 'an error occurred', None)
+
+
+def apply_batch(session, submissions):
+  """Applies submissions in one transaction, returns {id: (status, message, record id)}"""
+  applied = dict(session.query(AppliedWrite.token, AppliedWrite.record_id)
+                 .filter(AppliedWrite.token.in_([submission.token for submission in submissions])))
+  # applied by a worker that stopped before recording it
+  results = {submission.id: ('applied', None, applied[submission.token])
+             for submission in submissions if submission.token in applied}
+  pending = [submission for submission in submissions if submission.token not in applied]
+  try:
+    # one flush, the venue summary is rebuilt once for the whole batch
+    results.update(apply_together(session, pending))
+  except Exception:
+    # some submission is rejected, apply them one by one to find which
+    for submission in pending:
+      results[submission.id] = apply_one(session, submission)
+  session.commit()
+  return results
+
+
+class WriteQueue(object):
+  """Queue of the create form submissions in a SQLite file, see the module comment"""
+
+  def __init__(self, app=None):
+    self.local = threading.local()
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.extensions['write_queue'] = self
+    self.app = app
+
+  @property
+  def enabled(self):
+    return self.app.config['WRITE_QUEUE']
+
+  def connection(self):
+    """This thread's connection to WRITE_QUEUE_PATH, in autocommit mode"""
+    path = self.app.config['WRITE_QUEUE_PATH']
+    connection = getattr(self.local, 'connection', None)
+    if connection is None or self.local.path != path:
+      connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+      # readers of the status pages do not block the appends
+      connection.execute('PRAGMA journal_mode=WAL')
+      connection.executescript(SCHEMA)
+      self.local.connection, self.local.path = connection, path
+    return connection
+
+  def enqueue(self, entity, fields, label):
+    """Appends a validated submission, returns the token of its status page"""
+    token = uuid4().hex
+    self.connection().execute(
+      'INSERT INTO submission (token, entity, label, data, queued_at) VALUES (?, ?, ?, ?, ?)',
+      (token, entity, label, encode(fields), time.time()))
+    return token
+
+  def status(self, token):
+    row = self.connection().execute(
+      f'SELECT {", ".join(Submission.fields)} FROM submission WHERE token = ?', (token,)).fetchone()
+    return row and Submission(*row)
+
+  def claim(self, limit):
+    """Marks the limit oldest queued submissions as applying and returns them"""
+    connection = self.connection()
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+      rows = connection.execute(
+        f'SELECT {", ".join(Submission.fields)} FROM submission WHERE status = ? ORDER BY id LIMIT ?',
+        ('queued', limit)).fetchall()
+      connection.executemany('UPDATE submission SET status = ? WHERE id = ?', [('applying', row[0]) for row in rows])
+      connection.execute('COMMIT')
+    except:
+      connection.execute('ROLLBACK')
+      raise
+    return [Submission(*row) for row in rows]
+
+  def record(self, results):
+    now = time.time()
+    self.connection().executemany(
+      'UPDATE submission SET status = ?, message = ?, record_id = ?, applied_at = ? WHERE id = ?',
+      [(status, message, record_id, now, id) for id, (status, message, record_id) in results.items()])
+
+  def requeue(self, submissions=None):
+    """Puts submissions, or all those left applying by a stopped worker, back in the queue"""
+    connection = self.connection()
+    if submissions is None:
+      connection.execute('UPDATE submission SET status = ? WHERE status = ?', ('queued', 'applying'))
+    else:
+      connection.executemany('UPDATE submission SET status = ? WHERE id = ?',
+                             [('queued', submission.id) for submission in submissions])
+
+  def prune(self, older_than):
+    """Deletes the submissions finished more than older_than seconds ago, returns how many"""
+    return self.connection().execute(
+      'DELETE FROM submission WHERE status NOT IN (?, ?) AND applied_at < ?',
+      ('queued', 'applying', time.time() - older_than)).rowcount
+
+  def work(self, batch_size):
+    """Applies one batch, returns how many submissions it held"""
+    submissions = self.claim(batch_size)
+    if not submissions:
+      return 0
+    try:
+      results = apply_batch(db.session, submissions)
+    except:
+      db.session.rollback()
+      self.requeue(submissions)
+      raise
+    finally:
+      db.session.close()
+    self.record(results)
+    self.app.extensions['page_cache'].invalidate(
+      *{namespace for submission in submissions for namespace in INVALIDATES[submission.entity]})
+    return len(submissions)
+
+  def drain(self, batch_size=None):
+    """Applies every queued submission in this process, returns how many"""
+    batch_size = batch_size or self.app.config['WRITE_QUEUE_BATCH']
+    total = 0
+    while True:
+      count = self.work(batch_size)
+      if not count:
+        return total
+      total += count
+
+  def pending(self):
+    (count,) = self.connection().execute(
+      'SELECT count(*) FROM submission WHERE status IN (?, ?)', ('queued', 'applying')).fetchone()
+    return count
+
+
+@app.cli.command('write-worker')
+@click.option('--batch-size', type=int, help='submissions per transaction, defaults to WRITE_QUEUE_BATCH')
+@click.option('--poll', default=0.5, show_default=True, help='seconds between looks at an empty queue')
+@click.option('--once', is_flag=True, help='apply the queued submissions and exit')
+def worker_command(batch_size, poll, once):
+  """Applies the queued create form submissions in batches."""
+  queue = app.extensions['write_queue']
+  batch_size = batch_size or app.config['WRITE_QUEUE_BATCH']
+  queue.requeue()
+  if once:
+    click.echo(f'{queue.drain(batch_size)} submissions applied')
+    return
+
+  click.echo(f'Applying {app.config["WRITE_QUEUE_PATH"]} in batches of {batch_size}')
+  last_prune = 0
+  while True:
+    try:
+      count = queue.work(batch_size)
+    except Exception:
+      app.logger.exception('Applying a batch of queued submissions failed')
+      count = 0
+    if count:
+      continue
+    if time.monotonic() - last_prune > 3600:
+      queue.prune(app.config['WRITE_QUEUE_KEEP'])
+      last_prune = time.monotonic()
+    time.sleep(poll)
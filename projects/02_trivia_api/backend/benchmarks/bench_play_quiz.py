@@ -0,0 +1,103 @@
+"""Latency of drawing the next quiz question as the question bank and the quiz grow.
+
+Seeds --questions questions (spread over the six categories) into a throwaway
+database, then draws questions for quizzes that already played 0, 10, 100 and
+1000 questions, two ways:
+
+  not in    loads every question whose id is NOT IN the played ones and picks
+            one with random.choice (how play_quiz was first written)
+  sampler   random_question() of flaskr: a random id of the in-memory id
+            array of the category, rejecting played ones, then one primary
+            key lookup
+
+and reports the median milliseconds per draw over --repeat draws, for every
+bank size of --questions. The first draw of the sampler loads the id array,
+it is reported on its own.
+
+  createdb trivia_bench
+  python benchmarks/bench_play_quiz.py --questions 1000 10000 100000
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flaskr import create_app, random_question, question_ids
+from models import setup_db, db, Question
+
+QUIZ_LENGTHS = [0, 10, 100, 1000]
+CATEGORIES = 6
+
+
+def not_in_question(category, previous_questions):
+  query = Question.query.filter(Question.id.notin_(previous_questions))
+  if category is not None:
+    query = query.filter_by(category=category)
+  questions = query.all()
+  return random.choice(questions) if questions else None
+
+
+def seed(count):
+  db.session.query(Question).delete()
+  db.session.execute(Question.__table__.insert(), [{
+    'question': f'Question {i}?',
+    'answer': f'Answer {i}',
+    'category': i % CATEGORIES + 1,
+    'difficulty': i % 5 + 1,
+  } for i in range(count)])
+  db.session.commit()
+  question_ids.clear()
+
+
+def median_ms(draw, category, previous_questions, repeat):
+  timings = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    question = draw(category, previous_questions)
+    timings.append(time.perf_counter() - start)
+    assert question is not None and question.id not in previous_questions
+    db.session.remove()
+  return statistics.median(timings) * 1000
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--database', default=os.environ.get('BENCH_DATABASE_URL', 'postgres://localhost:5432/trivia_bench'),
+                      help='database url to seed (its tables are dropped afterwards)')
+  parser.add_argument('--questions', type=int, nargs='+', default=[1000, 10000, 100000], help='question bank sizes')
+  parser.add_argument('--repeat', type=int, default=20, help='draws per measure')
+  args = parser.parse_args()
+
+  app = create_app()
+  setup_db(app, args.database)
+  with app.app_context():
+    db.create_all()
+    try:
+      print(f'{"questions":>10} {"played":>7} {"category":>9} {"not in ms":>10} {"sampler ms":>11}')
+      for count in args.questions:
+        seed(count)
+        for category in (None, 1):
+          query = db.session.query(Question.id)
+          # a quiz of a category played questions of that category
+          pool = [id for (id,) in (query if category is None else query.filter_by(category=category))]
+          start = time.perf_counter()
+          random_question(category, set())
+          print(f'{count:>10} {"":>7} {category or "all":>9} {"":>10} {(time.perf_counter() - start) * 1000:>11.2f}'
+                '  (first draw, loads the ids)')
+          for length in QUIZ_LENGTHS:
+            previous_questions = set(random.sample(pool, min(length, len(pool) - 1)))
+            not_in = median_ms(not_in_question, category, list(previous_questions), args.repeat)
+            sampler = median_ms(random_question, category, previous_questions, args.repeat)
+            print(f'{count:>10} {length:>7} {category or "all":>9} {not_in:>10.2f} {sampler:>11.2f}')
+    finally:
+      db.session.remove()
+      db.drop_all()
+
+
+if __name__ == '__main__':
+  main()
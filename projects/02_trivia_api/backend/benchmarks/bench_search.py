@@ -0,0 +1,164 @@
+"""Latency of searching the questions as the question bank grows.
+
+Seeds --questions synthetic questions (words drawn from a vocabulary with a
+few common words and many rare ones, spread over the six categories and five
+difficulties) into a throwaway Postgres database, builds the
+ix_questions_search index, then searches a common word, a rare word, two
+words, a prefix and a common word within one category, three ways:
+
+  ilike     COUNT and first page of the questions whose question ILIKE
+            '%term%', in id order (how search_questions was first written)
+  index     QuestionSearch of flaskr: the GIN index of the search_vector
+            column (the question and answer tsvector), ranked by ts_rank,
+            counted and paged in the database
+  memory    the in-memory QuestionIndex used without Postgres, built over the
+            first --python-questions questions only (it holds every word of
+            every question in Python dicts)
+
+and reports the median milliseconds per search over --repeat searches, with
+the number of questions matching.
+
+  createdb trivia_bench
+  python benchmarks/bench_search.py --questions 1000000
+"""
+
+import io
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flaskr import create_app, ENTRIES_PER_PAGE
+from flaskr.search import QuestionSearch, QuestionIndex, tokenize
+from models import setup_db, db, Question
+
+CATEGORIES = 6
+DIFFICULTIES = 5
+VOCABULARY = 50000
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'ze', 'pa', 'do', 'gu', 'be', 'fi', 'ho']
+QUESTION_WORDS = ['what', 'which', 'who', 'where', 'when']
+
+
+def vocabulary(rng):
+  words = set()
+  while len(words) < VOCABULARY:
+    words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+  # in order of frequency, word i drawn about 1/(i+1) of the times (Zipf)
+  words = sorted(words)
+  rng.shuffle(words)
+  return words
+
+
+def sentences(rng, words, count, length):
+  weights = [1 / (rank + 1) for rank in range(len(words))]
+  drawn = iter(rng.choices(words, weights, k=count * length))
+  for _ in range(count):
+    yield ' '.join(next(drawn) for _ in range(rng.randint(length // 2, length)))
+
+
+def seed(count, words):
+  """COPYs count questions in (Postgres generating their search_vector), returns the
+  seconds building ix_questions_search took"""
+  rng = random.Random(count)
+  db.session.execute('DROP INDEX IF EXISTS ix_questions_search')
+  db.session.execute('TRUNCATE questions RESTART IDENTITY')
+  db.session.commit()
+  connection = db.engine.raw_connection()
+  try:
+    cursor = connection.cursor()
+    chunk = 100000
+    for start in range(0, count, chunk):
+      size = min(chunk, count - start)
+      rows = io.StringIO()
+      for i, (question, answer) in enumerate(zip(sentences(rng, words, size, 12), sentences(rng, words, size, 3))):
+        rows.write(f'{rng.choice(QUESTION_WORDS)} {question}?\t{answer}\t{(start + i) % CATEGORIES + 1}\t'
+                   f'{(start + i) % DIFFICULTIES + 1}\n')
+      rows.seek(0)
+      cursor.copy_from(rows, 'questions', columns=('question', 'answer', 'category', 'difficulty'))
+    connection.commit()
+    start = time.perf_counter()
+    cursor.execute('CREATE INDEX ix_questions_search ON questions USING gin (search_vector)')
+    cursor.execute('ANALYZE questions')
+    connection.commit()
+    return time.perf_counter() - start
+  finally:
+    connection.close()
+
+
+def ilike_search(text, category=None):
+  query = Question.query.filter(Question.question.ilike(f'%{text}%'))
+  if category is not None:
+    query = query.filter(Question.category == category)
+  return query.order_by(Question.id).limit(ENTRIES_PER_PAGE).all(), query.count()
+
+
+def median_ms(search, repeat):
+  timings = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    questions, total = search()
+    timings.append(time.perf_counter() - start)
+    db.session.remove()
+  return statistics.median(timings) * 1000, total
+
+
+def searches(words):
+  """(label, search term, category) of each search"""
+  return [
+    ('common word', words[0], None),
+    ('rare word', words[VOCABULARY // 10], None),
+    ('two words', f'{words[5]} {words[50]}', None),
+    ('prefix', words[200][:4], None),
+    ('common, category', words[0], 1),
+  ]
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--database', default=os.environ.get('BENCH_DATABASE_URL', 'postgres://localhost:5432/trivia_bench'),
+                      help='Postgres database url to seed (its tables are dropped afterwards)')
+  parser.add_argument('--questions', type=int, nargs='+', default=[1000000], help='question bank sizes')
+  parser.add_argument('--python-questions', type=int, default=100000, help='questions of the in-memory index')
+  parser.add_argument('--repeat', type=int, default=5, help='searches per measure')
+  args = parser.parse_args()
+
+  app = create_app()
+  setup_db(app, args.database)
+  words = vocabulary(random.Random(0))
+  with app.app_context():
+    db.create_all()
+    try:
+      question_search = QuestionSearch()
+      print(f'{"questions":>10} {"search":<18} {"matches":>8} {"ilike ms":>9} {"index ms":>9}')
+      for count in args.questions:
+        seconds = seed(count, words)
+        print(f'{count:>10} {"":<18} {"":>8} {"":>9} {"":>9}  (index built in {seconds:.1f} s)')
+        for label, text, category in searches(words):
+          ilike, _ = median_ms(lambda: ilike_search(text, category), args.repeat)
+          indexed, total = median_ms(lambda: question_search.page(text, category, per_page=ENTRIES_PER_PAGE), args.repeat)
+          print(f'{count:>10} {label:<18} {total:>8} {ilike:>9.1f} {indexed:>9.1f}')
+
+      seed(args.python_questions, words)
+      index = QuestionIndex()
+      start = time.perf_counter()
+      index.build()
+      print(f'{args.python_questions:>10} {"":<18} {"":>8} {"":>9} {"memory ms":>9}'
+            f'  (built in {time.perf_counter() - start:.1f} s)')
+      for label, text, category in searches(words):
+        timings = []
+        for _ in range(args.repeat):
+          start = time.perf_counter()
+          ids = index.search(tokenize(text), category)
+          timings.append(time.perf_counter() - start)
+        print(f'{args.python_questions:>10} {label:<18} {len(ids):>8} {"":>9} {statistics.median(timings) * 1000:>9.1f}')
+    finally:
+      db.session.remove()
+      db.drop_all()
+
+
+if __name__ == '__main__':
+  main()
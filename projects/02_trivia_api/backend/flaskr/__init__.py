@@ -1,35 +1,174 @@
 import os
+import time
+from itertools import chain
 from flask import Flask, request, abort, jsonify
+from werkzeug.exceptions import HTTPException
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 import random
+import click
+from array import array
 
 
-from models import setup_db, Question, Category
+from models import setup_db, Question, Category, db
+from .quiz_sessions import QuizSessions
+from .category_cache import CategoryCache
+from .search import QuestionSearch
 
 ENTRIES_PER_PAGE=10
+# Seconds a cached question count is trusted, bounding how long a write by
+# another process goes unnoticed (writes by this one clear the cache)
+COUNT_TTL=60
+
+# COUNT(*) of the questions per category id (None for all of them): (count, time counted),
+# only of the categories that exist so requests for any id can't grow it
+question_counts = {}
+# ids of the questions per category id (None for all of them) the quiz draws from: (ids, time loaded),
+# only of the categories that exist too
+question_ids = {}
+# Random draws rejecting played questions before the quiz scans for the unplayed ones
+MAX_REJECTIONS=32
+# Most questions a quiz session plays
+MAX_QUIZ_QUESTIONS=1000
+# Seconds browsers and proxies may reuse /categories before revalidating its ETag
+CATEGORIES_MAX_AGE=60
+
+# categories of the payloads, reloaded when a commit writes categories or on invalidate()
+category_cache = CategoryCache()
+# full text search of the questions, its in-memory index rebuilt after a commit writes questions
+question_search = QuestionSearch()
 
 def format_entities(entities):
   """Formats categories correctly"""
   return [entity.format() for entity in entities]
 
-def paginate(entries,page,entries_per_page):
-  """Paginates all entries returning the right page for a certain entries per page """
-  start =  (page - 1) * entries_per_page
-  end = start + entries_per_page
-  return entries[start:end]
-
-def paginate_questions(request, selection):
-  """paginates a selecation for the right number of pages given by the get request argument """
+def paginate(query, order_column, page, entries_per_page, after=None):
+  """Returns the right page of a query for a certain entries per page, with LIMIT/OFFSET in the database.
+  With after, returns the entries following the one whose order_column is after instead (a keyset
+  cursor), which reads only the rows of the page however deep it is."""
+  if after is not None:
+    return query.filter(order_column > after).order_by(order_column).limit(entries_per_page).all()
+  if page < 1:
+    return []
+  return query.order_by(order_column).offset((page - 1) * entries_per_page).limit(entries_per_page).all()
+
+def paginate_questions(request, query):
+  """paginates a query of questions for the page given by the get request arguments,
+  ?page=<number> or ?after=<id of the last question of the previous page>"""
   page = request.args.get('page', 1, type=int)
-  entries = format_entities(selection)
-  return paginate(entries,page,ENTRIES_PER_PAGE)
+  after = request.args.get('after', None, type=int)
+  return format_entities(paginate(query, Question.id, page, ENTRIES_PER_PAGE, after))
+
+def known_category(category):
+  """Whether category is None (all of them) or the id of a category of the category cache"""
+  return category is None or any(entry['id'] == category for entry in category_cache.get().by_id)
+
+def count_questions(category=None):
+  """Number of questions, of a category id or all of them, counted once per COUNT_TTL"""
+  cached = question_counts.get(category)
+  if cached is None or time.monotonic() - cached[1] > COUNT_TTL:
+    query = Question.query
+    if category is not None:
+      query = query.filter(Question.category == category)
+    cached = (query.count(), time.monotonic())
+    if known_category(category):
+      question_counts[category] = cached
+  return cached[0]
+
+@event.listens_for(Session, 'after_flush')
+def note_question_writes(session, flush_context):
+  for entity in chain(session.new, session.dirty, session.deleted):
+    if isinstance(entity, Question):
+      session.info['questions_changed'] = True
+    elif isinstance(entity, Category):
+      session.info['categories_changed'] = True
+
+@event.listens_for(Session, 'after_commit')
+def clear_question_counts(session):
+  # cleared once committed, a count taken before would miss the write until COUNT_TTL
+  if session.info.pop('questions_changed', False):
+    question_counts.clear()
+    question_ids.clear()
+    question_search.invalidate()
+  if session.info.pop('categories_changed', False):
+    category_cache.invalidate()
+
+def category_question_ids(category=None):
+  """Array of the ids of the questions of a category id or all of them, loaded once per COUNT_TTL"""
+  cached = question_ids.get(category)
+  if cached is None or time.monotonic() - cached[1] > COUNT_TTL:
+    query = db.session.query(Question.id)
+    if category is not None:
+      query = query.filter(Question.category == category)
+    cached = (array('l', (id for (id,) in query)), time.monotonic())
+    if known_category(category):
+      question_ids[category] = cached
+  return cached[0]
+
+def draw_question_id(ids, previous_questions):
+  """Random id of ids not in the set previous_questions, None once all are played.
+  Draws ids at random until one is unplayed, which takes few draws while most are
+  unplayed whatever the number of questions, then scans for the unplayed ones."""
+  if not ids:
+    return None
+  for _ in range(MAX_REJECTIONS):
+    question_id = ids[random.randrange(len(ids))]
+    if question_id not in previous_questions:
+      return question_id
+  unplayed = [question_id for question_id in ids if question_id not in previous_questions]
+  return random.choice(unplayed) if unplayed else None
+
+def quiz_category_id(category):
+  """Category id a quiz plays, None for all categories (id 0)"""
+  if str(category['id']).isnumeric() and str(category['id'])!='0':
+    return int(category['id'])
+  return None
+
+def quiz_length(questions):
+  """Questions a quiz session plays, clamped to 1..MAX_QUIZ_QUESTIONS, None when not a whole number"""
+  if isinstance(questions, bool) or not isinstance(questions, (int, str)):
+    return None
+  try:
+    questions = int(questions)
+  except ValueError:
+    return None
+  return max(1, min(questions, MAX_QUIZ_QUESTIONS))
+
+def random_question(category, previous_questions):
+  """Random question of a category id (None for any) whose id is not in previous_questions"""
+  for _ in range(2):
+    question_id = draw_question_id(category_question_ids(category), previous_questions)
+    if question_id is None:
+      return None
+    question = Question.query.get(question_id)
+    if question is not None:
+      return question
+    # deleted by another process, draw again from fresh ids
+    question_ids.pop(category, None)
+  return None
+
+@event.listens_for(Session, 'after_rollback')
+def forget_question_writes(session):
+  session.info.pop('questions_changed', None)
+  session.info.pop('categories_changed', None)
 
 
 def create_app(test_config=None):
   """ Create and configure the app """
   app = Flask(__name__)
+  # SQLite file sharing the quiz sessions between processes, None keeps them in each process
+  app.config['QUIZ_STORE_PATH'] = os.environ.get('QUIZ_STORE_PATH')
+  # File mapped into memory by every worker to share the version of the categories,
+  # e.g. /dev/shm/trivia-categories, None checks the version of each process only
+  app.config['CATEGORY_VERSION_PATH'] = os.environ.get('CATEGORY_VERSION_PATH')
+  if test_config:
+    app.config.update(test_config)
   setup_db(app)
+  quiz_sessions = QuizSessions(app.config['QUIZ_STORE_PATH'])
+  if app.config['CATEGORY_VERSION_PATH']:
+    category_cache.share(app.config['CATEGORY_VERSION_PATH'])
   
   CORS(app, resources={r"/*": {"origins": "*"}})
 
@@ -40,44 +179,55 @@ def create_app(test_config=None):
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     return response
 
+  @app.cli.command('invalidate-categories')
+  def invalidate_categories():
+    """Makes every process reload the categories, after changing them outside the app."""
+    category_cache.invalidate()
+    click.echo('categories invalidated' + ('' if app.config['CATEGORY_VERSION_PATH'] else
+                                          ', set CATEGORY_VERSION_PATH to reach the server processes'))
+
   @app.route('/categories')
   def retrieve_categories():
     """Endpoint to handle GET requests for all available categories"""
     try:
-      categories = Category.query.order_by(Category.id).all()
+      categories = category_cache.get()
     except:
       abort(422)
     
     #Make sure we got some categories
-    if not categories:
+    if not categories.by_id:
       abort(404)
 
-    #Return the categories
-    return jsonify({
+    #Return the categories, or 304 Not Modified to a client sending their ETag
+    response = jsonify({
       'success': True,
-      'categories': format_entities(categories),
+      'categories': categories.by_id,
     })
+    response.set_etag(categories.etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = CATEGORIES_MAX_AGE
+    return response.make_conditional(request)
 
 
   @app.route('/questions')
   def retrieve_questions():
     """ Endpoint to handle GET requests for all questions paginated (10 questions) """
     try:
-      questions = Question.query.order_by(Question.id).all()
-      categories = Category.query.order_by(Category.id).all()
+      # Paginate list of questions and make sure it is a valid page
+      questions_paginated = paginate_questions(request, Question.query)
+      categories = category_cache.get().by_id
+      total_questions = count_questions()
     except:
       abort(422)
     
-    # Paginate list of questions and make sure it is a valid page
-    questions_paginated = paginate_questions(request, questions)
     if not questions_paginated:
       abort(404)
 
     return jsonify({
       'success': True,
       'questions': questions_paginated,
-      'categories': format_entities(categories),
-      'total_questions': len(questions),
+      'categories': categories,
+      'total_questions': total_questions,
       'current_category': None
     })
 
@@ -130,7 +280,8 @@ def create_app(test_config=None):
 
   @app.route('/questions/search', methods=['POST'])
   def search_questions():
-    """ Endpoint to get questions based on a search term. """
+    """ Endpoint to get questions based on a search term, best matches first,
+    optionally of a category and a difficulty. """
     try:
       body = request.get_json()
       search_term = body.get('searchTerm', None)
@@ -138,15 +289,18 @@ def create_app(test_config=None):
       if not search_term:
         abort(404)
 
-      search_result = Question.query.filter(
-        Question.question.ilike(f'%{search_term}%')
-      ).all()
+      category = body.get('category', None)
+      category = int(category) if category is not None else None
+      difficulty = body.get('difficulty', None)
+      difficulty = int(difficulty) if difficulty is not None else None
+      questions, total_questions = question_search.page(
+        search_term, category, difficulty, request.args.get('page', 1, type=int), ENTRIES_PER_PAGE)
 
       return jsonify({
         'success': True,
-        'questions': paginate_questions(request, search_result),
-        'total_questions': len(search_result),
-        'current_category': None
+        'questions': format_entities(questions),
+        'total_questions': total_questions,
+        'current_category': category
       })
     except:
       abort(404)
@@ -154,43 +308,68 @@ def create_app(test_config=None):
   @app.route('/categories/<int:category_id>/questions')
   def retrieve_questions_by_category(category_id):
     """ Endpoint to handle GET requests for questions in a certain category """
-    questions = Question.query.filter_by(category=str(category_id)).order_by(Question.id).all()
-    categories = Category.query.order_by(Category.type).all()
-
-    if not questions:
+    total_questions = count_questions(category_id)
+    if not total_questions:
       abort(404)
 
+    questions = Question.query.filter_by(category=category_id)
+
     return jsonify({
       'success': True,
       'questions': paginate_questions(request, questions),
-      'categories': format_entities(categories),
-      'total_questions': len(questions),
+      'categories': category_cache.get().by_type,
+      'total_questions': total_questions,
       'current_category': category_id
     })
 
   @app.route('/quizzes', methods=['POST'])
   def play_quiz():
-    """ Endpoint to get questions to play the quiz """
+    """ Endpoint to get questions to play the quiz, or to start a quiz session without previous_questions """
     try:
       body = request.get_json()
-      if not ('quiz_category' in body and 'previous_questions' in body):
+      if not 'quiz_category' in body:
         abort(422)
-      category = body.get('quiz_category')
-      previous_questions = body.get('previous_questions')
-      if str(category['id']).isnumeric() and str(category['id'])!='0':
-        new_question = Question.query.filter_by(
-          category=(int(category['id']))
-        ).filter(Question.id.notin_((previous_questions))).all()
-      else:
-        new_question = Question.query.filter(
-          Question.id.notin_((previous_questions))
-        ).all()
+      category = quiz_category_id(body.get('quiz_category'))
+      if not 'previous_questions' in body:
+        # a session shuffles the questions once, then serves them with GET /quizzes/<quiz_id>/next
+        questions = quiz_length(body.get('questions', MAX_QUIZ_QUESTIONS))
+        if questions is None:
+          abort(400)
+        category_ids = category_question_ids(category)
+        total_questions = min(len(category_ids), questions)
+        return jsonify({
+          'success': True,
+          'quiz_id': quiz_sessions.create(random.sample(category_ids, total_questions)),
+          'total_questions': total_questions
+        })
+      previous_questions = {int(question_id) for question_id in body.get('previous_questions')}
+      new_question = random_question(category, previous_questions)
+    except HTTPException:
+      raise
+    except:
+      abort(422)
+
+    return jsonify({
+      'success': True,
+      'question': new_question.format() if new_question else None,
+    })
+
+  @app.route('/quizzes/<quiz_id>/next')
+  def next_quiz_question(quiz_id):
+    """ Endpoint to get the next question of a quiz session, null once all were played """
+    try:
+      question_id = quiz_sessions.next_id(quiz_id)
+      # skips the questions deleted since the quiz started
+      while question_id is not None and Question.query.get(question_id) is None:
+        question_id = quiz_sessions.next_id(quiz_id)
+    except KeyError:
+      abort(404)
     except:
       abort(422)
 
     return jsonify({
       'success': True,
-      'question': random.choice(new_question).format() if new_question else None,
+      'question': Question.query.get(question_id).format() if question_id is not None else None,
     })
   
   #Error handlers for all expected errors 
@@ -0,0 +1,83 @@
+import os
+import json
+import mmap
+import time
+import random
+import struct
+import hashlib
+from collections import namedtuple
+
+from models import Category
+
+# Seconds loaded categories are trusted without a version change, bounding
+# how long a write made outside the app (psql) goes unnoticed
+CATEGORY_TTL=300
+
+# The categories as of a version: formatted in id order and in type order, and the ETag of their content
+Categories = namedtuple('Categories', ['version', 'loaded_at', 'by_id', 'by_type', 'etag'])
+
+
+class LocalVersion(object):
+  """Version of the categories of this process"""
+
+  def __init__(self):
+    self.value = 0
+
+  def get(self):
+    return self.value
+
+  def set(self, value):
+    self.value = value
+
+
+class SharedVersion(object):
+  """Version of the categories in a file mapped into the memory of every process
+  using it (put it on a tmpfs such as /dev/shm), so an invalidation by one
+  worker makes every worker reload"""
+
+  def __init__(self, path):
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+      if os.fstat(fd).st_size < 8:
+        os.ftruncate(fd, 8)
+      self.map = mmap.mmap(fd, 8)
+    finally:
+      os.close(fd)
+
+  def get(self):
+    return struct.unpack('Q', self.map[:8])[0]
+
+  def set(self, value):
+    self.map[:8] = struct.pack('Q', value)
+
+
+class CategoryCache(object):
+  """Categories returned with the question payloads, queried once per version.
+
+  invalidate() moves the version on, the next get() of every process sharing
+  the version reloads them. Versions are random so that two invalidations
+  racing on the shared version still leave one no process has loaded."""
+
+  def __init__(self):
+    self.version = LocalVersion()
+    self.loaded = None
+
+  def share(self, path):
+    """Keeps the version in the file at path, shared with the other processes using it"""
+    self.version = SharedVersion(path)
+    self.loaded = None
+
+  def invalidate(self):
+    self.version.set(random.getrandbits(64))
+
+  def get(self):
+    # read before querying, a write committed meanwhile leaves a newer version
+    version = self.version.get()
+    loaded = self.loaded
+    if loaded is None or loaded.version != version or time.monotonic() - loaded.loaded_at > CATEGORY_TTL:
+      by_id = [category.format() for category in Category.query.order_by(Category.id)]
+      # in the database collation
+      by_type = [category.format() for category in Category.query.order_by(Category.type)]
+      etag = hashlib.sha1(json.dumps(by_id, sort_keys=True).encode()).hexdigest()
+      loaded = self.loaded = Categories(version, time.monotonic(), by_id, by_type, etag)
+    return loaded
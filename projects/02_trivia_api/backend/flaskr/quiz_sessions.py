@@ -0,0 +1,104 @@
+import time
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from uuid import uuid4
+
+# Quiz sessions kept in memory by a process, the least recently played are dropped first
+MAX_SESSIONS=10000
+# Seconds a stored quiz session is kept
+SESSION_TTL=24 * 60 * 60
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS quiz_session (
+  id TEXT PRIMARY KEY,
+  question_ids BLOB NOT NULL,
+  position INTEGER NOT NULL DEFAULT 0,
+  created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_quiz_session_created_at ON quiz_session (created_at);
+'''
+
+
+class QuizSessions(object):
+  """Pre-shuffled question orders of the quizzes being played and how far each got.
+
+  Orders are kept in an in-process LRU. With a path the sessions are also
+  stored in that SQLite file, which then holds the positions: every process
+  of the app plays the same sessions, and a session dropped from the LRU is
+  read back from the file."""
+
+  def __init__(self, path=None, maxsize=MAX_SESSIONS):
+    self.path = path
+    self.maxsize = maxsize
+    # quiz id -> [order, position], the position only used without a file
+    self.sessions = OrderedDict()
+    self.lock = threading.Lock()
+    self.local = threading.local()
+
+  def connection(self):
+    connection = getattr(self.local, 'connection', None)
+    if connection is None:
+      connection = self.local.connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+      connection.execute('PRAGMA journal_mode=WAL')
+      connection.executescript(SCHEMA)
+    return connection
+
+  def _remember(self, quiz_id, order, position=0):
+    with self.lock:
+      self.sessions[quiz_id] = [order, position]
+      self.sessions.move_to_end(quiz_id)
+      while len(self.sessions) > self.maxsize:
+        self.sessions.popitem(last=False)
+
+  def create(self, question_ids):
+    """Stores a session playing question_ids in that order, returns its id"""
+    quiz_id = uuid4().hex
+    order = array('l', question_ids)
+    if self.path:
+      connection = self.connection()
+      now = time.time()
+      connection.execute('DELETE FROM quiz_session WHERE created_at < ?', (now - SESSION_TTL,))
+      connection.execute('INSERT INTO quiz_session (id, question_ids, created_at) VALUES (?, ?, ?)',
+                         (quiz_id, order.tobytes(), now))
+    self._remember(quiz_id, order)
+    return quiz_id
+
+  def next_id(self, quiz_id):
+    """Id of the next question of a session, None once all were played; KeyError for an unknown session"""
+    if self.path:
+      return self._next_stored_id(quiz_id)
+    with self.lock:
+      session = self.sessions[quiz_id]
+      self.sessions.move_to_end(quiz_id)
+      order, position = session
+      if position >= len(order):
+        return None
+      session[1] = position + 1
+      return order[position]
+
+  def _next_stored_id(self, quiz_id):
+    connection = self.connection()
+    with self.lock:
+      session = self.sessions.get(quiz_id)
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+      # the order is only read when this process does not have it
+      row = connection.execute(
+        f'SELECT position{"" if session else ", question_ids"} FROM quiz_session WHERE id = ?', (quiz_id,)).fetchone()
+      if row is None:
+        raise KeyError(quiz_id)
+      connection.execute('UPDATE quiz_session SET position = position + 1 WHERE id = ?', (quiz_id,))
+      connection.execute('COMMIT')
+    except:
+      connection.execute('ROLLBACK')
+      raise
+    position = row[0]
+    if session:
+      order = session[0]
+    else:
+      order = array('l')
+      order.frombytes(row[1])
+    self._remember(quiz_id, order)
+    return order[position] if position < len(order) else None
@@ -0,0 +1,120 @@
+import re
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from sqlalchemy import func, literal_column
+
+from models import Question, db
+
+# Seconds the in-memory index is trusted, bounding how long a write by another
+# process goes unnoticed (commits of this one rebuild it)
+INDEX_TTL=60
+# Weight of a word of the question and of the answer, those ts_rank gives A and B
+QUESTION_WEIGHT=1.0
+ANSWER_WEIGHT=0.4
+
+# tsvector of the question and the answer on Postgres, see models.SEARCH_VECTOR_SQL
+search_vector = literal_column('questions.search_vector')
+
+
+def tokenize(text):
+  """Lowercased words of text, split as the 'simple' text search configuration does"""
+  return re.findall(r'\w+', (text or '').lower())
+
+
+class QuestionIndex(object):
+  """Inverted index of the words of the questions and their answers, searched
+  in Python where the database has no full text search (SQLite, tests)"""
+
+  def __init__(self):
+    # word -> {question id: weight}
+    self.postings = {}
+    # words in order, to find those starting with a term
+    self.words = []
+    # question id -> (category, difficulty)
+    self.filters = {}
+    self.built_at = None
+
+  def clear(self):
+    self.built_at = None
+
+  def build(self):
+    postings = defaultdict(dict)
+    filters = {}
+    rows = db.session.query(Question.id, Question.question, Question.answer, Question.category, Question.difficulty)
+    for id, question, answer, category, difficulty in rows:
+      filters[id] = (category, difficulty)
+      for text, weight in ((question, QUESTION_WEIGHT), (answer, ANSWER_WEIGHT)):
+        for word in tokenize(text):
+          postings[word][id] = postings[word].get(id, 0) + weight
+    self.postings, self.words, self.filters = dict(postings), sorted(postings), filters
+    self.built_at = time.monotonic()
+
+  def matches(self, term):
+    """{question id: weight} of the questions with a word starting with term"""
+    scores = {}
+    position = bisect_left(self.words, term)
+    while position < len(self.words) and self.words[position].startswith(term):
+      for id, weight in self.postings[self.words[position]].items():
+        scores[id] = scores.get(id, 0) + weight
+      position += 1
+    return scores
+
+  def search(self, terms, category=None, difficulty=None):
+    """Ids of the questions matching every term, best ranked first"""
+    if self.built_at is None or time.monotonic() - self.built_at > INDEX_TTL:
+      self.build()
+    scores = None
+    # rarest term first, the others only look up its matches
+    for matches in sorted((self.matches(term) for term in terms), key=len):
+      if scores is None:
+        scores = matches
+      else:
+        scores = {id: score + matches[id] for id, score in scores.items() if id in matches}
+      if not scores:
+        return []
+    ids = [id for id in scores
+           if (category is None or self.filters[id][0] == category)
+           and (difficulty is None or self.filters[id][1] == difficulty)]
+    return sorted(ids, key=lambda id: (-scores[id], id))
+
+
+class QuestionSearch(object):
+  """Questions whose question or answer has a word starting with each word searched.
+
+  On Postgres the GIN index ix_questions_search of the search_vector column
+  finds them and ts_rank ranks them, filtered and paged in the database.
+  Elsewhere a QuestionIndex loaded once per INDEX_TTL does, ranking by the
+  summed weights of the words matched as ts_rank about does."""
+
+  def __init__(self):
+    self.index = QuestionIndex()
+
+  def invalidate(self):
+    self.index.clear()
+
+  def page(self, text, category=None, difficulty=None, page=1, per_page=10):
+    """(questions of the page, number of questions matching)"""
+    terms = tokenize(text)
+    if not terms:
+      return [], 0
+    # no page before the first, as paginate()
+    offset, limit = ((page - 1) * per_page, per_page) if page >= 1 else (0, 0)
+    if db.session.get_bind().dialect.name == 'postgresql':
+      return self._database_page(terms, category, difficulty, offset, limit)
+    ids = self.index.search(terms, category, difficulty)
+    page_ids = ids[offset:offset + limit]
+    # deleted since the index was built when missing
+    questions = {question.id: question for question in Question.query.filter(Question.id.in_(page_ids))}
+    return [questions[id] for id in page_ids if id in questions], len(ids)
+
+  def _database_page(self, terms, category, difficulty, offset, limit):
+    query = func.to_tsquery('simple', ' & '.join(term + ':*' for term in terms))
+    questions = Question.query.filter(search_vector.op('@@')(query))
+    if category is not None:
+      questions = questions.filter(Question.category == category)
+    if difficulty is not None:
+      questions = questions.filter(Question.difficulty == difficulty)
+    ranked = questions.order_by(func.ts_rank(search_vector, query).desc(), Question.id)
+    return ranked.offset(offset).limit(limit).all(), questions.count()
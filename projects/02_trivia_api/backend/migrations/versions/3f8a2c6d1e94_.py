@@ -0,0 +1,24 @@
+"""index of the questions of a category in id order
+
+Revision ID: 3f8a2c6d1e94
+Revises: 74e2fe184bca
+Create Date: 2026-10-18 18:47:12.306151
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f8a2c6d1e94'
+down_revision = '74e2fe184bca'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_questions_category_id', 'questions', ['category', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_questions_category_id', table_name='questions')
@@ -0,0 +1,31 @@
+"""full text search column and index over the questions and their answers
+
+Revision ID: 8b1d5e7f2a63
+Revises: 3f8a2c6d1e94
+Create Date: 2026-10-18 21:12:40.518307
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b1d5e7f2a63'
+down_revision = '3f8a2c6d1e94'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # models.SEARCH_VECTOR_SQL, which flaskr/search.py queries
+    op.execute(
+        "ALTER TABLE questions ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('simple', coalesce(question, '')), 'A') || "
+        "setweight(to_tsvector('simple', coalesce(answer, '')), 'B')) STORED"
+    )
+    op.execute('CREATE INDEX ix_questions_search ON questions USING gin (search_vector)')
+
+
+def downgrade():
+    op.drop_index('ix_questions_search', table_name='questions')
+    op.drop_column('questions', 'search_vector')
@@ -1,5 +1,5 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+from sqlalchemy import Column, String, Integer, create_engine, DDL, event
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 import json
@@ -26,6 +26,10 @@ Question
 '''
 class Question(db.Model):  
   __tablename__ = 'questions'
+  __table_args__ = (
+    # pages of a category in id order
+    db.Index('ix_questions_category_id', 'category', 'id'),
+  )
 
   id = Column(Integer, primary_key=True)
   question = Column(String)
@@ -59,6 +63,17 @@ class Question(db.Model):
       'difficulty': self.difficulty
     }
 
+# Words of a question (weight A) and its answer (weight B), searched by flaskr/search.py.
+# Postgres only, stored in the search_vector column so that ranking reads them rather
+# than parsing the text of every question matching; the column is left out of the model.
+SEARCH_VECTOR_SQL = "setweight(to_tsvector('simple', coalesce(question, '')), 'A') || " \
+                    "setweight(to_tsvector('simple', coalesce(answer, '')), 'B')"
+
+event.listen(Question.__table__, 'after_create', DDL(
+  f'ALTER TABLE questions ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ({SEARCH_VECTOR_SQL}) STORED; '
+  'CREATE INDEX ix_questions_search ON questions USING gin (search_vector)'
+).execute_if(dialect='postgresql'))
+
 '''
 Category
 
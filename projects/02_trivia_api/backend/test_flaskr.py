@@ -1,10 +1,14 @@
 import os
+import shutil
 import unittest
+import tempfile
 import json
 from flask_sqlalchemy import SQLAlchemy
 
+import flaskr
 from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr.category_cache import CategoryCache
+from models import setup_db, Question, Category, db
 
 #def is_success_response(res,data):
 
@@ -58,6 +62,50 @@ class TriviaTestCase(unittest.TestCase):
         # Check data
         self.assertTrue(len(data['categories']))
 
+    def test_get_categories_not_modified(self):
+        """Test that sending back the ETag of the categories gets a 304 without them"""
+
+        res = self.client().get('/categories')
+        self.assertTrue(res.headers['ETag'])
+        self.assertIn('max-age', res.headers['Cache-Control'])
+
+        res = self.client().get('/categories', headers={'If-None-Match': res.headers['ETag']})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
+    def test_categories_follow_writes(self):
+        """Test that committing a category reloads the cached categories"""
+
+        etag = self.client().get('/categories').headers['ETag']
+        category = Category('Music')
+        db.session.add(category)
+        db.session.commit()
+        try:
+            res = self.client().get('/categories')
+            self.assertIn('Music', [category['type'] for category in json.loads(res.data)['categories']])
+            self.assertNotEqual(res.headers['ETag'], etag)
+        finally:
+            db.session.delete(category)
+            db.session.commit()
+        self.assertEqual(self.client().get('/categories').headers['ETag'], etag)
+
+    def test_shared_category_version(self):
+        """Test that invalidating the categories in one process reloads them in another"""
+
+        folder = tempfile.mkdtemp()
+        try:
+            caches = [CategoryCache(), CategoryCache()]
+            for cache in caches:
+                cache.share(os.path.join(folder, 'categories'))
+            loaded = caches[1].get()
+            self.assertIs(caches[1].get(), loaded)
+
+            caches[0].invalidate()
+            self.assertIsNot(caches[1].get(), loaded)
+            self.assertEqual(caches[1].get().by_id, loaded.by_id)
+        finally:
+            shutil.rmtree(folder)
+
     def test_get_questions_success(self):
         """Test that we get a response when trying to get a page of questions """
 
@@ -134,6 +182,31 @@ class TriviaTestCase(unittest.TestCase):
         question = Question.query.filter(Question.id == 1).one_or_none()
         self.assertEqual(question, None)
 
+    def test_get_questions_after_cursor(self):
+        """ Test that the page after the last id of page 1 is page 2 """
+
+        first_page = json.loads(self.client().get('/questions?page=1').data)['questions']
+        second_page = json.loads(self.client().get('/questions?page=2').data)['questions']
+        res = self.client().get('/questions?after=' + str(first_page[-1]['id']))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['questions'], second_page)
+
+    def test_total_questions_follows_writes(self):
+        """ Test that the cached question counts change as questions are created and deleted """
+
+        total = json.loads(self.client().get('/questions').data)['total_questions']
+        in_category = json.loads(self.client().get('/categories/3/questions').data)['total_questions']
+
+        question_id = json.loads(self.client().post('/questions', json=self.example_question).data)['created']
+        self.assertEqual(json.loads(self.client().get('/questions').data)['total_questions'], total + 1)
+        self.assertEqual(json.loads(self.client().get('/categories/3/questions').data)['total_questions'],
+                         in_category + 1)
+
+        self.client().delete('/questions/' + str(question_id))
+        self.assertEqual(json.loads(self.client().get('/questions').data)['total_questions'], total)
+
     def test_create_question_fields_missing(self):
         res = self.client().post('/questions', json="")
         data = json.loads(res.data)
@@ -158,7 +231,52 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(len(data['questions'])<=10)
         self.assertTrue(len(data['questions'])<=data['total_questions'])
         self.assertTrue(len(data['questions']))
-    
+
+    def test_search_ranks_question_before_answer(self):
+        """Test that a search matches words of the answer too, ranked after those of the question"""
+
+        res = self.client().post('/questions/search', json={'searchTerm': 'tom'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        # 'Tom Hanks' in question 2, 'Tom Cruise' the answer of question 4
+        self.assertEqual([question['id'] for question in data['questions']], [2, 4])
+        self.assertEqual(data['total_questions'], 2)
+
+    def test_search_filters(self):
+        """Test that a search only returns the questions of the category and difficulty asked"""
+
+        res = self.client().post('/questions/search', json={'searchTerm': 'what', 'category': 5, 'difficulty': 4})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['current_category'], 5)
+        self.assertTrue(data['total_questions'])
+        for question in data['questions']:
+            self.assertEqual((question['category'], question['difficulty']), (5, 4))
+            self.assertIn('what', question['question'].lower())
+
+        # every word must match, no question has both
+        res = self.client().post('/questions/search', json={'searchTerm': 'Hanks Lestat'})
+        data = json.loads(res.data)
+        self.assertEqual(data['total_questions'], 0)
+        self.assertEqual(data['questions'], [])
+
+    def test_search_index_matches_database(self):
+        """Test that the in-memory index finds the questions the full text index does"""
+        from flaskr.search import QuestionIndex, tokenize
+
+        with self.app.app_context():
+            index = QuestionIndex()
+            for term in ('tom', 'what the', 'wor', 'Apollo 13', 'boxer'):
+                res = self.client().post('/questions/search', json={'searchTerm': term})
+                data = json.loads(res.data)
+                ids = index.search(tokenize(term))
+                # ranked alike only for the question and answer weights, compare the questions found
+                self.assertEqual(len(ids), data['total_questions'], term)
+                if len(ids) <= 10:
+                    self.assertEqual(set(ids), {question['id'] for question in data['questions']}, term)
+
 
     def test_search_missing(self):
         """ Test what happens if no search term is provided """
@@ -198,6 +316,17 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'Resource Not Found')
 
+    def test_unknown_categories_are_not_cached(self):
+        """ Test that counts and quiz ids are only cached for categories that exist """
+
+        flaskr.question_counts.clear()
+        flaskr.question_ids.clear()
+        for category_id in (9999, 10000, 1):
+            self.client().get('/categories/' + str(category_id) + '/questions')
+            self.client().post('/quizzes', json={'quiz_category': {'type': 'Art', 'id': category_id}})
+        self.assertEqual(set(flaskr.question_counts), {1})
+        self.assertEqual(set(flaskr.question_ids), {1})
+
     def test_play_all_success(self):
         """ Test playing game for any question in any category """
 
@@ -226,6 +355,99 @@ class TriviaTestCase(unittest.TestCase):
         # Check data
         self.assertTrue(len(data['question']))
 
+    def test_play_whole_category(self):
+        """ Test that a quiz draws every question of a category once, including one created meanwhile """
+
+        quiz_category = {'type': 'Geography', 'id': 3}
+        self.client().post('/quizzes', json={'previous_questions': [], 'quiz_category': quiz_category})
+        question_id = json.loads(self.client().post('/questions', json=self.example_question).data)['created']
+
+        previous_questions = []
+        while True:
+            res = self.client().post('/quizzes', json={'previous_questions': previous_questions,
+                                                       'quiz_category': quiz_category})
+            question = json.loads(res.data)['question']
+            if question is None:
+                break
+            self.assertEqual(question['category'], 3)
+            self.assertNotIn(question['id'], previous_questions)
+            previous_questions.append(question['id'])
+        self.client().delete('/questions/' + str(question_id))
+
+        self.assertIn(question_id, previous_questions)
+        self.assertEqual(len(previous_questions), Question.query.filter_by(category=3).count() + 1)
+
+    def play_session(self, client, quiz_id):
+        """ Plays a quiz session to its end, returns the ids of its questions """
+        played = []
+        while True:
+            res = client.get('/quizzes/' + quiz_id + '/next')
+            self.assertEqual(res.status_code, 200)
+            question = json.loads(res.data)['question']
+            if question is None:
+                return played
+            played.append(question['id'])
+
+    def test_quiz_session(self):
+        """ Test that a quiz session plays every question of its category once """
+
+        res = self.client().post('/quizzes', json={'quiz_category': {'type': 'Art', 'id': 2}})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_questions'], Question.query.filter_by(category=2).count())
+
+        played = self.play_session(self.client(), data['quiz_id'])
+        self.assertEqual(len(set(played)), data['total_questions'])
+        self.assertEqual({question.category for question in Question.query.filter(Question.id.in_(played))}, {2})
+
+        res = self.client().get('/quizzes/unknown/next')
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(json.loads(res.data)['message'], 'Resource Not Found')
+
+    def test_quiz_session_length_is_capped(self):
+        """ Test that a quiz session plays at most MAX_QUIZ_QUESTIONS and at least one question """
+
+        category = {'type': 'All', 'id': 0}
+        flaskr.MAX_QUIZ_QUESTIONS = 3
+        try:
+            for questions, total in ((1000000, 3), ('2', 2), (0, 1), (-5, 1)):
+                res = self.client().post('/quizzes', json={'quiz_category': category, 'questions': questions})
+                self.assertEqual(res.status_code, 200)
+                self.assertEqual(json.loads(res.data)['total_questions'], total)
+            res = self.client().post('/quizzes', json={'quiz_category': category})
+            self.assertEqual(json.loads(res.data)['total_questions'], 3)
+        finally:
+            flaskr.MAX_QUIZ_QUESTIONS = 1000
+
+    def test_quiz_session_bad_length(self):
+        """ Test that a quiz session length that is not a whole number is a bad request """
+
+        for questions in ('many', '2.5', None, [3], True):
+            res = self.client().post('/quizzes', json={'quiz_category': {'type': 'All', 'id': 0},
+                                                       'questions': questions})
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(json.loads(res.data)['message'], 'Bad Request')
+
+    def test_quiz_session_stored(self):
+        """ Test that a quiz session stored in SQLite is played on by another process """
+
+        folder = tempfile.mkdtemp()
+        try:
+            config = {'QUIZ_STORE_PATH': os.path.join(folder, 'quizzes.sqlite3')}
+            apps = [create_app(config), create_app(config)]
+            for app in apps:
+                setup_db(app, self.database_path)
+            res = apps[0].test_client().post('/quizzes', json={'quiz_category': {'type': 'All', 'id': 0},
+                                                               'questions': 4})
+            quiz_id = json.loads(res.data)['quiz_id']
+
+            first = json.loads(apps[0].test_client().get('/quizzes/' + quiz_id + '/next').data)['question']
+            rest = self.play_session(apps[1].test_client(), quiz_id)
+            self.assertEqual(len(rest), 3)
+            self.assertNotIn(first['id'], rest)
+        finally:
+            shutil.rmtree(folder)
+
     def test_play_fail(self):
         """ Test playing when no parameters are provided """
 